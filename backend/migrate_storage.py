@@ -0,0 +1,73 @@
+"""
+Move stored files from the old flat layout into their shards.
+
+Uploads (`UPLOAD_DIR/<file_type>/`), upload records (`UPLOAD_DIR/meta/`)
+and outputs (`CONVERTED_DIR`) written before the sharded layout sit
+directly in their directory. This moves each one to `<aa>/<bb>/` with a
+rename, so it is safe to run while the API is serving: files are found in
+either place, and a moved file is picked up again at its next lookup.
+
+    python migrate_storage.py [--dry-run]
+"""
+import argparse
+import logging
+import os
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+from services.file_handler import VALID_EXTENSIONS
+from services.sharding import iter_flat, sharded_path
+
+# Read the directories the way server.py does, without starting its clients and pools
+ROOT_DIR = Path(__file__).parent
+load_dotenv(ROOT_DIR / '.env')
+UPLOAD_DIR = os.environ.get('UPLOAD_DIR', str(ROOT_DIR / 'uploads'))
+CONVERTED_DIR = os.environ.get('CONVERTED_DIR', str(ROOT_DIR / 'converted'))
+
+logger = logging.getLogger(__name__)
+
+# Report progress every this many files
+PROGRESS_EVERY = 10000
+
+def migrate_directory(root: Path, dry_run: bool = False) -> int:
+    """Move the flat files of one directory into its shards; returns the count"""
+    if not root.exists():
+        return 0
+    moved = 0
+    for entry in iter_flat(root):
+        if not dry_run:
+            target = sharded_path(root, entry.name, create=True)
+            try:
+                os.rename(entry.path, target)
+            except FileNotFoundError:
+                # Deleted while we were migrating
+                continue
+            # A linked output's creation time is kept in a marker beside it (see ConversionService.link_output)
+            marker = f".{entry.name}.created"
+            try:
+                os.rename(root / marker, target.with_name(marker))
+            except FileNotFoundError:
+                pass
+        moved += 1
+        if moved % PROGRESS_EVERY == 0:
+            logger.info(f"{root}: {moved} files moved")
+    return moved
+
+def main():
+    parser = argparse.ArgumentParser(description="Move stored files into the sharded layout")
+    parser.add_argument("--dry-run", action="store_true", help="count the files to move without moving them")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    roots = [Path(UPLOAD_DIR) / file_type for file_type in VALID_EXTENSIONS]
+    roots += [Path(UPLOAD_DIR) / 'meta', Path(CONVERTED_DIR)]
+    total = 0
+    for root in roots:
+        moved = migrate_directory(root, args.dry_run)
+        logger.info(f"{root}: {moved} files {'to move' if args.dry_run else 'moved'}")
+        total += moved
+    logger.info(f"Storage migration {'checked' if args.dry_run else 'finished'}: {total} files")
+
+if __name__ == "__main__":
+    main()
@@ -18,13 +18,44 @@ class StatusCheckCreate(BaseModel):
     """Create status check request"""
     client_name: str
 
+class OutputTarget(BaseModel):
+    """One output of a fan-out conversion"""
+    model_config = ConfigDict(extra="allow")
+    
+    format: str
+    quality: Optional[int] = None
+    width: Optional[int] = None
+    height: Optional[int] = None
+    resize_mode: Optional[str] = None
+    max_dimension: Optional[int] = None
+
 class ConversionRequest(BaseModel):
     """Request model for file conversion"""
     file_id: str
     original_filename: str
     file_type: str  # 'image' or 'document'
-    target_format: str
+    target_format: Optional[str] = None
+    options: Dict[str, Any] = Field(default_factory=dict)
+    # Decode once, encode many: several image outputs from one job
+    targets: Optional[List[OutputTarget]] = None
+    # 'interactive' (default) or 'bulk'
+    priority: Optional[str] = None
+
+class BatchConversionItem(BaseModel):
+    """One file in a batch; target/options fall back to the batch defaults"""
+    file_id: str
+    original_filename: str
+    file_type: str
+    target_format: Optional[str] = None
+    options: Optional[Dict[str, Any]] = None
+
+class BatchConversionRequest(BaseModel):
+    """Request model for converting many files at once"""
+    items: List[BatchConversionItem]
+    target_format: Optional[str] = None
     options: Dict[str, Any] = Field(default_factory=dict)
+    # Batches are 'bulk' unless a user is waiting on them
+    priority: Optional[str] = None
 
 class ConversionResponse(BaseModel):
     """Response model for conversion status"""
@@ -67,6 +98,7 @@ class UploadResponse(BaseModel):
     mime_type: str
     message: str
     status: str  # 'success' or 'error'
+    metadata: Optional[Dict[str, Any]] = None  # probed format, dimensions, frames/pages
 
 class DownloadRequest(BaseModel):
     """Request model for file download"""
@@ -114,8 +146,48 @@ class UploadResponse(BaseModel):
     mime_type: str
     message: str
     status: str  # 'success' or 'error'
+    metadata: Optional[Dict[str, Any]] = None  # probed format, dimensions, frames/pages
 
 class DownloadRequest(BaseModel):
     """Request model for file download"""
     file_id: str
     filename: str
+
+class FileMetadata(BaseModel):
+    """Header-only probe result recorded for each upload"""
+    model_config = ConfigDict(extra="allow")
+    
+    file_id: str
+    format: Optional[str] = None
+    mime_type: str
+    size: int
+    width: Optional[int] = None
+    height: Optional[int] = None
+    mode: Optional[str] = None
+    frames: Optional[int] = None
+    pages: Optional[int] = None
+    decode_bytes: Optional[int] = None  # estimated memory for a full decode
+
+class UploadSessionCreate(BaseModel):
+    """Request model for starting a chunked upload"""
+    filename: str
+    total_size: int
+    content_type: Optional[str] = None
+    file_type: Optional[str] = None  # detected from content_type/extension when omitted
+    chunk_size: Optional[int] = None
+
+class UploadSessionResponse(BaseModel):
+    """Response model for chunked upload session state"""
+    session_id: str
+    filename: str
+    file_type: str
+    total_size: int
+    chunk_size: int
+    total_chunks: int
+    received_chunks: List[int] = Field(default_factory=list)
+    complete: bool = False
+
+class ZipDownloadRequest(BaseModel):
+    """Request model for downloading several outputs as one ZIP"""
+    output_file_ids: List[str] = Field(default_factory=list)
+    batch_id: Optional[str] = None
@@ -1,5 +1,5 @@
-from fastapi import FastAPI, APIRouter, UploadFile, File, HTTPException, BackgroundTasks
-from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
+from fastapi import FastAPI, APIRouter, HTTPException, Request, Header
+from fastapi.responses import JSONResponse, RedirectResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
@@ -14,13 +14,31 @@ from datetime import datetime, timezone, timedelta
 import asyncio
 import time
 import mimetypes
+import json
+from PIL import Image
 
 # Import services
 from services.file_handler import FileHandler
 from services.conversion_service import ConversionService
+from services.upload_session import UploadSessionManager
+from services.result_cache import ResultCache
+from services.scheduler import AdmissionScheduler
+from services.job_store import create_job_store, PRIORITIES, FINISHED_STATUSES
+from services.job_dispatcher import JobDispatcher
+from services.progress_bus import ProgressBus, Subscription, job_event
+from services.zip_stream import iter_zip, unique_names
+from services.storage import create_storage
+from services.history_writer import HistoryWriter
+from utils.http_cache import content_etag, file_response
+from utils.multipart_stream import MultipartError, MultipartFileStream
+from services.worker_pool import (
+    ConversionWorkerPool, PoolQueueFullError, run_conversion, run_fanout
+)
 from models import (
     ConversionRequest, ConversionResponse, ConversionHistory,
-    UploadResponse, StatusCheck, StatusCheckCreate
+    UploadResponse, StatusCheck, StatusCheckCreate,
+    UploadSessionCreate, UploadSessionResponse, FileMetadata,
+    BatchConversionRequest, ZipDownloadRequest
 )
 
 ROOT_DIR = Path(__file__).parent
@@ -31,17 +49,84 @@ MONGO_URL = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
 DB_NAME = os.environ.get('DB_NAME', 'converter_db')
 UPLOAD_DIR = os.environ.get('UPLOAD_DIR', str(ROOT_DIR / 'uploads'))
 CONVERTED_DIR = os.environ.get('CONVERTED_DIR', str(ROOT_DIR / 'converted'))
+RESULT_CACHE_DIR = os.environ.get('RESULT_CACHE_DIR', str(ROOT_DIR / 'cache'))
+RESULT_CACHE_MAX_BYTES = int(os.environ.get('RESULT_CACHE_MAX_BYTES', 5368709120))  # 5GB
+UPLOAD_SESSION_DIR = os.environ.get('UPLOAD_SESSION_DIR', str(Path(UPLOAD_DIR) / 'sessions'))
 MAX_FILE_SIZE = int(os.environ.get('MAX_FILE_SIZE', 2147483648))  # 2GB
+UPLOAD_TTL_SECONDS = float(os.environ.get('UPLOAD_TTL_SECONDS', 604800))  # uploads kept this long
+OUTPUT_TTL_SECONDS = float(os.environ.get('OUTPUT_TTL_SECONDS', 86400))  # converted files kept this long
+FILE_EXPIRY_INTERVAL = float(os.environ.get('FILE_EXPIRY_INTERVAL', 60))
+FILE_EXPIRY_BATCH = int(os.environ.get('FILE_EXPIRY_BATCH', 500))  # files deleted per batch
+FILE_EXPIRY_RATE = float(os.environ.get('FILE_EXPIRY_RATE', 1000))  # max files deleted per second
+STORAGE_BACKEND = os.environ.get('STORAGE_BACKEND', 'local')  # local | s3
+S3_BUCKET = os.environ.get('S3_BUCKET') or None
+S3_ENDPOINT_URL = os.environ.get('S3_ENDPOINT_URL') or None  # e.g. a MinIO server; AWS when unset
+S3_REGION = os.environ.get('S3_REGION') or None
+S3_PRESIGN_SECONDS = int(os.environ.get('S3_PRESIGN_SECONDS', 3600))  # lifetime of download URLs
+ORPHAN_BLOB_GRACE_SECONDS = float(os.environ.get('ORPHAN_BLOB_GRACE_SECONDS', 3600))  # unreferenced stored blobs kept this long
+HISTORY_BATCH_SIZE = int(os.environ.get('HISTORY_BATCH_SIZE', 500))  # history records per insert
+HISTORY_FLUSH_SECONDS = float(os.environ.get('HISTORY_FLUSH_SECONDS', 2))  # longest a record waits for its batch
+HISTORY_MAX_PENDING = int(os.environ.get('HISTORY_MAX_PENDING', 10000))  # buffered records before jobs wait
+CONVERSION_WORKERS = int(os.environ.get('CONVERSION_WORKERS', os.cpu_count() or 1))
+CONVERSION_QUEUE_SIZE = int(os.environ.get('CONVERSION_QUEUE_SIZE', 100))
+CONVERSION_TIMEOUT = float(os.environ.get('CONVERSION_TIMEOUT', 600))  # seconds per job
+MAX_BATCH_SIZE = int(os.environ.get('MAX_BATCH_SIZE', 1000))
+LARGE_IMAGE_PIXELS = int(os.environ.get('LARGE_IMAGE_PIXELS', 50000000))  # converted in strips above this
+MAX_IMAGE_PIXELS = int(os.environ.get('MAX_IMAGE_PIXELS', 2000000000))
+IMAGE_MEMORY_LIMIT = int(os.environ.get('IMAGE_MEMORY_LIMIT', 1073741824))  # 1GB per raster
+CONVERSION_MEMORY_BUDGET = int(os.environ.get('CONVERSION_MEMORY_BUDGET', 4294967296))  # 4GB across running jobs
+JOB_STORE = os.environ.get('JOB_STORE', 'sqlite')  # sqlite | mongo | memory
+JOB_STORE_PATH = os.environ.get('JOB_STORE_PATH', str(ROOT_DIR / 'jobs.db'))
+JOB_LEASE_SECONDS = float(os.environ.get('JOB_LEASE_SECONDS', 30))
+JOB_MAX_ATTEMPTS = int(os.environ.get('JOB_MAX_ATTEMPTS', 3))
+JOB_TTL_SECONDS = float(os.environ.get('JOB_TTL_SECONDS', 86400))  # finished jobs kept this long
+JOB_MAX_RECORDS = int(os.environ.get('JOB_MAX_RECORDS', 100000))  # oldest finished jobs evicted above this
+JOB_ARCHIVE = os.environ.get('JOB_ARCHIVE', 'false').lower() == 'true'  # copy expired jobs to MongoDB
+JOB_EXPIRY_INTERVAL = float(os.environ.get('JOB_EXPIRY_INTERVAL', 300))
+BULK_CONVERSION_SLOTS = int(os.environ.get('BULK_CONVERSION_SLOTS', max(1, CONVERSION_WORKERS - 1)))  # rest kept for interactive jobs
+RUN_CONVERSION_WORKER = os.environ.get('RUN_CONVERSION_WORKER', 'true').lower() == 'true'
+PROGRESS_POLL_SECONDS = float(os.environ.get('PROGRESS_POLL_SECONDS', 1))  # store polling for jobs run elsewhere
+PROGRESS_KEEPALIVE_SECONDS = float(os.environ.get('PROGRESS_KEEPALIVE_SECONDS', 15))
+PROGRESS_CLIENT_WINDOW = float(os.environ.get('PROGRESS_CLIENT_WINDOW', 3600))  # jobs replayed to a client stream
 CORS_ORIGINS = os.environ.get('CORS_ORIGINS', '*').split(',')
 DEBUG = os.environ.get('DEBUG', 'true').lower() == 'true'
 
 # ============ DATABASE SETUP ============
 client = AsyncIOMotorClient(MONGO_URL)
 db = client[DB_NAME]
+# Conversion history is written behind the jobs, in batches
+history_writer = HistoryWriter(db.conversion_history, HISTORY_BATCH_SIZE, HISTORY_FLUSH_SECONDS, HISTORY_MAX_PENDING)
 
 # ============ SERVICE INITIALIZATION ============
-file_handler = FileHandler(UPLOAD_DIR, MAX_FILE_SIZE)
-conversion_service = ConversionService(CONVERTED_DIR)
+# Uploads and outputs share one bucket under separate prefixes
+upload_storage = create_storage(STORAGE_BACKEND, UPLOAD_DIR, "uploads/", S3_BUCKET, S3_ENDPOINT_URL, S3_REGION)
+output_storage = create_storage(STORAGE_BACKEND, CONVERTED_DIR, "outputs/", S3_BUCKET, S3_ENDPOINT_URL, S3_REGION)
+file_handler = FileHandler(UPLOAD_DIR, MAX_FILE_SIZE, UPLOAD_TTL_SECONDS, upload_storage)
+conversion_service = ConversionService(
+    CONVERTED_DIR, LARGE_IMAGE_PIXELS, MAX_IMAGE_PIXELS, IMAGE_MEMORY_LIMIT, OUTPUT_TTL_SECONDS, output_storage
+)
+# Header probes of huge uploads must not trip PIL's bomb check below our own limit
+Image.MAX_IMAGE_PIXELS = MAX_IMAGE_PIXELS
+upload_sessions = UploadSessionManager(UPLOAD_SESSION_DIR, file_handler, MAX_FILE_SIZE)
+result_cache = ResultCache(RESULT_CACHE_DIR, RESULT_CACHE_MAX_BYTES)
+scheduler = AdmissionScheduler(
+    CONVERSION_MEMORY_BUDGET, CONVERSION_WORKERS, LARGE_IMAGE_PIXELS, IMAGE_MEMORY_LIMIT
+)
+worker_pool = ConversionWorkerPool(
+    CONVERTED_DIR, CONVERSION_WORKERS, CONVERSION_QUEUE_SIZE, CONVERSION_TIMEOUT,
+    service_options={
+        "large_image_pixels": LARGE_IMAGE_PIXELS,
+        "max_image_pixels": MAX_IMAGE_PIXELS,
+        "memory_limit": IMAGE_MEMORY_LIMIT
+    }
+)
+# Job and batch state, shared by every API and worker process
+job_store = create_job_store(JOB_STORE, JOB_STORE_PATH, db)
+progress_bus = ProgressBus()
+# Claims jobs for this process (started when RUN_CONVERSION_WORKER is on)
+dispatcher: Optional[JobDispatcher] = None
+job_expiry_task: Optional[asyncio.Task] = None
+file_expiry_task: Optional[asyncio.Task] = None
 
 # ============ FASTAPI APP SETUP ============
 app = FastAPI(
@@ -69,10 +154,6 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# ============ GLOBAL STATE MANAGEMENT ============
-# In-memory store for conversion jobs (for production, use Redis)
-conversion_jobs: Dict[str, Dict[str, Any]] = {}
-
 # ============ MODELS ============
 class StatusCheck(BaseModel):
     model_config = ConfigDict(extra="ignore")
@@ -134,28 +215,64 @@ async def get_status_checks():
     return status_checks
 
 # ============ FILE UPLOAD ENDPOINTS ============
-@api_router.post("/upload")
-async def upload_file(file: UploadFile = File(...)):
-    """Upload a file for conversion"""
+def detect_file_type(content_type: str, filename: str) -> Optional[str]:
+    """Determine file type by content-type or extension"""
+    if content_type.startswith('image/'):
+        return 'image'
+    if 'document' in content_type or 'pdf' in content_type or content_type.startswith('application/'):
+        return 'document'
+    
+    # Fallback to file extension
+    ext = Path(filename).suffix.lower()
+    if ext in ['.jpg', '.jpeg', '.png', '.webp', '.gif', '.tiff', '.ico', '.bmp']:
+        return 'image'
+    if ext in ['.pdf', '.docx', '.doc']:
+        return 'document'
+    return None
+
+# Room for the multipart boundary and part headers around the file itself
+UPLOAD_ENVELOPE_BYTES = 64 * 1024
+
+# The body is parsed by the handler, so describe the form for the API docs
+UPLOAD_REQUEST_BODY = {
+    "requestBody": {
+        "required": True,
+        "content": {"multipart/form-data": {"schema": {
+            "type": "object",
+            "required": ["file"],
+            "properties": {"file": {"type": "string", "format": "binary"}}
+        }}}
+    }
+}
+
+def file_too_large() -> HTTPException:
+    return HTTPException(
+        status_code=413,
+        detail=f"File size exceeds maximum allowed: {MAX_FILE_SIZE / (1024**3):.0f}GB"
+    )
+
+@api_router.post("/upload", openapi_extra=UPLOAD_REQUEST_BODY)
+async def upload_file(request: Request):
+    """Upload a file for conversion (multipart/form-data, field `file`)"""
     try:
+        # Reject before reading anything when the client already told us the size
+        content_length = request.headers.get("content-length", "")
+        if content_length.isdigit() and int(content_length) > MAX_FILE_SIZE + UPLOAD_ENVELOPE_BYTES:
+            raise file_too_large()
+        
+        # The body is parsed as it arrives; nothing is spooled before we see it
+        try:
+            file = MultipartFileStream(request.stream(), request.headers.get("content-type"))
+            await file.open()
+        except MultipartError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        
         logger.info(f"Uploading file: {file.filename}, content_type: {file.content_type}")
         
         # Determine file type by content-type or extension
         content_type = file.content_type or ""
         filename = file.filename or ""
-        
-        file_type = None
-        if content_type.startswith('image/'):
-            file_type = 'image'
-        elif 'document' in content_type or 'pdf' in content_type or content_type.startswith('application/'):
-            file_type = 'document'
-        else:
-            # Fallback to file extension
-            ext = Path(filename).suffix.lower()
-            if ext in ['.jpg', '.jpeg', '.png', '.webp', '.gif', '.tiff', '.ico', '.bmp']:
-                file_type = 'image'
-            elif ext in ['.pdf', '.docx', '.doc']:
-                file_type = 'document'
+        file_type = detect_file_type(content_type, filename)
         
         logger.info(f"Detected file_type: {file_type} for {filename}")
         
@@ -166,32 +283,27 @@ async def upload_file(file: UploadFile = File(...)):
                 detail=f"Unsupported file type: {content_type or 'unknown'}"
             )
         
-        # Read file content
-        content = await file.read()
-        
-        # Check file size
-        if len(content) > MAX_FILE_SIZE:
-            raise HTTPException(
-                status_code=413,
-                detail=f"File size exceeds maximum allowed: {MAX_FILE_SIZE / (1024**3):.0f}GB"
-            )
-        
-        # Save file
-        success, message, file_id = await file_handler.save_upload(
-            content, file.filename, file_type
+        # Stream file to disk in chunks (validates extension before writing,
+        # stops reading the body once the size limit is passed)
+        success, message, file_id, size = await file_handler.save_upload_stream(
+            file, filename, file_type
         )
         
         if not success:
+            if size > MAX_FILE_SIZE:
+                raise file_too_large()
             raise HTTPException(status_code=400, detail=message)
+        await publish_upload(file_id, file_type)
         
         return UploadResponse(
             file_id=file_id,
-            filename=file.filename,
+            filename=filename,
             file_type=file_type,
-            size=len(content),
-            mime_type=file.content_type,
+            size=size,
+            mime_type=content_type or mimetypes.guess_type(filename)[0] or "application/octet-stream",
             message=message,
-            status="success"
+            status="success",
+            metadata=await asyncio.to_thread(file_handler.get_metadata, file_id)
         )
     
     except HTTPException:
@@ -200,78 +312,371 @@ async def upload_file(file: UploadFile = File(...)):
         logger.error(f"Upload error: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Upload failed: {str(e)}")
 
+async def publish_upload(file_id: str, file_type: str):
+    """Copy a new upload to the storage backend; the upload fails if that does"""
+    if not file_handler.storage.remote:
+        return
+    success, message = await asyncio.to_thread(file_handler.publish, file_id)
+    if not success:
+        await asyncio.to_thread(file_handler.delete_file, file_id, file_type)
+        logger.error(f"Upload storage error: {message}")
+        raise HTTPException(status_code=502, detail=message)
+
+@api_router.get("/files/{file_id}/metadata", response_model=FileMetadata)
+async def get_file_metadata(file_id: str):
+    """Get the probed metadata recorded for an upload"""
+    metadata = await asyncio.to_thread(file_handler.get_metadata, file_id)
+    if metadata is None:
+        raise HTTPException(status_code=404, detail="File not found")
+    return FileMetadata(file_id=file_id, **metadata)
+
+# ============ CHUNKED UPLOAD ENDPOINTS ============
+@api_router.post("/upload/sessions", response_model=UploadSessionResponse)
+async def create_upload_session(request: UploadSessionCreate):
+    """Start a resumable chunked upload"""
+    file_type = request.file_type or detect_file_type(request.content_type or "", request.filename)
+    if not file_type:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unsupported file type: {request.content_type or 'unknown'}"
+        )
+    
+    if request.total_size > MAX_FILE_SIZE:
+        raise file_too_large()
+    
+    success, message, session = upload_sessions.create_session(
+        request.filename, file_type, request.total_size, request.chunk_size
+    )
+    if not success:
+        raise HTTPException(status_code=400, detail=message)
+    
+    logger.info(f"Upload session created: {session['session_id']} ({session['total_chunks']} chunks)")
+    return UploadSessionResponse(**session)
+
+@api_router.get("/upload/sessions/{session_id}", response_model=UploadSessionResponse)
+async def get_upload_session(session_id: str):
+    """Get which chunks of a session are already stored"""
+    session = upload_sessions.get_session(session_id)
+    if not session:
+        raise HTTPException(status_code=404, detail="Upload session not found")
+    return UploadSessionResponse(**session)
+
+@api_router.put("/upload/sessions/{session_id}/chunks/{index}")
+async def upload_chunk(session_id: str, index: int, request: Request):
+    """Store one chunk; chunks may be sent in parallel and in any order"""
+    success, message = await upload_sessions.write_chunk(session_id, index, request.stream())
+    if not success:
+        status_code = 404 if upload_sessions.get_session(session_id) is None else 400
+        raise HTTPException(status_code=status_code, detail=message)
+    
+    return {"session_id": session_id, "index": index, "status": "stored", "message": message}
+
+@api_router.post("/upload/sessions/{session_id}/complete")
+async def complete_upload_session(session_id: str):
+    """Assemble a finished session into a regular upload"""
+    success, message, file_id, session = await upload_sessions.complete_session(session_id)
+    if not session:
+        raise HTTPException(status_code=404, detail="Upload session not found")
+    if not success:
+        raise HTTPException(status_code=409 if not session["complete"] else 400, detail=message)
+    await publish_upload(file_id, session["file_type"])
+    
+    logger.info(f"Upload session completed: {session_id} -> {file_id}")
+    return UploadResponse(
+        file_id=file_id,
+        filename=session["filename"],
+        file_type=session["file_type"],
+        size=session["total_size"],
+        mime_type=mimetypes.guess_type(session["filename"])[0] or "application/octet-stream",
+        message=message,
+        status="success",
+        metadata=await asyncio.to_thread(file_handler.get_metadata, file_id)
+    )
+
+@api_router.delete("/upload/sessions/{session_id}")
+async def abort_upload_session(session_id: str):
+    """Abort a chunked upload and free its storage"""
+    if not upload_sessions.abort_session(session_id):
+        raise HTTPException(status_code=404, detail="Upload session not found")
+    return {"session_id": session_id, "status": "aborted"}
+
 # ============ CONVERSION ENDPOINTS ============
 @api_router.post("/convert")
 async def start_conversion(
     request: ConversionRequest,
-    background_tasks: BackgroundTasks
+    http_request: Request,
+    x_client_id: Optional[str] = Header(None)
 ):
     """Start file conversion process"""
     try:
+        priority = check_priority(request.priority, "interactive")
+        if request.targets:
+            if request.file_type != 'image':
+                raise HTTPException(status_code=400, detail="Multiple targets are only supported for images")
+            request.target_format = request.target_format or ",".join(t.format.upper() for t in request.targets)
+        elif not request.target_format:
+            raise HTTPException(status_code=400, detail="target_format or targets is required")
+        
         logger.info(f"Starting conversion: {request.file_id} -> {request.target_format}")
         
-        # Create conversion job
-        conversion_id = str(uuid.uuid4())
-        conversion_jobs[conversion_id] = {
-            "status": "processing",
-            "progress": 0,
-            "file_id": request.file_id,
-            "original_filename": request.original_filename,
-            "target_format": request.target_format,
-            "file_type": request.file_type,
-            "started_at": datetime.now(timezone.utc),
-            "message": "Starting conversion..."
-        }
+        await check_queue_capacity(priority)
         
-        # Add background task for actual conversion
-        background_tasks.add_task(
-            perform_conversion,
-            conversion_id,
-            request,
-            file_handler,
-            conversion_service
-        )
+        # Queue the job; a dispatcher in this or another process picks it up
+        job = new_conversion_job(request, client_id=client_key(http_request, x_client_id), priority=priority)
+        await job_store.create_jobs([job])
+        progress_bus.publish(job)
+        if dispatcher:
+            dispatcher.notify()
         
         return {
-            "conversion_id": conversion_id,
-            "status": "processing",
-            "message": "Conversion started"
+            "conversion_id": job["id"],
+            "status": "queued",
+            "message": "Conversion queued"
         }
     
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Conversion error: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Conversion failed: {str(e)}")
 
+def new_conversion_job(
+    request: ConversionRequest,
+    batch_id: Optional[str] = None,
+    client_id: Optional[str] = None,
+    priority: str = "interactive"
+) -> Dict[str, Any]:
+    """Build the store record of a queued conversion job"""
+    return {
+        "id": str(uuid.uuid4()),
+        "status": "queued",
+        "progress": 0,
+        "file_id": request.file_id,
+        "original_filename": request.original_filename,
+        "target_format": request.target_format,
+        "file_type": request.file_type,
+        "batch_id": batch_id,
+        "client_id": client_id,
+        "priority": priority,
+        "request": request.model_dump(),
+        "created_at": time.time(),
+        "attempts": 0,
+        "message": "Waiting in queue..."
+    }
+
+def check_priority(priority: Optional[str], default: str) -> str:
+    if priority is None:
+        return default
+    if priority not in PRIORITIES:
+        raise HTTPException(status_code=400, detail=f"priority must be one of: {', '.join(PRIORITIES)}")
+    return priority
+
+def client_key(http_request: Request, client_id: Optional[str]) -> Optional[str]:
+    """Who a job is scheduled fairly for: X-Client-Id, else the caller's address"""
+    if client_id:
+        return client_id
+    return http_request.client.host if http_request.client else None
+
+async def check_queue_capacity(priority: str):
+    """Turn new work away with 429 while its class's share of the queue is full"""
+    # A bulk backlog never blocks interactive requests
+    queued = await job_store.count_queued(priority)
+    if queued >= CONVERSION_QUEUE_SIZE:
+        raise HTTPException(
+            status_code=429,
+            detail=f"Conversion queue is full ({queued} jobs waiting)",
+            headers={"Retry-After": str(scheduler.retry_after(queued))}
+        )
+
+async def estimate_job_memory(request: ConversionRequest) -> int:
+    """Peak memory estimate of a job, from the upload's probed header"""
+    return scheduler.estimate(
+        await asyncio.to_thread(file_handler.get_metadata, request.file_id),
+        request.file_type,
+        request.options,
+        outputs=len(request.targets) if request.targets else 1
+    )
+
+async def run_admitted(job: Dict[str, Any], request: ConversionRequest, fn, *args, **kwargs):
+    """Run fn in the worker pool once the scheduler admits the job"""
+    # Jobs reach here only after being claimed from the store, so they always wait
+    ticket = scheduler.enqueue(
+        await estimate_job_memory(request),
+        priority=PRIORITIES.index(job.get("priority", PRIORITIES[0]))
+    )
+    if not scheduler.is_admitted(ticket):
+        job["message"] = "Waiting for capacity..."
+        progress_bus.publish(job)
+    async with scheduler.slot(ticket):
+        job["message"] = "Processing file..."
+        progress_bus.publish(job)
+        # Even when cancelled, submit ends only once the worker is done, so the slot covers the whole job
+        return await worker_pool.submit(fn, *args, **kwargs)
+
+@api_router.post("/convert/batch")
+async def start_batch_conversion(
+    request: BatchConversionRequest,
+    http_request: Request,
+    x_client_id: Optional[str] = Header(None)
+):
+    """Start converting many files with one request"""
+    if not request.items:
+        raise HTTPException(status_code=400, detail="Batch has no items")
+    if len(request.items) > MAX_BATCH_SIZE:
+        raise HTTPException(status_code=400, detail=f"Batch exceeds {MAX_BATCH_SIZE} items")
+    priority = check_priority(request.priority, "bulk")
+    await check_queue_capacity(priority)
+    
+    conversions = []
+    for item in request.items:
+        target_format = item.target_format or request.target_format
+        if not target_format:
+            raise HTTPException(status_code=400, detail=f"No target format for {item.file_id}")
+        conversions.append(ConversionRequest(
+            file_id=item.file_id,
+            original_filename=item.original_filename,
+            file_type=item.file_type,
+            target_format=target_format,
+            options={**request.options, **(item.options or {})}
+        ))
+    
+    batch_id = str(uuid.uuid4())
+    client_id = client_key(http_request, x_client_id)
+    jobs = [new_conversion_job(c, batch_id, client_id, priority) for c in conversions]
+    conversion_ids = [job["id"] for job in jobs]
+    await job_store.create_jobs(jobs)
+    await job_store.create_batch(batch_id, conversion_ids)
+    for job in jobs:
+        progress_bus.publish(job)
+    if dispatcher:
+        dispatcher.notify()
+    logger.info(f"Batch started: {batch_id} ({len(conversion_ids)} files)")
+    
+    return {
+        "batch_id": batch_id,
+        "conversion_ids": conversion_ids,
+        "total": len(conversion_ids),
+        "status": "processing",
+        "message": "Batch conversion started"
+    }
+
+@api_router.get("/convert/batch/{batch_id}")
+async def get_batch_status(batch_id: str):
+    """Get aggregate progress of a batch"""
+    batch = await job_store.get_batch(batch_id)
+    if not batch:
+        raise HTTPException(status_code=404, detail="Batch not found")
+    
+    jobs = {job["id"]: job for job in await job_store.get_jobs(batch["conversion_ids"])}
+    items = []
+    counts = {"queued": 0, "processing": 0, "completed": 0, "failed": 0, "cancelled": 0}
+    for conversion_id in batch["conversion_ids"]:
+        job = jobs.get(conversion_id, {})
+        status = job.get("status", "failed")
+        counts[status] = counts.get(status, 0) + 1
+        items.append({
+            "conversion_id": conversion_id,
+            "file_id": job.get("file_id"),
+            "status": status,
+            "progress": job.get("progress", 0),
+            "message": job.get("message", ""),
+            "output_file_id": job.get("output_file_id")
+        })
+    
+    total = len(items)
+    finished = counts["completed"] + counts["failed"] + counts["cancelled"]
+    if finished < total:
+        status = "processing"
+    elif counts["completed"] == total:
+        status = "completed"
+    elif counts["completed"] == 0:
+        status = "failed" if counts["failed"] else "cancelled"
+    else:
+        status = "completed_with_errors"
+    
+    return {
+        "batch_id": batch_id,
+        "status": status,
+        "total": total,
+        **counts,
+        "progress": int(sum(item["progress"] for item in items) / total) if total else 100,
+        "items": items,
+        "timestamp": datetime.now(timezone.utc).isoformat()
+    }
+
 @api_router.get("/convert/status/{conversion_id}")
 async def get_conversion_status(conversion_id: str):
     """Get conversion job status"""
-    if conversion_id not in conversion_jobs:
+    job = await job_store.get_job(conversion_id)
+    if not job:
         raise HTTPException(status_code=404, detail="Conversion job not found")
     
-    job = conversion_jobs[conversion_id]
-    
     return {
         "conversion_id": conversion_id,
         "status": job["status"],
         "progress": job["progress"],
         "message": job.get("message", ""),
         "output_file_id": job.get("output_file_id"),
+        "outputs": job.get("outputs"),
         "timestamp": datetime.now(timezone.utc).isoformat()
     }
 
+async def store_output(output_path: Path) -> tuple[bool, str]:
+    """Index a new output and copy it to the storage backend"""
+    if not conversion_service.storage.remote:
+        return conversion_service.register_output(output_path)
+    return await asyncio.to_thread(conversion_service.register_output, output_path)
+
+def report_progress(job: Dict[str, Any], percent: int, message: str):
+    """Map worker progress (0-100) onto the 25-95 range of a running job"""
+    job["progress"] = 25 + int(percent * 0.7)
+    job["message"] = message
+    progress_bus.publish(job)
+
+async def process_job(job: Dict[str, Any]):
+    """Dispatcher handler: run a claimed job from its stored request"""
+    try:
+        await perform_conversion(job, ConversionRequest(**job["request"]), file_handler, conversion_service)
+    except asyncio.CancelledError:
+        # Cancelled after outputs were written: nobody will download them
+        outputs = [job.pop("output_file_id", None)] + [o["output_file_id"] for o in job.pop("outputs", None) or []]
+        for output_file_id in filter(None, outputs):
+            await asyncio.to_thread(conversion_service.delete_output, output_file_id)
+        raise
+
+@api_router.delete("/convert/{conversion_id}")
+async def cancel_conversion(conversion_id: str):
+    """Cancel a queued job, or stop a running one at its next frame/page"""
+    job = await job_store.cancel_job(conversion_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Conversion job not found")
+    if job["status"] in ("completed", "failed"):
+        raise HTTPException(status_code=409, detail=f"Conversion already {job['status']}")
+    
+    if job["status"] == "processing":
+        # Stopped here right away; a worker elsewhere sees the flag at its next heartbeat
+        if dispatcher:
+            dispatcher.cancel(conversion_id)
+        logger.info(f"Cancellation requested: {conversion_id}")
+        return {"conversion_id": conversion_id, "status": "cancelling", "message": "Cancellation requested"}
+    
+    progress_bus.publish(job)
+    logger.info(f"Conversion cancelled: {conversion_id}")
+    return {"conversion_id": conversion_id, "status": "cancelled", "message": "Conversion cancelled"}
+
 async def perform_conversion(
-    conversion_id: str,
+    job: Dict[str, Any],
     request: ConversionRequest,
     file_handler: FileHandler,
     conversion_service: ConversionService
 ):
-    """Background task to perform actual file conversion"""
+    """Perform the file conversion of a claimed job, updating it in place"""
+    conversion_id = job["id"]
     try:
         start_time = time.time()
-        job = conversion_jobs[conversion_id]
         
-        # Get uploaded file
-        file_path = file_handler.get_file_path(request.file_id, request.file_type)
+        # Get uploaded file (fetched from the storage backend when not on this machine)
+        file_path = await asyncio.to_thread(file_handler.get_file_path, request.file_id, request.file_type)
         if not file_path:
             job["status"] = "failed"
             job["message"] = "Source file not found"
@@ -281,26 +686,45 @@ async def perform_conversion(
         # Update job status
         job["progress"] = 25
         job["message"] = "Processing file..."
+        progress_bus.publish(job)
         
-        # Perform conversion based on file type
-        if request.file_type == 'image':
-            success, message, output_path = await conversion_service.convert_image(
-                file_path,
-                request.target_format,
-                quality=request.options.get('quality', 90),
-                resize=request.options.get('resize', False),
-                width=request.options.get('width'),
-                height=request.options.get('height')
-            )
-        elif request.file_type == 'document':
-            success, message, output_path = await conversion_service.convert_document(
-                file_path,
-                request.target_format
-            )
+        record = await asyncio.to_thread(file_handler.get_record, request.file_id)
+        if request.targets:
+            await perform_fanout(job, request, file_path, record, start_time)
+            logger.info(f"Fan-out conversion finished: {conversion_id} ({job['status']})")
+            return
+        
+        # Serve repeated conversions of the same content from the result cache
+        cache_key = None
+        if record and record.get("sha256"):
+            cache_key = result_cache.make_key(record["sha256"], request.target_format, request.options)
+        output_path = await cached_output(cache_key)
+        
+        if output_path:
+            success, message = True, "Dönüştürme önbellekten alındı"
         else:
-            success = False
-            message = "Unsupported file type"
-            output_path = None
+            # Perform conversion in a worker process
+            try:
+                success, message, output_path = await run_admitted(
+                    job, request,
+                    run_conversion,
+                    request.file_type,
+                    str(file_path),
+                    request.target_format,
+                    request.options,
+                    job_id=conversion_id,
+                    on_progress=lambda percent, message: report_progress(job, percent, message)
+                )
+            except PoolQueueFullError as e:
+                success, message, output_path = False, str(e), None
+            
+            if success and output_path:
+                await cache_result(cache_key, output_path)
+        
+        if success and output_path:
+            success, store_message = await store_output(output_path)
+            if not success:
+                message, output_path = store_message, None
         
         # Update job with results
         if success:
@@ -308,12 +732,11 @@ async def perform_conversion(
             job["status"] = "completed"
             job["message"] = message
             job["output_file_id"] = output_path.name.split('.')[0] if output_path else None
-            job["output_file"] = output_path
             
             # Save to database
             conversion_time_ms = int((time.time() - start_time) * 1000)
             await save_conversion_history(
-                db, request, job["output_file_id"],
+                request, job["output_file_id"],
                 output_path.stat().st_size if output_path else 0,
                 conversion_time_ms
             )
@@ -326,48 +749,264 @@ async def perform_conversion(
             
             # Save failed conversion to database
             await save_conversion_history(
-                db, request, None, 0, int((time.time() - start_time) * 1000),
+                request, None, 0, int((time.time() - start_time) * 1000),
                 error=message
             )
             
             logger.error(f"Conversion failed: {conversion_id} - {message}")
     
     except Exception as e:
-        job = conversion_jobs.get(conversion_id)
-        if job:
-            job["status"] = "failed"
-            job["message"] = f"Error: {str(e)}"
+        job["status"] = "failed"
+        job["message"] = f"Error: {str(e)}"
         logger.error(f"Conversion exception: {str(e)}")
 
+async def cached_output(cache_key: Optional[str]) -> Optional[Path]:
+    """A new output holding the cached result for cache_key; any cache error counts as a miss"""
+    if not cache_key:
+        return None
+    try:
+        cached_path = await asyncio.to_thread(result_cache.get, cache_key)
+        if cached_path:
+            return await asyncio.to_thread(conversion_service.link_output, cached_path)
+    except Exception as e:
+        logger.warning(f"Result cache lookup failed: {str(e)}")
+    return None
+
+async def cache_result(cache_key: Optional[str], output_path: Path):
+    """Cache a finished output; a cache error never fails the job that produced it"""
+    if not cache_key:
+        return
+    try:
+        await asyncio.to_thread(result_cache.put, cache_key, output_path)
+    except Exception as e:
+        logger.warning(f"Result cache store failed: {str(e)}")
+
+async def perform_fanout(
+    job: Dict[str, Any],
+    request: ConversionRequest,
+    file_path: Path,
+    record: Optional[dict],
+    start_time: float
+):
+    """Produce every requested output from one decode; cached outputs are reused"""
+    targets = [t.model_dump(exclude_none=True) for t in request.targets]
+    for target in targets:
+        # A size on a target implies resizing (cache keys depend on it too)
+        target.setdefault("resize", bool(target.get("width") or target.get("height")))
+    cache_keys = [
+        result_cache.make_key(
+            record["sha256"], t["format"], {k: v for k, v in t.items() if k != "format"}
+        ) if record and record.get("sha256") else None
+        for t in targets
+    ]
+    
+    results: List[Optional[tuple]] = [None] * len(targets)
+    misses = []
+    for i, cache_key in enumerate(cache_keys):
+        output_path = await cached_output(cache_key)
+        if output_path:
+            results[i] = (True, "Dönüştürme önbellekten alındı", output_path)
+        else:
+            misses.append(i)
+    
+    if misses:
+        try:
+            converted = await run_admitted(
+                job, request, run_fanout, str(file_path), [targets[i] for i in misses], job_id=job["id"]
+            )
+        except PoolQueueFullError as e:
+            converted = [(False, str(e), None)] * len(misses)
+        for i, result in zip(misses, converted):
+            results[i] = result
+            if result[0] and result[2]:
+                await cache_result(cache_keys[i], result[2])
+    
+    for i, (success, message, output_path) in enumerate(results):
+        if success and output_path:
+            stored, store_message = await store_output(output_path)
+            if not stored:
+                results[i] = (False, store_message, None)
+    
+    conversion_time_ms = int((time.time() - start_time) * 1000)
+    job["outputs"] = []
+    for target, (success, message, output_path) in zip(targets, results):
+        output_file_id = output_path.name.split('.')[0] if output_path else None
+        job["outputs"].append({
+            "target_format": target["format"],
+            "status": "completed" if success else "failed",
+            "message": message,
+            "output_file_id": output_file_id
+        })
+        await save_conversion_history(
+            request, output_file_id,
+            output_path.stat().st_size if output_path else 0,
+            conversion_time_ms,
+            error=None if success else message,
+            output_format=target["format"]
+        )
+    
+    succeeded = [o for o in job["outputs"] if o["status"] == "completed"]
+    job["progress"] = 100
+    job["status"] = "completed" if succeeded else "failed"
+    job["message"] = f"{len(succeeded)}/{len(targets)} çıktı oluşturuldu"
+    job["output_file_id"] = succeeded[0]["output_file_id"] if succeeded else None
+
+@api_router.get("/cache/stats")
+async def get_cache_stats():
+    """Conversion result cache counters"""
+    return await asyncio.to_thread(result_cache.stats)
+
+@api_router.get("/scheduler/stats")
+async def get_scheduler_stats():
+    """Admission queue and memory reservation counters"""
+    return scheduler.stats()
+
+@api_router.get("/history/stats")
+async def get_history_stats():
+    """Buffered and written conversion history counters"""
+    return history_writer.stats()
+
+# ============ PROGRESS STREAM ENDPOINTS ============
+def format_sse(event: str, data: Dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+async def stream_progress(
+    http_request: Request,
+    subscription: Subscription,
+    jobs: List[Dict[str, Any]],
+    client_id: Optional[str] = None
+):
+    """Server-Sent Events for a set of jobs; a client stream also follows new jobs"""
+    loop = asyncio.get_running_loop()
+    sent: Dict[str, tuple] = {}
+    client_seen = max((job["created_at"] for job in jobs), default=time.time() - PROGRESS_CLIENT_WINDOW)
+    
+    def fresh(event: Dict[str, Any]) -> bool:
+        """True when the event tells the client something new"""
+        previous = sent.get(event["conversion_id"])
+        if previous and previous[0] == event["status"] and previous[1] > (event["progress"] or 0):
+            return False  # an older store read racing a local update
+        state = (event["status"], event["progress"] or 0, event["message"])
+        if state == previous:
+            return False
+        sent[event["conversion_id"]] = state
+        return True
+    
+    def finished() -> bool:
+        return all(state[0] in FINISHED_STATUSES for state in sent.values())
+    
+    try:
+        yield f"retry: {int(PROGRESS_POLL_SECONDS * 3000)}\n\n"
+        for job in jobs:
+            event = job_event(job)
+            if fresh(event):
+                yield format_sse("progress", event)
+        
+        next_poll = loop.time() + PROGRESS_POLL_SECONDS
+        next_keepalive = loop.time() + PROGRESS_KEEPALIVE_SECONDS
+        while client_id or not finished():
+            if await http_request.is_disconnected():
+                return
+            events = [e for e in await subscription.get(max(0.0, next_poll - loop.time())) if fresh(e)]
+            
+            if loop.time() >= next_poll:
+                # Jobs run by other processes only reach us through the store
+                remote = [
+                    job_id for job_id, state in sent.items()
+                    if state[0] not in FINISHED_STATUSES and job_id not in progress_bus.local_jobs
+                ]
+                polled = await job_store.get_jobs(remote) if remote else []
+                if client_id:
+                    for job in await job_store.get_client_jobs(client_id, client_seen):
+                        client_seen = max(client_seen, job["created_at"])
+                        polled.append(job)
+                events.extend(e for e in map(job_event, polled) if fresh(e))
+                next_poll = loop.time() + PROGRESS_POLL_SECONDS
+            
+            for event in events:
+                yield format_sse("progress", event)
+            if events:
+                next_keepalive = loop.time() + PROGRESS_KEEPALIVE_SECONDS
+            elif loop.time() >= next_keepalive:
+                yield ": keep-alive\n\n"
+                next_keepalive = loop.time() + PROGRESS_KEEPALIVE_SECONDS
+        
+        yield format_sse("end", {"finished": len(sent)})
+    finally:
+        progress_bus.unsubscribe(subscription)
+
+def sse_response(events) -> StreamingResponse:
+    return StreamingResponse(
+        events,
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@api_router.get("/convert/status/{conversion_id}/events")
+async def stream_conversion_progress(conversion_id: str, http_request: Request):
+    """Stream one job's progress until it finishes"""
+    subscription = progress_bus.subscribe(job_ids={conversion_id})
+    job = await job_store.get_job(conversion_id)
+    if not job:
+        progress_bus.unsubscribe(subscription)
+        raise HTTPException(status_code=404, detail="Conversion job not found")
+    return sse_response(stream_progress(http_request, subscription, [job]))
+
+@api_router.get("/convert/batch/{batch_id}/events")
+async def stream_batch_progress(batch_id: str, http_request: Request):
+    """Stream the progress of every job in a batch until all finish"""
+    subscription = progress_bus.subscribe(batch_id=batch_id)
+    batch = await job_store.get_batch(batch_id)
+    if not batch:
+        progress_bus.unsubscribe(subscription)
+        raise HTTPException(status_code=404, detail="Batch not found")
+    jobs = await job_store.get_jobs(batch["conversion_ids"])
+    return sse_response(stream_progress(http_request, subscription, jobs))
+
+@api_router.get("/convert/events")
+async def stream_client_progress(
+    http_request: Request,
+    client_id: Optional[str] = None,
+    x_client_id: Optional[str] = Header(None)
+):
+    """Stream every job of a client (X-Client-Id on /convert); stays open for new jobs"""
+    # EventSource cannot set headers, so browsers pass the id as a query parameter
+    client_id = client_id or x_client_id
+    if not client_id:
+        raise HTTPException(status_code=400, detail="client_id is required")
+    subscription = progress_bus.subscribe(client_id=client_id)
+    jobs = await job_store.get_client_jobs(client_id, time.time() - PROGRESS_CLIENT_WINDOW)
+    return sse_response(stream_progress(http_request, subscription, jobs, client_id))
+
 # ============ DOWNLOAD ENDPOINTS ============
 @api_router.get("/download/{output_file_id}")
-async def download_file(output_file_id: str, background_tasks: BackgroundTasks):
-    """Download converted file"""
+async def download_file(output_file_id: str, http_request: Request):
+    """Download converted file (supports Range and conditional requests)"""
     try:
         logger.info(f"Download request: {output_file_id}")
         
-        # Find the output file
-        output_path = None
-        for file in Path(CONVERTED_DIR).glob(f"{output_file_id}*"):
-            if file.is_file():
-                output_path = file
-                break
+        # Object storage serves the bytes (and Range/conditional requests) itself
+        if conversion_service.storage.remote:
+            url = await asyncio.to_thread(conversion_service.presigned_url, output_file_id, S3_PRESIGN_SECONDS)
+            if not url:
+                raise HTTPException(status_code=404, detail="File not found")
+            return RedirectResponse(url, status_code=307)
         
-        if not output_path or not output_path.exists():
+        # Path, size and MIME type come from the output index, not the directory
+        entry = conversion_service.index.get(output_file_id)
+        if not entry:
             raise HTTPException(status_code=404, detail="File not found")
         
-        # Get MIME type
-        mime_type, _ = mimetypes.guess_type(str(output_path))
-        if not mime_type:
-            mime_type = "application/octet-stream"
-        
-        # Schedule file cleanup after download
-        background_tasks.add_task(cleanup_old_files, days=1)
+        # Outputs never change under their ID, so the content digest is a strong validator
+        digest = entry.digest or await asyncio.to_thread(conversion_service.index.digest, entry)
         
-        return FileResponse(
-            path=output_path,
-            media_type=mime_type,
-            filename=output_path.name
+        return file_response(
+            http_request,
+            entry.path,
+            entry.stat,
+            entry.mime_type,
+            content_etag(digest),
+            filename=entry.path.name
         )
     
     except HTTPException:
@@ -376,23 +1015,65 @@ async def download_file(output_file_id: str, background_tasks: BackgroundTasks):
         logger.error(f"Download error: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Download failed: {str(e)}")
 
+async def collect_zip_entries(output_file_ids: List[str], batch_id: Optional[str]) -> List[tuple]:
+    """Resolve output ids (and/or a batch) to (path, archive name) pairs"""
+    wanted = []  # (output_file_id, preferred name stem)
+    if batch_id:
+        batch = await job_store.get_batch(batch_id)
+        if not batch:
+            raise HTTPException(status_code=404, detail="Batch not found")
+        for job in await job_store.get_jobs(batch["conversion_ids"]):
+            if job.get("output_file_id"):
+                wanted.append((job["output_file_id"], Path(job["original_filename"]).stem))
+    wanted.extend((output_file_id, None) for output_file_id in output_file_ids)
+    
+    paths, names = [], []
+    for output_file_id, stem in wanted:
+        output_path = await asyncio.to_thread(conversion_service.get_output_file, output_file_id)
+        if not output_path:
+            raise HTTPException(status_code=404, detail=f"File not found: {output_file_id}")
+        paths.append(output_path)
+        names.append(f"{stem}{output_path.suffix}" if stem else output_path.name)
+    
+    if not paths:
+        raise HTTPException(status_code=404, detail="No converted files to download")
+    return list(zip(paths, unique_names(names)))
+
+@api_router.post("/download/zip")
+async def download_zip(request: ZipDownloadRequest):
+    """Stream several converted files as one ZIP archive"""
+    entries = await collect_zip_entries(request.output_file_ids, request.batch_id)
+    logger.info(f"ZIP download: {len(entries)} files")
+    
+    archive_name = f"ryloze-{request.batch_id or 'files'}.zip"
+    return StreamingResponse(
+        iter_zip(entries),
+        media_type="application/zip",
+        headers={"Content-Disposition": f'attachment; filename="{archive_name}"'}
+    )
+
+@api_router.get("/download/batch/{batch_id}/zip")
+async def download_batch_zip(batch_id: str):
+    """Stream every finished output of a batch as one ZIP archive"""
+    return await download_zip(ZipDownloadRequest(batch_id=batch_id))
+
 # ============ UTILITY FUNCTIONS ============
 async def save_conversion_history(
-    db,
     request: ConversionRequest,
     output_file_id: Optional[str],
     output_size: int,
     conversion_time_ms: int,
-    error: Optional[str] = None
+    error: Optional[str] = None,
+    output_format: Optional[str] = None
 ):
-    """Save conversion history to database"""
+    """Queue a conversion history record; it is written to the database in batches"""
     try:
         history = {
             "id": str(uuid.uuid4()),
             "original_filename": request.original_filename,
             "file_type": request.file_type,
             "input_format": request.original_filename.split('.')[-1],
-            "output_format": request.target_format,
+            "output_format": output_format or request.target_format,
             "output_filename": output_file_id,
             "output_size": output_size,
             "status": "failed" if error else "completed",
@@ -402,25 +1083,93 @@ async def save_conversion_history(
             "created_at": datetime.now(timezone.utc).isoformat()
         }
         
-        await db.conversion_history.insert_one(history)
-        logger.info(f"Conversion history saved: {history['id']}")
+        await history_writer.add(history)
     except Exception as e:
         logger.error(f"Failed to save conversion history: {str(e)}")
 
-def cleanup_old_files(days: int = 7):
-    """Clean up old files (synchronous function for background task)"""
+async def expire_files_periodically():
+    """Janitor: delete outputs and uploads past their TTL, in rate-limited batches"""
+    next_orphan_sweep = 0.0
+    while True:
+        try:
+            for name, store in (("outputs", conversion_service), ("uploads", file_handler)):
+                while True:
+                    # Only files that are due are visited (see FileIndex.due)
+                    deleted = await asyncio.to_thread(store.delete_expired, FILE_EXPIRY_BATCH)
+                    if deleted:
+                        logger.info(f"Deleted {deleted} expired {name}")
+                    if deleted < FILE_EXPIRY_BATCH:
+                        break
+                    await asyncio.sleep(FILE_EXPIRY_BATCH / FILE_EXPIRY_RATE)
+            # Listing every stored blob is costly, so orphans are looked for once per grace period
+            if upload_storage.remote and time.monotonic() >= next_orphan_sweep:
+                next_orphan_sweep = time.monotonic() + ORPHAN_BLOB_GRACE_SECONDS
+                deleted = await asyncio.to_thread(file_handler.delete_orphaned_blobs, ORPHAN_BLOB_GRACE_SECONDS)
+                if deleted:
+                    logger.info(f"Deleted {deleted} orphaned upload blobs")
+        except Exception as e:
+            logger.error(f"File expiry error: {str(e)}")
+        await asyncio.sleep(FILE_EXPIRY_INTERVAL)
+
+# Jobs expired (and archived) per store call
+JOB_EXPIRY_BATCH = 1000
+
+async def expire_jobs_periodically():
+    """Expire finished jobs past their TTL or over the record cap, archiving them if enabled"""
+    while True:
+        try:
+            while True:
+                expired = await job_store.expire_jobs(JOB_TTL_SECONDS, JOB_MAX_RECORDS, JOB_EXPIRY_BATCH)
+                if expired:
+                    logger.info(f"Expired {len(expired)} finished jobs")
+                    if JOB_ARCHIVE:
+                        await archive_jobs(expired)
+                if len(expired) < JOB_EXPIRY_BATCH:
+                    break
+        except Exception as e:
+            logger.error(f"Job expiry error: {str(e)}")
+        await asyncio.sleep(JOB_EXPIRY_INTERVAL)
+
+async def archive_jobs(jobs: List[Dict[str, Any]]):
+    """Keep expired job records in the job history collection"""
     try:
-        import time
-        cutoff_time = time.time() - (days * 24 * 60 * 60)
-        
-        for root, dirs, files in os.walk(CONVERTED_DIR):
-            for file in files:
-                file_path = Path(root) / file
-                if os.path.getmtime(str(file_path)) < cutoff_time:
-                    os.remove(str(file_path))
-                    logger.info(f"Deleted old file: {file}")
+        await db.conversion_job_history.insert_many(
+            [{**{k: v for k, v in job.items() if k != "id"}, "_id": job["id"]} for job in jobs],
+            ordered=False
+        )
     except Exception as e:
-        logger.error(f"Cleanup error: {str(e)}")
+        # Records already archived by another process are duplicates; nothing else is retried
+        logger.error(f"Failed to archive expired jobs: {str(e)}")
+
+def publish_claimed_job(job: Dict[str, Any]):
+    """Stream this process's jobs from the bus instead of the store"""
+    progress_bus.local_jobs.add(job["id"])
+    progress_bus.publish(job)
+
+def publish_finished_job(job: Dict[str, Any], recorded: bool):
+    """Announce a result once it is in the store, so streams and status reads agree"""
+    progress_bus.local_jobs.discard(job["id"])
+    if recorded:
+        progress_bus.publish(job)
+
+async def start_conversion_worker():
+    """Start the worker pool and begin claiming jobs from the store"""
+    global dispatcher
+    await worker_pool.start()
+    dispatcher = JobDispatcher(
+        job_store, process_job, CONVERSION_WORKERS,
+        lease_seconds=JOB_LEASE_SECONDS, max_attempts=JOB_MAX_ATTEMPTS,
+        bulk_slots=BULK_CONVERSION_SLOTS, on_claim=publish_claimed_job, on_finish=publish_finished_job
+    )
+    dispatcher.start()
+
+async def stop_conversion_worker():
+    """Stop claiming jobs; unfinished ones are requeued once their lease expires"""
+    global dispatcher
+    if dispatcher:
+        await dispatcher.stop()
+        dispatcher = None
+    worker_pool.shutdown()
 
 # ============ ROUTER INCLUSION ============
 app.include_router(api_router)
@@ -430,6 +1179,12 @@ app.include_router(api_router)
 async def shutdown_db_client():
     """Close database connection on shutdown"""
     logger.info("Shutting down database connection")
+    for task in (job_expiry_task, file_expiry_task):
+        if task:
+            task.cancel()
+    await stop_conversion_worker()
+    await history_writer.close()
+    job_store.close()
     client.close()
 
 @app.on_event("startup")
@@ -439,5 +1194,13 @@ async def startup_event():
     # Create necessary directories
     Path(UPLOAD_DIR).mkdir(parents=True, exist_ok=True)
     Path(CONVERTED_DIR).mkdir(parents=True, exist_ok=True)
+    upload_sessions.cleanup_stale_sessions()
+    indexed = file_handler.index.rebuild() + conversion_service.index.rebuild()
+    logger.info(f"Indexed {indexed} stored files")
+    global job_expiry_task, file_expiry_task
+    job_expiry_task = asyncio.create_task(expire_jobs_periodically())
+    file_expiry_task = asyncio.create_task(expire_files_periodically())
+    if RUN_CONVERSION_WORKER:
+        await start_conversion_worker()
     logger.info(f"Upload dir: {UPLOAD_DIR}")
     logger.info(f"Converted dir: {CONVERTED_DIR}")
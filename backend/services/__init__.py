@@ -1,5 +1,17 @@
 """Services package for file handling and conversion"""
 from .file_handler import FileHandler
 from .conversion_service import ConversionService
+from .upload_session import UploadSessionManager
+from .worker_pool import ConversionWorkerPool
+from .result_cache import ResultCache
+from .scheduler import AdmissionScheduler
+from .job_store import JobStore, create_job_store
+from .job_dispatcher import JobDispatcher
+from .progress_bus import ProgressBus
+from .file_index import FileIndex
+from .storage import StorageBackend, create_storage
+from .history_writer import HistoryWriter
 
-__all__ = ['FileHandler', 'ConversionService']
+__all__ = ['FileHandler', 'ConversionService', 'UploadSessionManager', 'ConversionWorkerPool', 'ResultCache', 'AdmissionScheduler',
+           'JobStore', 'create_job_store', 'JobDispatcher', 'ProgressBus', 'FileIndex',
+           'StorageBackend', 'create_storage', 'HistoryWriter']
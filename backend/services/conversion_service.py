@@ -1,83 +1,613 @@
 """
 File conversion service for handling image and document conversions
 """
+import logging
 import os
+import shutil
+import time
 from pathlib import Path
-from typing import Optional
+from typing import Optional, Callable
 import uuid
-from PIL import Image
+from PIL import Image, ImageSequence, TiffImagePlugin
+from concurrent.futures import ThreadPoolExecutor
 import io
+import itertools
+import math
+from .docx_writer import DocxStreamWriter
+from .file_index import FileIndex
+from .file_probe import MODE_BYTES
+from .sharding import shard_dir, sharded_path
+from .storage import LocalStorage, StorageBackend
+from .tiled_image import STRIP_BYTES, STRIP_WRITERS, StripReader
+
+logger = logging.getLogger(__name__)
+
+# progress(percent, message), called from inside long conversions
+ProgressCallback = Callable[[int, str], None]
+
+# PDF -> DOCX rasterization defaults
+PDF_DPI = 200
+PDF_PAGE_WINDOW = 4  # pages rasterized (and held in memory) at a time
+PDF_RASTER_THREADS = 2  # pdftoppm processes per window
+PDF_TEXT_MIN_CHARS = 20  # below this a page is treated as scanned
+
+# Large image handling defaults
+LARGE_IMAGE_PIXELS = 50_000_000  # above this images are converted in strips
+MAX_IMAGE_PIXELS = 2_000_000_000  # refuse anything larger outright
+IMAGE_MEMORY_LIMIT = 1024 * 1024 * 1024  # 1GB, largest raster held in memory at once
+
+# Formats whose extra frames are animation frames or pages; as targets they
+# can hold them all. (MPO's second frame is a preview, not content.)
+MULTI_FRAME_FORMATS = {'GIF', 'WEBP', 'PNG', 'TIFF'}
+
+# Targets only documents convert to
+DOCUMENT_TARGETS = {'PDF', 'DOCX'}
+
+# Targets images convert to (see _encode_image)
+IMAGE_TARGETS = ('JPEG', 'PNG', 'WEBP', 'GIF', 'TIFF', 'BMP', 'ICO')
+
+# Every output is named `<output_file_id>.<target in lower case>`
+OUTPUT_SUFFIXES = tuple(f".{target.lower()}" for target in (*IMAGE_TARGETS, *sorted(DOCUMENT_TARGETS)))
+
+# Defaults of the options each kind of conversion reads. Conversions and
+# result cache keys (result_cache.normalize_options) both fill options in
+# from here, so a request that spells out a default shares its key.
+OPTION_DEFAULTS = {
+    'image': {'quality': 90, 'resize': False},
+    'document': {
+        'quality': 85,
+        'dpi': PDF_DPI,
+        'image_format': 'png',
+        'page_window': PDF_PAGE_WINDOW,
+        'text_layer': True
+    },
+}
+
+def with_defaults(file_type: str, options: Optional[dict]) -> dict:
+    """Conversion options with every default filled in"""
+    return {**OPTION_DEFAULTS.get(file_type, {}), **(options or {})}
+
+def link_or_copy(source: Path, target: Path):
+    """Hard-link source as target, or copy it where a link is impossible (another filesystem).
+
+    Like os.link, raises FileExistsError when target exists; a copy only
+    appears under target once it is complete.
+    """
+    try:
+        os.link(source, target)
+        return
+    except FileExistsError:
+        raise
+    except OSError as e:
+        logger.warning(f"Cannot link {source} to {target} ({e.strerror}); copying instead")
+    temp_path = target.with_name(f".{uuid.uuid4()}.tmp")
+    try:
+        shutil.copy2(source, temp_path)
+        os.link(temp_path, target)
+    finally:
+        temp_path.unlink(missing_ok=True)
+
+class _LazyFrames:
+    """Re-iterable frame source; every pass decodes the frames again"""
+    def __init__(self, factory: Callable):
+        self._factory = factory
+    
+    def __iter__(self):
+        return self._factory()
 
 class ConversionService:
-    def __init__(self, output_dir: str):
+    def __init__(
+        self,
+        output_dir: str,
+        large_image_pixels: int = LARGE_IMAGE_PIXELS,
+        max_image_pixels: int = MAX_IMAGE_PIXELS,
+        memory_limit: int = IMAGE_MEMORY_LIMIT,
+        output_ttl: Optional[float] = None,
+        storage: Optional[StorageBackend] = None
+    ):
         self.output_dir = Path(output_dir)
         self.output_dir.mkdir(parents=True, exist_ok=True)
+        self.large_image_pixels = large_image_pixels
+        self.max_image_pixels = max_image_pixels
+        self.memory_limit = memory_limit
+        # output_file_id -> output; only the API process rebuilds and serves from it.
+        # With output_ttl, outputs are deleted that long after being written by delete_expired().
+        self.index = FileIndex([self.output_dir], output_ttl, created_of=self._created_of, locate=self._output_paths)
+        self.storage = storage or LocalStorage(self.output_dir)
+    
+    def _output_path(self, name: str) -> Path:
+        """New output file in its shard of the output directory"""
+        return sharded_path(self.output_dir, name, create=True)
+    
+    def _output_paths(self, file_id: str) -> list[Path]:
+        """Every path an output the index does not know (written elsewhere) can have"""
+        return [
+            directory / f"{file_id}{suffix}"
+            for directory in (shard_dir(self.output_dir, file_id), self.output_dir)
+            for suffix in OUTPUT_SUFFIXES
+        ]
+    
+    def convert(
+        self,
+        file_type: str,
+        file_path: Path,
+        target_format: str,
+        options: Optional[dict] = None,
+        progress: Optional[ProgressCallback] = None
+    ) -> tuple[bool, str, Optional[Path]]:
+        """Run a conversion job (entry point for pool workers)"""
+        options = with_defaults(file_type, options)
+        if file_type == 'image':
+            return self.convert_image(
+                file_path,
+                target_format,
+                quality=options['quality'],
+                resize=options['resize'],
+                width=options.get('width'),
+                height=options.get('height'),
+                resize_mode=options.get('resize_mode'),
+                max_dimension=options.get('max_dimension'),
+                progress=progress
+            )
+        elif file_type == 'document':
+            return self.convert_document(file_path, target_format, options, progress)
+        return False, "Desteklenmeyen dosya türü", None
     
     # ============ IMAGE CONVERSIONS ============
     
-    async def convert_image(
+    def _plan_resize(
+        self,
+        source_size: tuple[int, int],
+        resize: bool,
+        width: Optional[int],
+        height: Optional[int],
+        resize_mode: Optional[str],
+        max_dimension: Optional[int]
+    ) -> Optional[tuple[tuple[int, int], tuple[float, float, float, float]]]:
+        """Work out the output size and the source box it is sampled from.
+        
+        Modes: 'exact' (width x height), 'fit' (inside the box, keeps aspect),
+        'fill' (covers the box, center-cropped) and 'max' (longest side
+        <= max_dimension, never upscales). Returns None when no resize applies.
+        """
+        src_w, src_h = source_size
+        full_box = (0.0, 0.0, float(src_w), float(src_h))
+        width = int(width) if width else None
+        height = int(height) if height else None
+        
+        if max_dimension and (resize_mode == 'max' or not resize):
+            scale = min(int(max_dimension) / max(src_w, src_h), 1.0)
+            if scale >= 1.0:
+                return None
+            return (max(1, round(src_w * scale)), max(1, round(src_h * scale))), full_box
+        
+        if not resize or not (width or height):
+            return None
+        
+        mode = resize_mode or ('exact' if width and height else 'fit')
+        if mode == 'exact' and width and height:
+            return (width, height), full_box
+        
+        if mode == 'fill' and width and height:
+            scale = max(width / src_w, height / src_h)
+            crop_w, crop_h = width / scale, height / scale
+            left, top = (src_w - crop_w) / 2, (src_h - crop_h) / 2
+            return (width, height), (left, top, left + crop_w, top + crop_h)
+        
+        # 'fit' (also used when only one side is given)
+        scale = min(width / src_w if width else float('inf'), height / src_h if height else float('inf'))
+        return (max(1, round(src_w * scale)), max(1, round(src_h * scale))), full_box
+    
+    def _shrink_on_load(
+        self,
+        img: Image.Image,
+        size: tuple[int, int],
+        box: tuple[float, float, float, float]
+    ) -> Image.Image:
+        """Downscale using decoder-level scaling first, then reduce-and-resample"""
+        src_w, src_h = img.size
+        box_w, box_h = box[2] - box[0], box[3] - box[1]
+        
+        # JPEG: let the decoder scale by 1/2, 1/4 or 1/8 in the DCT domain
+        # (draft keeps the result at least as large as requested)
+        if img.format == 'JPEG':
+            needed = (max(1, int(size[0] * src_w / box_w)), max(1, int(size[1] * src_h / box_h)))
+            img.draft(img.mode, needed)
+            scale_x, scale_y = img.size[0] / src_w, img.size[1] / src_h
+            box = (box[0] * scale_x, box[1] * scale_y, box[2] * scale_x, box[3] * scale_y)
+        
+        if img.mode == 'P':
+            img = img.convert('RGBA')
+        
+        # reducing_gap: cheap integer box reduction down to ~2x the target, then LANCZOS
+        return img.resize(size, Image.Resampling.LANCZOS, box=box, reducing_gap=2.0)
+    
+    def convert_image(
         self,
         file_path: Path,
         target_format: str,
         quality: int = 90,
         resize: bool = False,
         width: Optional[int] = None,
-        height: Optional[int] = None
+        height: Optional[int] = None,
+        resize_mode: Optional[str] = None,
+        max_dimension: Optional[int] = None,
+        progress: Optional[ProgressCallback] = None
     ) -> tuple[bool, str, Optional[Path]]:
         """Convert image to target format"""
         try:
-            # Open image
+            # Open image (header only; pixels are decoded on first use)
             img = Image.open(str(file_path))
+            target = target_format.upper()
             
-            # Convert RGBA to RGB if target is JPEG
-            if target_format.upper() == 'JPEG' and img.mode in ('RGBA', 'LA', 'P'):
-                rgb_img = Image.new('RGB', img.size, (255, 255, 255))
-                rgb_img.paste(img, mask=img.split()[-1] if img.mode == 'RGBA' else None)
-                img = rgb_img
+            pixels = img.width * img.height
+            if pixels > self.max_image_pixels:
+                return False, f"Görüntü çok büyük: {img.width}x{img.height} (en fazla {self.max_image_pixels} piksel)", None
             
-            # Resize if requested
-            if resize and width and height:
-                img = img.resize((int(width), int(height)), Image.Resampling.LANCZOS)
+            # Animated GIF/WEBP/PNG and multi-page TIFF keep all their frames;
+            # frames above the large-image threshold take the strip path (first frame only)
+            plan_for = lambda size: self._plan_for_target(
+                size, target, resize, width, height, resize_mode, max_dimension
+            )
+            if (
+                img.format in MULTI_FRAME_FORMATS and getattr(img, 'is_animated', False)
+                and target in MULTI_FRAME_FORMATS and pixels <= self.large_image_pixels
+            ):
+                return self._convert_frames(img, target, quality, img.n_frames, plan_for, progress)
             
-            # Save converted image
-            output_filename = f"{uuid.uuid4()}.{target_format.lower()}"
-            output_path = self.output_dir / output_filename
+            if pixels > self.large_image_pixels:
+                return self._convert_large_image(img, target_format, quality, plan_for(img.size), progress)
             
-            if target_format.upper() == 'JPEG':
-                img.save(str(output_path), format='JPEG', quality=quality, optimize=True)
-            elif target_format.upper() in ['PNG', 'WEBP', 'GIF', 'TIFF', 'BMP']:
-                img.save(str(output_path), format=target_format.upper(), quality=quality if target_format.upper() == 'WEBP' else None)
-            elif target_format.upper() == 'ICO':
-                img.thumbnail((256, 256), Image.Resampling.LANCZOS)
-                img.save(str(output_path), format='ICO')
-            else:
-                return False, f"Desteklenmeyen format: {target_format}", None
+            # Resize before any mode conversion so the rest works on the small image
+            plan = self._plan_for_target(img.size, target, resize, width, height, resize_mode, max_dimension)
+            if plan:
+                img = self._shrink_on_load(img, *plan)
             
-            return True, "Görüntü başarıyla dönüştürüldü", output_path
+            return self._encode_image(img, target_format, quality)
         except Exception as e:
             return False, f"Görüntü dönüştürme hatası: {str(e)}", None
     
+    def _convert_frames(
+        self,
+        img: Image.Image,
+        target: str,
+        quality: int,
+        frame_count: int,
+        plan_for: Callable,
+        progress: Optional[ProgressCallback] = None
+    ) -> tuple[bool, str, Optional[Path]]:
+        """Convert a multi-frame image one frame at a time.
+        
+        Frames are decoded, resized and handed to the encoder from a
+        generator, so the source sequence is never held in memory. TIFF
+        pages are written to disk as they come, each at its own size; the
+        GIF, WEBP and APNG encoders keep their (already resized) frames
+        until the file is assembled, so those need to fit the memory limit,
+        and pages that differ in size from the first (e.g. TIFF thumbnail
+        pages) are left out.
+        """
+        canvas = img.size
+        if target != 'TIFF':
+            plan = plan_for(canvas)
+            out_w, out_h = plan[0] if plan else canvas
+            if out_w * out_h * 4 * frame_count > self.memory_limit:
+                return False, (
+                    f"{frame_count} karelik {out_w}x{out_h} {target} çıktısı bellek sınırını aşıyor; "
+                    f"TIFF seçin veya boyutlandırın"
+                ), None
+        
+        output_path = self._output_path(f"{uuid.uuid4()}.{target.lower()}")
+        loop = img.info.get('loop')
+        durations: list[int] = []
+        
+        def frames():
+            durations.clear()
+            for index, frame in enumerate(ImageSequence.Iterator(img)):
+                if target == 'TIFF' or frame.size == canvas:
+                    # Seeking reuses the source image, so every frame becomes its own copy
+                    plan = plan_for(frame.size)
+                    out = self._shrink_on_load(frame, *plan) if plan else frame.copy()
+                    if target in ('PNG', 'WEBP') and out.mode != 'RGBA':
+                        # Later GIF frames are RGB(A); keep every frame in one mode
+                        out = out.convert('RGBA')
+                    # Read after decoding: WEBP fills in frame info on load
+                    durations.append(frame.info.get('duration', 0))
+                    out.info['duration'] = durations[-1]
+                else:
+                    out = None
+                if progress:
+                    progress(int((index + 1) * 100 / frame_count), f"Kare {index + 1}/{frame_count}")
+                if out is not None:
+                    yield out
+        
+        if target == 'TIFF':
+            try:
+                with open(str(output_path), 'w+b') as fp, TiffImagePlugin.AppendingTiffWriter(fp) as tiff:
+                    for frame in frames():
+                        frame.save(tiff, format='TIFF')
+                        tiff.newFrame()
+            except BaseException:
+                # Interrupted (error or cancellation): leave no partial file behind
+                output_path.unlink(missing_ok=True)
+                raise
+            return True, f"{frame_count} sayfa başarıyla dönüştürüldü", output_path
+        
+        first = next(frames())
+        # The APNG encoder walks append_images twice (sizes first, then pixels)
+        sequence = _LazyFrames(lambda: itertools.islice(frames(), 1, None))
+        save_options = {}
+        if target == 'GIF':
+            # GIF and APNG read each frame's own duration from its info
+            if loop is not None:
+                save_options['loop'] = loop
+        else:
+            # No loop in the source means play once (0 would loop forever)
+            save_options['loop'] = loop if loop is not None else 1
+        if target == 'WEBP':
+            # The WEBP encoder drains append_images before it reads duration,
+            # so this list is complete by the time it is used
+            save_options.update(quality=quality, duration=durations)
+        
+        try:
+            first.save(str(output_path), format=target, save_all=True, append_images=sequence, **save_options)
+        except BaseException:
+            output_path.unlink(missing_ok=True)
+            raise
+        # The last pass over the frames saw every frame that was written
+        return True, f"{len(durations)} kare başarıyla dönüştürüldü", output_path
+    
+    def _convert_large_image(
+        self,
+        img: Image.Image,
+        target_format: str,
+        quality: int,
+        plan,
+        progress: Optional[ProgressCallback] = None
+    ) -> tuple[bool, str, Optional[Path]]:
+        """Convert an image above the large-image threshold in row bands.
+        
+        Uncompressed TIFF/BMP sources are read band by band; other sources
+        are decoded whole only if they fit in the memory limit (JPEG at a
+        reduced DCT scale when downscaling). Outputs that fit in memory are
+        assembled and encoded normally; larger PNG/TIFF outputs are written
+        band by band, and anything else is refused.
+        """
+        target = target_format.upper()
+        size, box = plan or (img.size, (0.0, 0.0, float(img.width), float(img.height)))
+        # Mode the bands are worked in (palette and bilevel cannot be resampled)
+        work_mode = {'P': 'RGBA', '1': 'L'}.get(img.mode, img.mode)
+        out_bytes = size[0] * size[1] * MODE_BYTES.get(work_mode, 4)
+        writer_cls = STRIP_WRITERS.get(target) if out_bytes > self.memory_limit else None
+        if out_bytes > self.memory_limit and writer_cls is None:
+            return False, (
+                f"{size[0]}x{size[1]} {target} çıktısı bellek sınırını aşıyor; "
+                f"PNG/TIFF seçin veya boyutlandırın"
+            ), None
+        
+        reader = StripReader.open(img)
+        source = img
+        if reader is None:
+            if plan and img.format == 'JPEG':
+                needed = (
+                    max(1, int(size[0] * img.width / (box[2] - box[0]))),
+                    max(1, int(size[1] * img.height / (box[3] - box[1])))
+                )
+                src_w, src_h = img.size
+                img.draft(img.mode, needed)
+                scale_x, scale_y = img.width / src_w, img.height / src_h
+                box = (box[0] * scale_x, box[1] * scale_y, box[2] * scale_x, box[3] * scale_y)
+            decode_bytes = img.width * img.height * MODE_BYTES.get(img.mode, 4)
+            if decode_bytes > self.memory_limit:
+                return False, (
+                    f"{img.format} kaynağı ({img.width}x{img.height}) parça parça okunamıyor "
+                    f"ve bellek sınırını aşıyor; sıkıştırılmamış TIFF veya BMP kullanın"
+                ), None
+            img.load()
+        
+        def read(top: int, bottom: int) -> Image.Image:
+            band = reader.read(top, bottom) if reader else source.crop((0, top, source.width, bottom))
+            return band.convert(work_mode) if band.mode != work_mode else band
+        
+        src_w, src_h = img.size
+        scale_y = (box[3] - box[1]) / size[1]
+        src_rows = max(1, STRIP_BYTES // (src_w * 4))
+        out_rows = max(1, min(int(src_rows / scale_y), STRIP_BYTES // (size[0] * 4)))
+        # LANCZOS reaches 3 output pixels past each edge; overlap bands by that much
+        margin = math.ceil(3 * scale_y) + 1
+        
+        output_path = self._output_path(f"{uuid.uuid4()}.{target_format.lower()}")
+        writer = writer_cls(output_path, size, work_mode) if writer_cls else None
+        canvas = None
+        try:
+            for out_top in range(0, size[1], out_rows):
+                out_bottom = min(out_top + out_rows, size[1])
+                if plan:
+                    src_top = box[1] + out_top * scale_y
+                    src_bottom = box[1] + out_bottom * scale_y
+                    top = max(0, math.floor(src_top) - margin)
+                    band = read(top, min(src_h, math.ceil(src_bottom) + margin))
+                    band = band.resize(
+                        (size[0], out_bottom - out_top),
+                        Image.Resampling.LANCZOS,
+                        box=(box[0], src_top - top, box[2], src_bottom - top)
+                    )
+                else:
+                    band = read(out_top, out_bottom)
+                
+                if writer:
+                    writer.write(band)
+                else:
+                    if canvas is None:
+                        canvas = Image.new(band.mode, size)
+                    canvas.paste(band, (0, out_top))
+                if progress:
+                    progress(int(out_bottom * 100 / size[1]), f"Satır {out_bottom}/{size[1]}")
+        except BaseException:
+            if writer:
+                writer.close()
+                writer = None
+                output_path.unlink(missing_ok=True)
+            raise
+        finally:
+            if reader:
+                reader.close()
+            if writer:
+                writer.close()
+        
+        if writer:
+            return True, "Görüntü parça parça dönüştürüldü", output_path
+        return self._encode_image(canvas, target_format, quality)
+    
+    def _plan_for_target(
+        self,
+        source_size: tuple[int, int],
+        target: str,
+        resize: bool,
+        width: Optional[int],
+        height: Optional[int],
+        resize_mode: Optional[str],
+        max_dimension: Optional[int]
+    ):
+        """Resize plan for one output, including the ICO size cap"""
+        plan = self._plan_resize(source_size, resize, width, height, resize_mode, max_dimension)
+        
+        # ICO holds at most 256x256, so never decode more than that
+        if target == 'ICO':
+            if plan is None:
+                plan = self._plan_resize(source_size, False, None, None, 'max', 256)
+            elif max(plan[0]) > 256:
+                scale = 256 / max(plan[0])
+                plan = ((max(1, round(plan[0][0] * scale)), max(1, round(plan[0][1] * scale))), plan[1])
+        return plan
+    
+    def _encode_image(
+        self,
+        img: Image.Image,
+        target_format: str,
+        quality: int = 90
+    ) -> tuple[bool, str, Optional[Path]]:
+        """Encode an already decoded (and resized) image to a new output file"""
+        target = target_format.upper()
+        
+        # Convert RGBA to RGB if target is JPEG
+        if target == 'JPEG' and img.mode in ('RGBA', 'LA', 'P'):
+            if img.mode == 'P':
+                img = img.convert('RGBA')
+            rgb_img = Image.new('RGB', img.size, (255, 255, 255))
+            rgb_img.paste(img, mask=img.split()[-1])
+            img = rgb_img
+        
+        # Save converted image
+        output_filename = f"{uuid.uuid4()}.{target_format.lower()}"
+        output_path = self._output_path(output_filename)
+        
+        if target == 'JPEG':
+            img.save(str(output_path), format='JPEG', quality=quality, optimize=True)
+        elif target in ['PNG', 'WEBP', 'GIF', 'TIFF', 'BMP']:
+            img.save(str(output_path), format=target, quality=quality if target == 'WEBP' else None)
+        elif target == 'ICO':
+            img.thumbnail((256, 256), Image.Resampling.LANCZOS)
+            img.save(str(output_path), format='ICO')
+        else:
+            return False, f"Desteklenmeyen format: {target_format}", None
+        
+        return True, "Görüntü başarıyla dönüştürüldü", output_path
+    
+    def convert_image_multi(
+        self,
+        file_path: Path,
+        targets: list[dict],
+        max_threads: int = 4
+    ) -> list[tuple[bool, str, Optional[Path]]]:
+        """Decode a source once and encode it to several targets.
+        
+        Each target is a dict with 'format' plus the usual image options
+        (quality, resize, width, height, resize_mode, max_dimension).
+        Encoders run in threads; PIL releases the GIL while resampling and
+        encoding, so outputs are produced in parallel.
+        """
+        try:
+            img = Image.open(str(file_path))
+            if img.width * img.height > self.large_image_pixels:
+                # Decoding once would hold the whole raster; convert each target in strips
+                return [
+                    self.convert('image', file_path, target['format'], {
+                        **target, 'resize': target.get('resize', bool(target.get('width') or target.get('height')))
+                    })
+                    for target in targets
+                ]
+            
+            def plan(target: dict, size: tuple[int, int]):
+                return self._plan_for_target(
+                    size,
+                    target['format'].upper(),
+                    target.get('resize', bool(target.get('width') or target.get('height'))),
+                    target.get('width'),
+                    target.get('height'),
+                    target.get('resize_mode'),
+                    target.get('max_dimension')
+                )
+            
+            # JPEG: decode at the smallest DCT scale the largest output still allows
+            plans = [plan(target, img.size) for target in targets]
+            if img.format == 'JPEG' and all(plans):
+                scale = max(
+                    max(size[0] / (box[2] - box[0]), size[1] / (box[3] - box[1]))
+                    for size, box in plans
+                )
+                img.draft(img.mode, (max(1, int(img.width * scale)), max(1, int(img.height * scale))))
+            img.load()
+            if img.mode == 'P':
+                img = img.convert('RGBA')
+        except Exception as e:
+            return [(False, f"Görüntü dönüştürme hatası: {str(e)}", None)] * len(targets)
+        
+        def produce(target: dict) -> tuple[bool, str, Optional[Path]]:
+            try:
+                target_plan = plan(target, img.size)
+                # save() keeps per-call state on the image, so threads never share one
+                out = self._shrink_on_load(img, *target_plan) if target_plan else img.copy()
+                return self._encode_image(
+                    out, target['format'], target.get('quality', OPTION_DEFAULTS['image']['quality'])
+                )
+            except Exception as e:
+                return False, f"Görüntü dönüştürme hatası: {str(e)}", None
+        
+        with ThreadPoolExecutor(max_workers=max(1, min(max_threads, len(targets)))) as executor:
+            return list(executor.map(produce, targets))
+    
     # ============ DOCUMENT CONVERSIONS ============
     
-    async def convert_document(
+    def convert_document(
         self,
         file_path: Path,
-        target_format: str
+        target_format: str,
+        options: Optional[dict] = None,
+        progress: Optional[ProgressCallback] = None
     ) -> tuple[bool, str, Optional[Path]]:
         """Convert document to target format"""
         try:
             file_ext = file_path.suffix.lower()
+            options = with_defaults('document', options)
             
             if file_ext in ['.docx', '.doc'] and target_format.upper() == 'PDF':
-                return await self._docx_to_pdf(file_path)
+                return self._docx_to_pdf(file_path)
             elif file_ext == '.pdf' and target_format.upper() == 'DOCX':
-                return await self._pdf_to_docx(file_path)
+                return self._pdf_to_docx(
+                    file_path,
+                    dpi=options['dpi'],
+                    image_format=options['image_format'],
+                    quality=options['quality'],
+                    page_window=options['page_window'],
+                    text_layer=options['text_layer'],
+                    progress=progress
+                )
             else:
                 return False, f"{file_ext} -> {target_format} dönüştürmesi desteklenmiyor", None
         except Exception as e:
             return False, f"Belge dönüştürme hatası: {str(e)}", None
     
-    async def _docx_to_pdf(self, docx_path: Path) -> tuple[bool, str, Optional[Path]]:
+    def _docx_to_pdf(self, docx_path: Path) -> tuple[bool, str, Optional[Path]]:
         """Convert DOCX to PDF"""
         try:
             try:
@@ -90,7 +620,7 @@ class ConversionService:
                 # Create a simple PDF-like text output
                 # For production, use: pip install python-pptx or libreoffice
                 output_filename = f"{uuid.uuid4()}.pdf"
-                output_path = self.output_dir / output_filename
+                output_path = self._output_path(output_filename)
                 
                 # Save as text for now (production should use proper PDF library)
                 with open(str(output_path), 'w', encoding='utf-8') as f:
@@ -100,58 +630,218 @@ class ConversionService:
                 return True, "DOCX başarıyla PDF'e dönüştürüldü", output_path
             
             output_filename = f"{uuid.uuid4()}.pdf"
-            output_path = self.output_dir / output_filename
+            output_path = self._output_path(output_filename)
             convert(str(docx_path), str(output_path))
             return True, "DOCX başarıyla PDF'e dönüştürüldü", output_path
         except Exception as e:
             return False, f"DOCX to PDF hatası: {str(e)}", None
     
-    async def _pdf_to_docx(self, pdf_path: Path) -> tuple[bool, str, Optional[Path]]:
-        """Convert PDF to DOCX"""
+    def _classify_pdf_pages(self, pdf_path: Path, text_layer: bool) -> tuple[int, dict[int, str]]:
+        """Return the page count and the text of pages that can skip rasterization.
+        
+        A page qualifies when it has an extractable text layer and no image
+        or form XObjects, so nothing visible is lost by writing it as
+        paragraphs.
+        """
+        try:
+            from PyPDF2 import PdfReader
+        except ImportError:
+            import pdf2image
+            return pdf2image.pdfinfo_from_path(str(pdf_path))["Pages"], {}
+        
+        reader = PdfReader(str(pdf_path))
+        texts = {}
+        if text_layer:
+            for number, page in enumerate(reader.pages, start=1):
+                if self._page_has_images(page):
+                    continue
+                text = page.extract_text() or ""
+                if len(text.strip()) >= PDF_TEXT_MIN_CHARS:
+                    texts[number] = text
+        return len(reader.pages), texts
+    
+    @staticmethod
+    def _page_has_images(page) -> bool:
+        resources = page.get('/Resources')
+        resources = resources.get_object() if resources is not None else {}
+        xobjects = resources.get('/XObject')
+        if xobjects is None:
+            return False
+        return any(
+            xobject.get_object().get('/Subtype') in ('/Image', '/Form')
+            for xobject in xobjects.get_object().values()
+        )
+    
+    def _pdf_to_docx(
+        self,
+        pdf_path: Path,
+        dpi: int = PDF_DPI,
+        image_format: str = 'png',
+        quality: int = 85,
+        page_window: int = PDF_PAGE_WINDOW,
+        text_layer: bool = True,
+        progress: Optional[ProgressCallback] = None
+    ) -> tuple[bool, str, Optional[Path]]:
+        """Convert PDF to DOCX.
+        
+        Born-digital pages become real paragraphs from the text layer. Only
+        scanned/image pages are rasterized, `page_window` at a time (each
+        window split across pdftoppm processes) while the previous window
+        is being encoded, so at most two windows of rasters are alive at
+        once whatever the page count. Each page picture goes straight into
+        the output file (docx_writer.py) instead of being kept until save.
+        """
         try:
             try:
                 import pdf2image
-                from PIL import Image
-                from docx import Document
-                from docx.shared import Inches
             except ImportError:
                 return False, "PDF → DOCX dönüştürme için gerekli kütüphaneler yüklü değil", None
             
-            # Convert PDF pages to images, then create DOCX with images
-            images = pdf2image.convert_from_path(str(pdf_path))
-            doc = Document()
+            image_format = 'JPEG' if image_format.lower() in ('jpg', 'jpeg') else 'PNG'
+            page_window = max(1, int(page_window))
+            page_count, texts = self._classify_pdf_pages(pdf_path, text_layer)
+            
+            # Runs of consecutive scanned pages, split into windows
+            windows = []
+            for number in range(1, page_count + 1):
+                if number in texts:
+                    continue
+                if windows and windows[-1][1] == number - 1 and windows[-1][1] - windows[-1][0] + 1 < page_window:
+                    windows[-1][1] = number
+                else:
+                    windows.append([number, number])
+            
+            def rasterize(window: list[int]):
+                return pdf2image.convert_from_path(
+                    str(pdf_path),
+                    dpi=dpi,
+                    first_page=window[0],
+                    last_page=window[1],
+                    thread_count=min(PDF_RASTER_THREADS, window[1] - window[0] + 1)
+                )
             
             output_filename = f"{uuid.uuid4()}.docx"
-            output_path = self.output_dir / output_filename
+            output_path = self._output_path(output_filename)
             
-            for i, image in enumerate(images):
-                # Save image to bytes
-                img_bytes = io.BytesIO()
-                image.save(img_bytes, format='PNG')
-                img_bytes.seek(0)
+            with ThreadPoolExecutor(max_workers=1) as prefetch, DocxStreamWriter(output_path) as doc:
+                pending = prefetch.submit(rasterize, windows[0]) if windows else None
+                next_window = 1
+                images = iter(())
                 
-                # Add to document
-                doc.add_paragraph(f"Page {i+1}")
-                doc.add_picture(img_bytes, width=Inches(6))
+                for page_number in range(1, page_count + 1):
+                    doc.add_paragraph(f"Page {page_number}")
+                    
+                    if page_number in texts:
+                        # Blank lines separate paragraphs; single line breaks are kept
+                        for block in texts.pop(page_number).split('\n\n'):
+                            if block.strip():
+                                doc.add_paragraph(block.strip())
+                    else:
+                        image = next(images, None)
+                        if image is None:
+                            images = iter(pending.result())
+                            # Rasterize the next window while this one is encoded
+                            pending = prefetch.submit(rasterize, windows[next_window]) if next_window < len(windows) else None
+                            next_window += 1
+                            image = next(images)
+                        
+                        # Encode the page and write it out before the next one
+                        img_bytes = io.BytesIO()
+                        if image_format == 'JPEG':
+                            image.convert('RGB').save(img_bytes, format='JPEG', quality=quality)
+                        else:
+                            image.save(img_bytes, format='PNG')
+                        doc.add_picture(img_bytes.getvalue(), image.size, image_format, width_inches=6)
+                        image.close()
+                    
+                    if progress:
+                        progress(int(page_number * 100 / page_count), f"Sayfa {page_number}/{page_count}")
             
-            doc.save(str(output_path))
             return True, "PDF başarıyla DOCX'e dönüştürüldü", output_path
         except Exception as e:
             return False, f"PDF to DOCX hatası: {str(e)}", None
     
+    @staticmethod
+    def _created_marker(output_path: Path) -> Path:
+        # Dot files are skipped by the index and the store walkers
+        return output_path.with_name(f".{output_path.name}.created")
+    
+    def _created_of(self, output_path: Path, stat: os.stat_result) -> float:
+        """Creation time of an output found on disk.
+        
+        A linked output shares its inode (and mtime) with the cache entry it
+        came from, so its own creation time is kept on a marker file.
+        """
+        try:
+            return self._created_marker(output_path).stat().st_mtime
+        except FileNotFoundError:
+            return stat.st_mtime
+    
+    def link_output(self, source_path: Path) -> Path:
+        """Expose an existing artifact (e.g. a cache entry) under a new output ID (blocking I/O)"""
+        output_path = self._output_path(f"{uuid.uuid4()}{source_path.suffix}")
+        link_or_copy(source_path, output_path)
+        self._created_marker(output_path).touch()
+        return output_path
+    
+    def _unlink(self, output_path: Path):
+        output_path.unlink(missing_ok=self.storage.remote)
+        self._created_marker(output_path).unlink(missing_ok=True)
+    
+    def register_output(self, output_path: Path) -> tuple[bool, str]:
+        """Index a new output and copy it to the storage backend (blocking I/O)"""
+        try:
+            self.index.add(output_path, time.time())
+            self.storage.upload(output_path)
+            return True, "Çıktı kaydedildi"
+        except Exception as e:
+            return False, f"Depolama hatası: {str(e)}"
+    
+    def _locate(self, file_id: str) -> Optional[Path]:
+        """Local path of an output, whether or not a local copy exists"""
+        entry = self.index.get(file_id)
+        if entry:
+            return entry.path
+        return self.storage.find(file_id)
+    
     def get_output_file(self, file_id: str) -> Optional[Path]:
-        """Get output file by ID"""
-        for file in self.output_dir.glob(f"{file_id}*"):
-            if file.is_file():
-                return file
-        return None
+        """Get output file by ID, fetching it from the storage backend if needed"""
+        file_path = self._locate(file_id)
+        if file_path and not file_path.exists():
+            if not self.storage.download(file_path):
+                return None
+            self.index.add(file_path)
+        return file_path
+    
+    def presigned_url(self, file_id: str, expires: int) -> Optional[str]:
+        """Direct download URL of an output, when the storage backend has them"""
+        if not self.storage.remote:
+            return None
+        file_path = self._locate(file_id)
+        return self.storage.presigned_url(file_path, expires) if file_path else None
+    
+    def delete_expired(self, limit: int) -> int:
+        """Delete up to `limit` outputs past their TTL; returns the count"""
+        deleted = 0
+        for file_id, entry in self.index.due(limit):
+            try:
+                self._unlink(entry.path)
+                self.storage.delete(entry.path)
+                deleted += 1
+            except FileNotFoundError:
+                pass
+            except Exception as e:
+                print(f"Çıktı dosyası silme hatası: {str(e)}")
+        return deleted
     
     def delete_output(self, file_id: str) -> bool:
         """Delete output file"""
         try:
-            file_path = self.get_output_file(file_id)
-            if file_path and file_path.exists():
-                os.remove(file_path)
+            file_path = self._locate(file_id)
+            if file_path and (file_path.exists() or self.storage.remote):
+                self._unlink(file_path)
+                self.index.remove(file_id)
+                self.storage.delete(file_path)
                 return True
             return False
         except Exception as e:
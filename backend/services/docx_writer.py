@@ -0,0 +1,132 @@
+"""
+Append-only DOCX writer.
+
+python-docx keeps every part of a document, pictures included, in memory
+until save(). Here each picture is written into the archive as soon as it
+is added and paragraphs are spooled to a temporary file, so memory holds
+one picture at a time whatever the page count. The main document part is
+assembled when the writer closes.
+"""
+import re
+import tempfile
+import zipfile
+from pathlib import Path
+from xml.sax.saxutils import escape
+
+EMU_PER_INCH = 914400
+
+# US Letter with 1" margins, in twentieths of a point
+PAGE_WIDTH, PAGE_HEIGHT, PAGE_MARGIN = 12240, 15840, 1440
+
+CONTENT_TYPES = {'PNG': 'image/png', 'JPEG': 'image/jpeg'}
+
+NAMESPACES = (
+    'xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main" '
+    'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships" '
+    'xmlns:wp="http://schemas.openxmlformats.org/drawingml/2006/wordprocessingDrawing" '
+    'xmlns:a="http://schemas.openxmlformats.org/drawingml/2006/main" '
+    'xmlns:pic="http://schemas.openxmlformats.org/drawingml/2006/picture"'
+)
+
+RELATIONSHIPS_NS = "http://schemas.openxmlformats.org/package/2006/relationships"
+IMAGE_REL = "http://schemas.openxmlformats.org/officeDocument/2006/relationships/image"
+DOCUMENT_REL = "http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument"
+DOCUMENT_TYPE = "application/vnd.openxmlformats-officedocument.wordprocessingml.document.main+xml"
+
+# Characters XML 1.0 cannot carry (PDF text layers do contain them)
+_INVALID_XML = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f\ufffe\uffff]')
+
+def _text_xml(text: str) -> str:
+    lines = (escape(_INVALID_XML.sub('', line)) for line in text.split('\n'))
+    return '<w:br/>'.join(f'<w:t xml:space="preserve">{line}</w:t>' for line in lines)
+
+class DocxStreamWriter:
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._archive = zipfile.ZipFile(str(self.path), 'w', zipfile.ZIP_DEFLATED)
+        self._body = tempfile.TemporaryFile('w+', encoding='utf-8')
+        # (relationship id, part name) of every picture written so far
+        self._images: list[tuple[str, str]] = []
+
+    def add_paragraph(self, text: str = ""):
+        run = f'<w:r>{_text_xml(text)}</w:r>' if text else ''
+        self._body.write(f'<w:p>{run}</w:p>')
+
+    def add_picture(self, data: bytes, pixel_size: tuple[int, int], image_format: str, width_inches: float):
+        """Write an encoded PNG/JPEG picture into the archive and place it in its own paragraph"""
+        number = len(self._images) + 1
+        rel_id = f"rId{number}"
+        part = f"media/image{number}.{'jpeg' if image_format == 'JPEG' else 'png'}"
+        # Pictures are already compressed
+        self._archive.writestr(f"word/{part}", data, compress_type=zipfile.ZIP_STORED)
+        self._images.append((rel_id, part))
+
+        cx = int(width_inches * EMU_PER_INCH)
+        cy = int(cx * pixel_size[1] / pixel_size[0])
+        self._body.write(
+            f'<w:p><w:r><w:drawing><wp:inline distT="0" distB="0" distL="0" distR="0">'
+            f'<wp:extent cx="{cx}" cy="{cy}"/><wp:docPr id="{number}" name="Picture {number}"/>'
+            f'<wp:cNvGraphicFramePr><a:graphicFrameLocks noChangeAspect="1"/></wp:cNvGraphicFramePr>'
+            f'<a:graphic><a:graphicData uri="http://schemas.openxmlformats.org/drawingml/2006/picture">'
+            f'<pic:pic><pic:nvPicPr><pic:cNvPr id="{number}" name="{Path(part).name}"/><pic:cNvPicPr/></pic:nvPicPr>'
+            f'<pic:blipFill><a:blip r:embed="{rel_id}"/><a:stretch><a:fillRect/></a:stretch></pic:blipFill>'
+            f'<pic:spPr><a:xfrm><a:off x="0" y="0"/><a:ext cx="{cx}" cy="{cy}"/></a:xfrm>'
+            f'<a:prstGeom prst="rect"><a:avLst/></a:prstGeom></pic:spPr></pic:pic>'
+            f'</a:graphicData></a:graphic></wp:inline></w:drawing></w:r></w:p>'
+        )
+
+    def close(self):
+        """Write the document part and package metadata, then close the archive"""
+        archive = self._archive
+        archive.writestr('[Content_Types].xml', (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+            '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+            '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+            '<Default Extension="xml" ContentType="application/xml"/>'
+            f'<Default Extension="png" ContentType="{CONTENT_TYPES["PNG"]}"/>'
+            f'<Default Extension="jpeg" ContentType="{CONTENT_TYPES["JPEG"]}"/>'
+            f'<Override PartName="/word/document.xml" ContentType="{DOCUMENT_TYPE}"/>'
+            '</Types>'
+        ))
+        archive.writestr('_rels/.rels', (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+            f'<Relationships xmlns="{RELATIONSHIPS_NS}">'
+            f'<Relationship Id="rId1" Type="{DOCUMENT_REL}" Target="word/document.xml"/>'
+            '</Relationships>'
+        ))
+        archive.writestr('word/_rels/document.xml.rels', (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+            f'<Relationships xmlns="{RELATIONSHIPS_NS}">'
+            + ''.join(f'<Relationship Id="{rel_id}" Type="{IMAGE_REL}" Target="{part}"/>' for rel_id, part in self._images)
+            + '</Relationships>'
+        ))
+
+        # Copy the spooled body into the document part piece by piece
+        self._body.seek(0)
+        with archive.open('word/document.xml', 'w') as dest:
+            dest.write(f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?><w:document {NAMESPACES}><w:body>'.encode('utf-8'))
+            for chunk in iter(lambda: self._body.read(1024 * 1024), ''):
+                dest.write(chunk.encode('utf-8'))
+            dest.write((
+                f'<w:sectPr><w:pgSz w:w="{PAGE_WIDTH}" w:h="{PAGE_HEIGHT}"/>'
+                f'<w:pgMar w:top="{PAGE_MARGIN}" w:right="{PAGE_MARGIN}" w:bottom="{PAGE_MARGIN}" '
+                f'w:left="{PAGE_MARGIN}" w:header="720" w:footer="720" w:gutter="0"/></w:sectPr>'
+                '</w:body></w:document>'
+            ).encode('utf-8'))
+        self._body.close()
+        archive.close()
+
+    def abort(self):
+        """Close without finishing and remove the partial file"""
+        self._body.close()
+        self._archive.close()
+        self.path.unlink(missing_ok=True)
+
+    def __enter__(self) -> "DocxStreamWriter":
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
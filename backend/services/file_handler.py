@@ -2,18 +2,68 @@
 File handling service for uploading and managing files
 """
 import os
+import json
+import asyncio
+import hashlib
 import shutil
+import time
 from pathlib import Path
 from typing import Optional
 import uuid
 from datetime import datetime, timezone
 import aiofiles
+from .file_probe import SNIFF_SIZE, matches_extension, probe_file
+from .file_index import FileIndex
+from .sharding import iter_files, sharded_path
+from .storage import LocalStorage, StorageBackend
+
+# Size of each read/write when streaming an upload to disk
+UPLOAD_CHUNK_SIZE = 1024 * 1024  # 1MB
+
+# Uploads up to this size are hashed in memory, so a duplicate never touches the disk
+DEDUP_SPOOL_SIZE = 8 * 1024 * 1024  # 8MB
+
+VALID_EXTENSIONS = {
+    'image': ['.jpg', '.jpeg', '.png', '.webp', '.gif', '.tiff', '.ico', '.bmp'],
+    'document': ['.pdf', '.doc', '.docx']
+}
 
 class FileHandler:
-    def __init__(self, upload_dir: str, max_file_size: int):
+    """Uploads are stored once per SHA-256 digest under `blobs/`.
+    
+    Each file_id is a hard link from `<file_type>/<aa>/<bb>/<file_id><ext>`
+    (see sharding.py) to its blob, so the blob's link count doubles as its
+    reference count. Records are sharded the same way under `meta/`.
+    A reference's age is that of its record, which is written once and
+    never touched, so uploads sharing a blob each expire on their own.
+    
+    With a remote storage backend, blobs and records are also published
+    there. A blob is stored once under its digest, with one reference per
+    file_id; a process that lacks a local copy fetches the blob and links
+    the file_id to it again. Stored blobs left without references are
+    removed by delete_orphaned_blobs().
+    """
+    def __init__(
+        self,
+        upload_dir: str,
+        max_file_size: int,
+        ttl: Optional[float] = None,
+        storage: Optional[StorageBackend] = None
+    ):
         self.upload_dir = Path(upload_dir)
         self.max_file_size = max_file_size
+        self.blob_dir = self.upload_dir / 'blobs'
+        self.meta_dir = self.upload_dir / 'meta'
         self.upload_dir.mkdir(parents=True, exist_ok=True)
+        self.blob_dir.mkdir(parents=True, exist_ok=True)
+        self.meta_dir.mkdir(parents=True, exist_ok=True)
+        self.storage = storage or LocalStorage(self.upload_dir)
+        # file_id -> upload reference; rebuilt with `index.rebuild()` at startup.
+        # With a ttl, references are deleted `ttl` seconds after upload by delete_expired().
+        self.index = FileIndex(
+            (self.upload_dir / file_type for file_type in VALID_EXTENSIONS), ttl,
+            created_of=self._created_of, locate=self._reference_paths
+        )
     
     async def validate_file(self, file_path: Path, file_type: str) -> tuple[bool, str]:
         """Validate uploaded file"""
@@ -26,75 +76,373 @@ class FileHandler:
             return False, f"Dosya boyutu {self.max_file_size / (1024*1024*1024):.0f}GB'den büyük olamaz"
         
         # Check file extension
-        ext = file_path.suffix.lower()
-        valid_extensions = {
-            'image': ['.jpg', '.jpeg', '.png', '.webp', '.gif', '.tiff', '.ico', '.bmp'],
-            'document': ['.pdf', '.doc', '.docx']
-        }
-        
-        if ext not in valid_extensions.get(file_type, []):
+        return self.validate_upload(file_path.name, file_type)
+    
+    def validate_upload(self, original_filename: str, file_type: str) -> tuple[bool, str]:
+        """Validate file name and type before anything is written to disk"""
+        ext = Path(original_filename or "").suffix.lower()
+        if ext not in VALID_EXTENSIONS.get(file_type, []):
             return False, f"Desteklenmeyen dosya uzantısı: {ext}"
         
         return True, "Dosya geçerli"
     
+    def validate_content(self, head: bytes, original_filename: str) -> tuple[bool, str]:
+        """Check the file's magic bytes against its extension"""
+        if not matches_extension(head, original_filename):
+            return False, f"Dosya içeriği uzantısıyla uyuşmuyor: {Path(original_filename).suffix.lower()}"
+        return True, "Dosya geçerli"
+    
+    # ============ CONTENT-ADDRESSED STORE ============
+    
+    def _blob_path(self, digest: str) -> Path:
+        return self.blob_dir / digest[:2] / digest
+    
+    def _record_path(self, file_id: str, create: bool = False) -> Path:
+        return sharded_path(self.meta_dir, f"{file_id}.json", create)
+    
+    def _record_paths(self, file_id: str) -> tuple[Path, Path]:
+        # Records not migrated yet are still in the flat layout
+        return self._record_path(file_id), self.meta_dir / f"{file_id}.json"
+    
+    def _find_record(self, file_id: str) -> Optional[Path]:
+        for record_path in self._record_paths(file_id):
+            if record_path.exists():
+                return record_path
+        if self.storage.remote and self.storage.download(self._record_path(file_id)):
+            return self._record_path(file_id)
+        return None
+    
+    def _created_of(self, file_path: Path, stat: os.stat_result) -> float:
+        """Upload time of a reference found on disk: its record's mtime"""
+        for record_path in self._record_paths(file_path.stem):
+            try:
+                return record_path.stat().st_mtime
+            except FileNotFoundError:
+                continue
+        return stat.st_mtime
+    
+    def _reference_paths(self, file_id: str) -> list[Path]:
+        """Where a reference the index does not know can be, from its local record"""
+        for record_path in self._record_paths(file_id):
+            try:
+                with open(record_path, 'r', encoding='utf-8') as f:
+                    record = json.load(f)
+            except FileNotFoundError:
+                continue
+            directory = self.upload_dir / record["file_type"]
+            name = f"{file_id}{Path(record['filename']).suffix}"
+            return [sharded_path(directory, name), directory / name]
+        return []
+    
+    def get_record(self, file_id: str) -> Optional[dict]:
+        """Get the stored record (digest, size, name) of an upload"""
+        record_path = self._find_record(file_id)
+        if record_path is None:
+            return None
+        with open(record_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    
+    def _commit_blob(self, digest: str, temp_path: Optional[Path], content: Optional[bytes]) -> bool:
+        """Store a blob unless one with the same digest exists. Returns True on dedup hit."""
+        blob_path = self._blob_path(digest)
+        if blob_path.exists():
+            if temp_path:
+                os.remove(temp_path)
+            return True
+        
+        blob_path.parent.mkdir(parents=True, exist_ok=True)
+        if temp_path is None:
+            temp_path = self.blob_dir / f".{uuid.uuid4()}.tmp"
+            with open(temp_path, 'wb') as f:
+                f.write(content)
+        try:
+            # link() fails if a concurrent upload stored the same digest first
+            os.link(temp_path, blob_path)
+        except FileExistsError:
+            os.remove(temp_path)
+            return True
+        os.remove(temp_path)
+        return False
+    
+    def _add_reference(self, digest: str, size: int, original_filename: str, file_type: str) -> str:
+        """Create a new file_id pointing at an existing blob"""
+        file_id = str(uuid.uuid4())
+        file_path = sharded_path(self.upload_dir / file_type, f"{file_id}{Path(original_filename).suffix}", create=True)
+        os.link(self._blob_path(digest), file_path)
+        
+        created = time.time()
+        record = {
+            "file_id": file_id,
+            "filename": original_filename,
+            "file_type": file_type,
+            "sha256": digest,
+            "size": size,
+            "created_at": datetime.fromtimestamp(created, timezone.utc).isoformat(),
+            "metadata": probe_file(file_path)
+        }
+        with open(self._record_path(file_id, create=True), 'w', encoding='utf-8') as f:
+            json.dump(record, f)
+        # The blob's mtime is shared with earlier uploads of the same content
+        self.index.add(file_path, created)
+        return file_id
+    
+    def _store(
+        self,
+        digest: str,
+        temp_path: Optional[Path],
+        content: Optional[bytes],
+        size: int,
+        original_filename: str,
+        file_type: str
+    ) -> str:
+        """Commit the blob and add a reference to it (blocking I/O)"""
+        self._commit_blob(digest, temp_path, content)
+        return self._add_reference(digest, size, original_filename, file_type)
+    
+    def get_metadata(self, file_id: str) -> Optional[dict]:
+        """Get the probed format/dimension metadata of an upload"""
+        record = self.get_record(file_id)
+        return record.get("metadata") if record else None
+    
     async def save_upload(self, file_content: bytes, original_filename: str, file_type: str) -> tuple[bool, str, Optional[str]]:
         """Save uploaded file"""
+        is_valid, validation_msg = self.validate_upload(original_filename, file_type)
+        if not is_valid:
+            return False, validation_msg, None
+        if len(file_content) > self.max_file_size:
+            return False, f"Dosya boyutu {self.max_file_size / (1024*1024*1024):.0f}GB'den büyük olamaz", None
+        is_valid, validation_msg = self.validate_content(file_content[:SNIFF_SIZE], original_filename)
+        if not is_valid:
+            return False, validation_msg, None
+        
         try:
-            # Create a unique filename
-            file_id = str(uuid.uuid4())
-            file_ext = Path(original_filename).suffix
-            unique_filename = f"{file_id}{file_ext}"
-            
-            # Create type-specific directory
-            type_dir = self.upload_dir / file_type
-            type_dir.mkdir(parents=True, exist_ok=True)
+            digest = await asyncio.to_thread(lambda: hashlib.sha256(file_content).hexdigest())
+            file_id = await asyncio.to_thread(
+                self._store, digest, None, file_content, len(file_content), original_filename, file_type
+            )
+            return True, "Dosya başarıyla kaydedildi", file_id
+        except Exception as e:
+            return False, f"Dosya kaydetme hatası: {str(e)}", None
+    
+    async def save_upload_stream(
+        self,
+        source,
+        original_filename: str,
+        file_type: str,
+        chunk_size: int = UPLOAD_CHUNK_SIZE
+    ) -> tuple[bool, str, Optional[str], int]:
+        """Stream an upload into the store in fixed-size chunks.
+        
+        `source` is any object with an async `read(size)`, such as the
+        request body parser (utils/multipart_stream.py), so reading stops as
+        soon as the size limit is passed. Content is hashed as it arrives.
+        Small uploads are kept in memory until the digest is known, so
+        duplicates cause no disk write; larger ones spill to a temp file
+        that is renamed into place. Committing and probing run in a worker
+        thread. Returns (success, message, file_id, bytes_received).
+        """
+        is_valid, validation_msg = self.validate_upload(original_filename, file_type)
+        if not is_valid:
+            return False, validation_msg, None, 0
+        
+        hasher = hashlib.sha256()
+        buffered: list[bytes] = []
+        temp_path: Optional[Path] = None
+        temp_file = None
+        received = 0
+        try:
+            while True:
+                chunk = await source.read(chunk_size)
+                if not chunk:
+                    break
+                if received == 0:
+                    # Reject mislabeled files before anything is stored
+                    is_valid, validation_msg = self.validate_content(chunk[:SNIFF_SIZE], original_filename)
+                    if not is_valid:
+                        return False, validation_msg, None, len(chunk)
+                received += len(chunk)
+                if received > self.max_file_size:
+                    break
+                hasher.update(chunk)
+                
+                if temp_file is None and received <= DEDUP_SPOOL_SIZE:
+                    buffered.append(chunk)
+                    continue
+                if temp_file is None:
+                    temp_path = self.blob_dir / f".{uuid.uuid4()}.tmp"
+                    temp_file = await aiofiles.open(str(temp_path), 'wb')
+                    for pending in buffered:
+                        await temp_file.write(pending)
+                    buffered = []
+                await temp_file.write(chunk)
             
-            file_path = type_dir / unique_filename
+            if temp_file is not None:
+                await temp_file.close()
+                temp_file = None
             
-            # Write file
-            async with aiofiles.open(str(file_path), 'wb') as f:
-                await f.write(file_content)
+            if received == 0:
+                return False, "Dosya boş", None, 0
+            if received > self.max_file_size:
+                if temp_path and temp_path.exists():
+                    os.remove(temp_path)
+                return False, f"Dosya boyutu {self.max_file_size / (1024*1024*1024):.0f}GB'den büyük olamaz", None, received
             
-            # Validate file
-            is_valid, validation_msg = await self.validate_file(file_path, file_type)
-            if not is_valid:
-                os.remove(file_path)
-                return False, validation_msg, None
+            file_id = await asyncio.to_thread(
+                self._store, hasher.hexdigest(), temp_path, b"".join(buffered), received, original_filename, file_type
+            )
+            return True, "Dosya başarıyla kaydedildi", file_id, received
+        except Exception as e:
+            if temp_file is not None:
+                await temp_file.close()
+            if temp_path and temp_path.exists():
+                os.remove(temp_path)
+            return False, f"Dosya kaydetme hatası: {str(e)}", None, received
+    
+    def adopt_upload(self, source_path: Path, original_filename: str, file_type: str) -> tuple[bool, str, Optional[str]]:
+        """Move an already assembled file into the store (rename, no copy).
+        
+        Hashes the whole file: call it from a worker thread.
+        """
+        is_valid, validation_msg = self.validate_upload(original_filename, file_type)
+        if not is_valid:
+            return False, validation_msg, None
+        
+        try:
+            hasher = hashlib.sha256()
+            with open(source_path, 'rb') as f:
+                is_valid, validation_msg = self.validate_content(f.read(SNIFF_SIZE), original_filename)
+                if not is_valid:
+                    return False, validation_msg, None
+                f.seek(0)
+                for chunk in iter(lambda: f.read(UPLOAD_CHUNK_SIZE), b""):
+                    hasher.update(chunk)
+            digest = hasher.hexdigest()
+            size = source_path.stat().st_size
             
+            file_id = self._store(digest, source_path, None, size, original_filename, file_type)
             return True, "Dosya başarıyla kaydedildi", file_id
         except Exception as e:
             return False, f"Dosya kaydetme hatası: {str(e)}", None
     
-    def get_file_path(self, file_id: str, file_type: str) -> Optional[Path]:
-        """Get file path from file ID"""
-        type_dir = self.upload_dir / file_type
-        for file in type_dir.glob(f"{file_id}*"):
-            if file.is_file():
-                return file
+    def publish(self, file_id: str) -> tuple[bool, str]:
+        """Copy a new upload and its record to the storage backend (blocking I/O)"""
+        if not self.storage.remote:
+            return True, "Dosya yerel depoda"
+        try:
+            record = self.get_record(file_id)
+            self.storage.add_reference(self._blob_path(record["sha256"]), file_id)
+            self.storage.upload(self._record_path(file_id))
+            return True, "Dosya depoya yüklendi"
+        except Exception as e:
+            return False, f"Depolama hatası: {str(e)}"
+    
+    def _locate(self, file_id: str, file_type: str) -> Optional[Path]:
+        """Local path of a reference, whether or not a local copy exists"""
+        entry = self.index.get(file_id)
+        if entry and entry.path.is_relative_to(self.upload_dir / file_type):
+            return entry.path
+        if self.storage.remote:
+            record = self.get_record(file_id)
+            if record and record.get("file_type") == file_type:
+                return sharded_path(self.upload_dir / file_type, f"{file_id}{Path(record['filename']).suffix}")
         return None
     
+    def get_file_path(self, file_id: str, file_type: str) -> Optional[Path]:
+        """Get file path from file ID, fetching it from the storage backend if needed"""
+        file_path = self._locate(file_id, file_type)
+        if file_path and not file_path.exists():
+            if not self._fetch(file_id, file_path):
+                return None
+            self.index.add(file_path)
+        return file_path
+    
+    def _fetch(self, file_id: str, file_path: Path) -> bool:
+        """Link a reference to its blob, downloading the blob if this process lacks it"""
+        record = self.get_record(file_id)
+        if not record:
+            return False
+        blob_path = self._blob_path(record["sha256"])
+        if not self.storage.download(blob_path):
+            return False
+        file_path.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            os.link(blob_path, file_path)
+        except FileExistsError:
+            pass
+        return True
+    
+    def _release_blob(self, digest: Optional[str]):
+        """Remove a blob once no file_id references it any more"""
+        if not digest:
+            return
+        blob_path = self._blob_path(digest)
+        try:
+            if blob_path.stat().st_nlink <= 1:
+                os.remove(blob_path)
+        except FileNotFoundError:
+            pass
+    
+    def _delete_reference(self, file_id: str, file_path: Path):
+        record = self.get_record(file_id)
+        record_path = self._find_record(file_id)
+        # With a remote backend this process may never have had a local copy
+        file_path.unlink(missing_ok=self.storage.remote)
+        self.index.remove(file_id)
+        if record_path:
+            record_path.unlink(missing_ok=True)
+        if self.storage.remote:
+            self.storage.delete(self._record_path(file_id))
+            if record:
+                self.storage.remove_reference(self._blob_path(record["sha256"]), file_id)
+        self._release_blob(record.get("sha256") if record else None)
+    
+    def delete_orphaned_blobs(self, grace: float) -> int:
+        """Remove stored blobs without references for `grace` seconds; returns the count (blocking I/O)"""
+        return self.storage.delete_orphans(self.blob_dir, grace)
+    
     def delete_file(self, file_id: str, file_type: str) -> bool:
-        """Delete file"""
+        """Delete a file_id reference; the blob goes when its last reference does"""
         try:
-            file_path = self.get_file_path(file_id, file_type)
-            if file_path and file_path.exists():
-                os.remove(file_path)
+            file_path = self._locate(file_id, file_type)
+            if file_path and (file_path.exists() or self.storage.remote):
+                self._delete_reference(file_id, file_path)
                 return True
             return False
         except Exception as e:
             print(f"Dosya silme hatası: {str(e)}")
             return False
     
+    def delete_expired(self, limit: int) -> int:
+        """Delete up to `limit` references past their TTL; returns the count"""
+        deleted = 0
+        for file_id, entry in self.index.due(limit):
+            try:
+                self._delete_reference(file_id, entry.path)
+                deleted += 1
+            except FileNotFoundError:
+                pass
+            except Exception as e:
+                print(f"Dosya silme hatası: {str(e)}")
+        return deleted
+    
     def cleanup_old_files(self, days: int = 7):
-        """Clean up files older than specified days"""
+        """Full sweep: references older than specified days and unreferenced blobs"""
         try:
-            import time
             cutoff_time = time.time() - (days * 24 * 60 * 60)
             
-            for root, dirs, files in os.walk(self.upload_dir):
+            for type_dir in VALID_EXTENSIONS:
+                for entry in iter_files(self.upload_dir / type_dir):
+                    if self._created_of(Path(entry.path), entry.stat()) < cutoff_time:
+                        self.delete_file(Path(entry.name).stem, type_dir)
+            
+            # Blobs whose only remaining link is the blob itself
+            for root, dirs, files in os.walk(self.blob_dir):
                 for file in files:
                     file_path = Path(root) / file
-                    if os.path.getmtime(file_path) < cutoff_time:
+                    if file.startswith('.'):
+                        if os.path.getmtime(file_path) < cutoff_time:
+                            os.remove(file_path)
+                    elif os.stat(file_path).st_nlink <= 1:
                         os.remove(file_path)
         except Exception as e:
             print(f"Eski dosyaları temizleme hatası: {str(e)}")
@@ -0,0 +1,154 @@
+"""
+In-memory index of stored files by ID.
+
+Maps each file ID to its path, size, MIME type and mtime so lookups and
+download headers come from one dict access instead of a directory glob and
+a stat. The owning service adds files as it writes them and removes them as
+it deletes them; `rebuild()` scans the directories once at startup. An
+entry whose file is gone (deleted or migrated by another process) is
+dropped when looked up. A miss checks the exact paths the owning service
+says the ID can have (files written by another process), and the file
+found there is indexed for next time.
+
+With a TTL the index also keeps a heap of files by expiry time, so finding
+the files that are due costs the number of due files, not of all files.
+Ages come from each entry's `created` time, not the file's mtime: files
+that share an inode (hard-linked uploads and outputs) each keep their own.
+"""
+import hashlib
+import heapq
+import mimetypes
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Iterable, Optional
+
+from .sharding import file_id_of, iter_files
+
+class IndexEntry:
+    """What is known about one stored file"""
+    __slots__ = ('path', 'mime_type', 'stat', 'created', 'digest')
+
+    def __init__(self, path: Path, stat: os.stat_result, created: float):
+        self.path = path
+        self.mime_type = mimetypes.guess_type(path.name)[0] or "application/octet-stream"
+        self.stat = stat
+        # When this ID was stored; its expiry counts from here
+        self.created = created
+        # SHA-256 of the content, computed on first use (see FileIndex.digest)
+        self.digest: Optional[str] = None
+
+    @property
+    def size(self) -> int:
+        return self.stat.st_size
+
+    @property
+    def mtime(self) -> float:
+        return self.stat.st_mtime
+
+def _mtime(path: Path, stat: os.stat_result) -> float:
+    return stat.st_mtime
+
+class FileIndex:
+    def __init__(
+        self,
+        directories: Iterable[Path],
+        ttl: Optional[float] = None,
+        created_of: Optional[Callable[[Path, os.stat_result], float]] = None,
+        locate: Optional[Callable[[str], Iterable[Path]]] = None
+    ):
+        self.directories = [Path(d) for d in directories]
+        self.ttl = ttl
+        # Creation time of a file found on disk (rebuild, lookups on a miss); its mtime by default
+        self.created_of = created_of or _mtime
+        # Paths an ID that is not indexed may have; without it a miss is final
+        self.locate = locate or (lambda file_id: ())
+        self._roots = set(self.directories)
+        self._entries: dict[str, IndexEntry] = {}
+        # (expires_at, file_id); entries removed or re-added since are skipped when popped
+        self._expiry: list[tuple[float, str]] = []
+        # Outputs are indexed from request handlers and cleanup threads alike
+        self._lock = threading.Lock()
+
+    def rebuild(self) -> int:
+        """Index every file in the directories' shards; returns the count"""
+        entries = {}
+        for directory in self.directories:
+            for entry in iter_files(directory):
+                path, stat = Path(entry.path), entry.stat()
+                entries[file_id_of(path)] = IndexEntry(path, stat, self.created_of(path, stat))
+        expiry = []
+        if self.ttl is not None:
+            expiry = [(entry.created + self.ttl, file_id) for file_id, entry in entries.items()]
+            heapq.heapify(expiry)
+        with self._lock:
+            self._entries = entries
+            self._expiry = expiry
+        return len(entries)
+
+    def add(self, path: Path, created: Optional[float] = None) -> IndexEntry:
+        """Index a file; `created` is when its ID was stored (see created_of when unknown)"""
+        path = Path(path)
+        stat = os.stat(path)
+        entry = IndexEntry(path, stat, self.created_of(path, stat) if created is None else created)
+        file_id = file_id_of(entry.path)
+        with self._lock:
+            self._entries[file_id] = entry
+            if self.ttl is not None:
+                heapq.heappush(self._expiry, (entry.created + self.ttl, file_id))
+        return entry
+
+    def remove(self, file_id: str) -> Optional[IndexEntry]:
+        with self._lock:
+            return self._entries.pop(file_id, None)
+
+    def get(self, file_id: str) -> Optional[IndexEntry]:
+        """Look up a file, checking its possible paths only when it is not indexed"""
+        entry = self._entries.get(file_id)
+        if entry is not None:
+            if entry.path.exists():
+                return entry
+            with self._lock:
+                if self._entries.get(file_id) is entry:
+                    del self._entries[file_id]
+        for path in self.locate(file_id):
+            if path.is_file():
+                return self.add(path)
+        return None
+
+    def due(self, limit: int, now: Optional[float] = None) -> list[tuple[str, IndexEntry]]:
+        """Up to `limit` indexed files past their TTL, removed from the index"""
+        if self.ttl is None:
+            return []
+        now = time.time() if now is None else now
+        expired, moved = [], []
+        with self._lock:
+            while self._expiry and self._expiry[0][0] <= now and len(expired) < limit:
+                expires_at, file_id = heapq.heappop(self._expiry)
+                entry = self._entries.get(file_id)
+                if entry is None or entry.created + self.ttl != expires_at:
+                    continue
+                if not entry.path.exists():
+                    self._entries.pop(file_id)
+                    if entry.path.parent in self._roots:
+                        moved.append(file_id)
+                    continue
+                expired.append((file_id, self._entries.pop(file_id)))
+        for file_id in moved:
+            # Migrated out of the flat layout: index (and schedule) it at its new path
+            self.get(file_id)
+        return expired
+
+    def digest(self, entry: IndexEntry, chunk_size: int = 1024 * 1024) -> str:
+        """Content digest of an entry, hashed once and then kept with it (blocking I/O)"""
+        if entry.digest is None:
+            hasher = hashlib.sha256()
+            with open(entry.path, 'rb') as f:
+                for chunk in iter(lambda: f.read(chunk_size), b""):
+                    hasher.update(chunk)
+            entry.digest = hasher.hexdigest()
+        return entry.digest
+
+    def __len__(self) -> int:
+        return len(self._entries)
@@ -0,0 +1,177 @@
+"""
+Header-only format probing for uploaded files.
+
+Nothing here decodes pixel data: formats are identified from magic bytes,
+and dimensions, mode and frame/page counts come from file headers.
+"""
+from pathlib import Path
+from typing import Optional, BinaryIO
+from PIL import Image
+
+# Bytes needed to identify every supported format
+SNIFF_SIZE = 16
+
+# Formats an extension may legitimately contain
+EXTENSION_FORMATS = {
+    '.jpg': {'JPEG'},
+    '.jpeg': {'JPEG'},
+    '.png': {'PNG'},
+    '.webp': {'WEBP'},
+    '.gif': {'GIF'},
+    '.tiff': {'TIFF'},
+    '.ico': {'ICO'},
+    '.bmp': {'BMP'},
+    '.pdf': {'PDF'},
+    '.docx': {'DOCX'},
+    '.doc': {'DOC', 'DOCX'},
+}
+
+MIME_TYPES = {
+    'JPEG': 'image/jpeg',
+    'PNG': 'image/png',
+    'WEBP': 'image/webp',
+    'GIF': 'image/gif',
+    'TIFF': 'image/tiff',
+    'ICO': 'image/x-icon',
+    'BMP': 'image/bmp',
+    'PDF': 'application/pdf',
+    'DOCX': 'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
+    'DOC': 'application/msword',
+}
+
+# Bytes per pixel of the decoded raster, by PIL mode
+MODE_BYTES = {'1': 1, 'L': 1, 'P': 1, 'LA': 2, 'I;16': 2, 'RGB': 3, 'YCbCr': 3, 'LAB': 3, 'HSV': 3,
+              'RGBA': 4, 'CMYK': 4, 'I': 4, 'F': 4}
+
+# Resolution pdf2image rasterizes at by default
+PDF_RASTER_DPI = 200
+
+def sniff_format(head: bytes) -> Optional[str]:
+    """Identify a format from the first bytes of a file"""
+    if head.startswith(b'\xff\xd8\xff'):
+        return 'JPEG'
+    if head.startswith(b'\x89PNG\r\n\x1a\n'):
+        return 'PNG'
+    if head[:6] in (b'GIF87a', b'GIF89a'):
+        return 'GIF'
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'WEBP'
+    if head[:4] in (b'II*\x00', b'MM\x00*'):
+        return 'TIFF'
+    if head.startswith(b'BM'):
+        return 'BMP'
+    if head[:4] == b'\x00\x00\x01\x00':
+        return 'ICO'
+    if head.startswith(b'%PDF-'):
+        return 'PDF'
+    if head.startswith(b'PK\x03\x04'):
+        return 'DOCX'
+    if head.startswith(b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1'):
+        return 'DOC'
+    return None
+
+def matches_extension(head: bytes, filename: str) -> bool:
+    """Check that the content's magic bytes agree with the file extension"""
+    detected = sniff_format(head)
+    return detected is not None and detected in EXTENSION_FORMATS.get(Path(filename).suffix.lower(), set())
+
+def _count_gif_frames(f: BinaryIO) -> int:
+    """Count GIF image descriptors by skipping data sub-blocks (no LZW decode)"""
+    def skip_sub_blocks():
+        while True:
+            size = f.read(1)
+            if not size or size[0] == 0:
+                return
+            f.seek(size[0], 1)
+
+    f.seek(10)
+    packed = f.read(1)
+    f.seek(2, 1)
+    if packed and packed[0] & 0x80:
+        f.seek(3 * (2 ** ((packed[0] & 0x07) + 1)), 1)
+
+    frames = 0
+    while True:
+        block = f.read(1)
+        if not block or block == b';':
+            return frames
+        if block == b'!':
+            f.seek(1, 1)
+            skip_sub_blocks()
+        elif block == b',':
+            frames += 1
+            descriptor = f.read(9)
+            if len(descriptor) < 9:
+                return frames
+            if descriptor[8] & 0x80:
+                f.seek(3 * (2 ** ((descriptor[8] & 0x07) + 1)), 1)
+            f.seek(1, 1)
+            skip_sub_blocks()
+        else:
+            return frames
+
+def _probe_image(path: Path, detected: str) -> dict:
+    # Image.open only parses the header; pixel data is decoded lazily on load()
+    with Image.open(str(path)) as img:
+        width, height = img.size
+        mode = img.mode
+        if detected == 'GIF':
+            with open(path, 'rb') as f:
+                frames = max(_count_gif_frames(f), 1)
+        else:
+            # TIFF walks IFD offsets, WEBP/PNG read it from the container header
+            frames = getattr(img, 'n_frames', 1)
+
+    return {
+        "width": width,
+        "height": height,
+        "mode": mode,
+        "frames": frames,
+        "decode_bytes": width * height * MODE_BYTES.get(mode, 4)
+    }
+
+def _probe_pdf(path: Path) -> dict:
+    try:
+        from PyPDF2 import PdfReader
+    except ImportError:
+        return {}
+
+    # Only the xref table and page tree are parsed here, no content streams
+    reader = PdfReader(str(path))
+    pages = len(reader.pages)
+    if not pages:
+        return {"pages": 0, "decode_bytes": 0}
+
+    box = reader.pages[0].mediabox
+    width = int(float(box.width) * PDF_RASTER_DPI / 72)
+    height = int(float(box.height) * PDF_RASTER_DPI / 72)
+    return {
+        "width": width,
+        "height": height,
+        "mode": "RGB",
+        "pages": pages,
+        # Cost of one rasterized RGB page at the default DPI
+        "decode_bytes": width * height * 3
+    }
+
+def probe_file(path: Path) -> dict:
+    """Probe a stored file without decoding it"""
+    with open(path, 'rb') as f:
+        head = f.read(SNIFF_SIZE)
+
+    detected = sniff_format(head)
+    metadata = {
+        "format": detected,
+        "mime_type": MIME_TYPES.get(detected, "application/octet-stream"),
+        "size": path.stat().st_size,
+    }
+
+    try:
+        if detected in ('JPEG', 'PNG', 'GIF', 'WEBP', 'TIFF', 'BMP', 'ICO'):
+            metadata.update(_probe_image(path, detected))
+        elif detected == 'PDF':
+            metadata.update(_probe_pdf(path))
+    except Exception as e:
+        metadata["error"] = str(e)
+
+    return metadata
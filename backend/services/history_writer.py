@@ -0,0 +1,117 @@
+"""
+Write-behind buffer for conversion history records.
+
+Finished jobs hand their history record to `add()` and move on; a single
+background task groups the records into unordered `insert_many` calls,
+flushed when a batch is full or its oldest record has waited
+`flush_seconds`. The buffer is bounded: when the database falls that far
+behind, `add()` waits for room instead of letting memory grow. `close()`
+writes out whatever is still buffered.
+"""
+import asyncio
+import logging
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+# Queued by close(): everything before it is written, then the writer stops
+_STOP = object()
+
+class HistoryWriter:
+    def __init__(
+        self,
+        collection,
+        batch_size: int = 500,
+        flush_seconds: float = 2,
+        max_pending: int = 10000,
+        max_attempts: int = 3
+    ):
+        self.collection = collection
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.max_attempts = max_attempts
+        # Added but not yet written, including the batch being collected
+        self.pending = 0
+        self.written = 0
+        self.failed = 0
+        self.batches = 0
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max_pending)
+        self._task: Optional[asyncio.Task] = None
+
+    async def add(self, record: dict):
+        """Buffer a record; waits only while the buffer is full"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+        await self._queue.put(record)
+        self.pending += 1
+
+    async def close(self, timeout: float = 10):
+        """Write out the buffered records and stop the writer"""
+        if self._task is None or self._task.done():
+            return
+        await self._queue.put(_STOP)
+        try:
+            await asyncio.wait_for(self._task, timeout)
+        except asyncio.TimeoutError:
+            logger.error(f"History writer did not drain in {timeout}s; {self.pending} records lost")
+        self._task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            record = await self._queue.get()
+            if record is _STOP:
+                break
+            batch = [record]
+            deadline = loop.time() + self.flush_seconds
+            while len(batch) < self.batch_size:
+                try:
+                    record = self._queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        record = await asyncio.wait_for(self._queue.get(), timeout)
+                    except asyncio.TimeoutError:
+                        break
+                if record is _STOP:
+                    stopping = True
+                    break
+                batch.append(record)
+            await self._write(batch)
+            self.pending -= len(batch)
+
+    async def _write(self, batch: list[dict]):
+        from pymongo.errors import BulkWriteError
+
+        for attempt in range(self.max_attempts):
+            try:
+                await self.collection.insert_many(batch, ordered=False)
+                self.written += len(batch)
+                self.batches += 1
+                logger.info(f"Conversion history saved: {len(batch)} records")
+                return
+            except BulkWriteError as e:
+                # Unordered: only the documents listed in the error were not written
+                failed = len(e.details.get("writeErrors", []))
+                self.written += len(batch) - failed
+                self.failed += failed
+                self.batches += 1
+                logger.error(f"Failed to save {failed} conversion history records: {str(e)}")
+                return
+            except Exception as e:
+                logger.warning(f"Conversion history write failed (attempt {attempt + 1}): {str(e)}")
+                if attempt + 1 < self.max_attempts:
+                    await asyncio.sleep(2 ** attempt)
+        self.failed += len(batch)
+        logger.error(f"Dropped {len(batch)} conversion history records")
+
+    def stats(self) -> dict:
+        return {
+            "pending": self.pending,
+            "written": self.written,
+            "failed": self.failed,
+            "batches": self.batches
+        }
@@ -0,0 +1,160 @@
+"""
+Claims queued jobs from the job store and runs them in this process.
+
+Any number of dispatchers (in API processes or standalone workers) can
+share one store: claims are atomic, every running job's lease is renewed
+with a heartbeat that also saves its progress, and each dispatcher
+periodically requeues jobs whose worker has gone quiet.
+
+Bulk jobs may use only some of a dispatcher's slots, so interactive jobs
+find a free slot even while a bulk backlog is draining. A cancellation
+flagged in the store is picked up at the next heartbeat.
+"""
+import asyncio
+import logging
+import os
+import socket
+from typing import Awaitable, Callable, Optional
+
+from .job_store import JobStore, PRIORITIES, CANCELLED_MESSAGE
+
+logger = logging.getLogger(__name__)
+
+# Job fields a running job keeps up to date in the store
+PROGRESS_FIELDS = ('status', 'progress', 'message')
+
+class JobDispatcher:
+    def __init__(
+        self,
+        store: JobStore,
+        handler: Callable[[dict], Awaitable[None]],
+        concurrency: int,
+        lease_seconds: float = 30,
+        heartbeat_seconds: float = 2,
+        max_attempts: int = 3,
+        poll_seconds: float = 1,
+        bulk_slots: Optional[int] = None,
+        on_claim: Optional[Callable[[dict], None]] = None,
+        on_finish: Optional[Callable[[dict, bool], None]] = None
+    ):
+        self.store = store
+        self.handler = handler
+        self.concurrency = concurrency
+        self.lease_seconds = lease_seconds
+        self.heartbeat_seconds = heartbeat_seconds
+        self.max_attempts = max_attempts
+        self.poll_seconds = poll_seconds
+        self.bulk_slots = bulk_slots or concurrency
+        # Hooks for local progress listeners; on_finish also says whether the result was recorded
+        self.on_claim = on_claim
+        self.on_finish = on_finish
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self._active: dict[str, asyncio.Task] = {}
+        self._bulk: set[str] = set()
+        # Handler tasks of running jobs, cancelled to stop a job
+        self._handlers: dict[str, asyncio.Task] = {}
+        self._cancelled: set[str] = set()
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def notify(self):
+        """Check the queue now instead of at the next poll"""
+        self._wakeup.set()
+
+    def cancel(self, job_id: str) -> bool:
+        """Stop a job running here; False when it is not ours"""
+        handler = self._handlers.get(job_id)
+        if handler is None or handler.done():
+            return False
+        self._cancelled.add(job_id)
+        handler.cancel()
+        return True
+
+    def start(self):
+        self._task = asyncio.create_task(self._run_forever())
+        logger.info(f"Job dispatcher started: {self.worker_id} ({self.concurrency} slots)")
+
+    async def stop(self):
+        """Stop claiming; unfinished jobs are requeued by others once their lease expires"""
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run_forever(self):
+        loop = asyncio.get_running_loop()
+        next_requeue = 0.0
+        while True:
+            try:
+                if loop.time() >= next_requeue:
+                    requeued = await self.store.requeue_stalled(self.lease_seconds, self.max_attempts)
+                    if requeued:
+                        logger.warning(f"Requeued {requeued} stalled jobs")
+                    next_requeue = loop.time() + self.lease_seconds / 2
+
+                while len(self._active) < self.concurrency:
+                    # With the bulk share used up only interactive jobs are taken
+                    priorities = PRIORITIES if len(self._bulk) < self.bulk_slots else PRIORITIES[:1]
+                    job = await self.store.claim_job(self.worker_id, priorities)
+                    if job is None:
+                        break
+                    if job.get("priority", PRIORITIES[0]) != PRIORITIES[0]:
+                        self._bulk.add(job["id"])
+                    if self.on_claim:
+                        self.on_claim(job)
+                    task = asyncio.create_task(self._run_job(job))
+                    self._active[job["id"]] = task
+                    task.add_done_callback(lambda _, job_id=job["id"]: self._finished(job_id))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Job dispatcher error: {str(e)}")
+
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_seconds)
+            except asyncio.TimeoutError:
+                pass
+
+    def _finished(self, job_id: str):
+        self._active.pop(job_id, None)
+        self._bulk.discard(job_id)
+        self._wakeup.set()
+
+    async def _heartbeat(self, job: dict):
+        while True:
+            await asyncio.sleep(self.heartbeat_seconds)
+            fields = {field: job[field] for field in PROGRESS_FIELDS if field in job}
+            if not await self.store.heartbeat(job["id"], self.worker_id, fields):
+                logger.warning(f"Lost lease on job {job['id']}")
+                return
+            stored = await self.store.get_job(job["id"])
+            if stored and stored.get("cancel_requested"):
+                self.cancel(job["id"])
+
+    async def _run_job(self, job: dict):
+        heartbeat = asyncio.create_task(self._heartbeat(job))
+        handler = asyncio.create_task(self.handler(job))
+        self._handlers[job["id"]] = handler
+        try:
+            await handler
+        except asyncio.CancelledError:
+            if job["id"] not in self._cancelled:
+                raise
+            logger.info(f"Job {job['id']} cancelled")
+            job.update(status="cancelled", message=CANCELLED_MESSAGE)
+        except Exception as e:
+            logger.error(f"Job {job['id']} failed in handler: {str(e)}")
+            job.update(status="failed", progress=100, message=f"Error: {str(e)}")
+        finally:
+            heartbeat.cancel()
+            self._handlers.pop(job["id"], None)
+            self._cancelled.discard(job["id"])
+
+        # Only the current lease holder may record the outcome
+        result = {k: v for k, v in job.items() if k not in ('id', 'worker_id', 'heartbeat_at', 'attempts')}
+        recorded = await self.store.update_job(job["id"], {**result, "worker_id": None}, self.worker_id)
+        if not recorded:
+            logger.warning(f"Result of job {job['id']} dropped; it was reassigned")
+        if self.on_finish:
+            self.on_finish(job, recorded)
@@ -0,0 +1,629 @@
+"""
+Durable conversion job store and queue.
+
+Jobs and batches live outside the API process so that every uvicorn worker
+sees the same state, jobs survive restarts, and separate worker processes
+(on this machine or others) can take work from one queue. Workers claim
+jobs atomically and keep them leased with heartbeats; a job whose worker
+stops heartbeating is put back in the queue for someone else.
+
+Jobs are claimed by priority class first (interactive before bulk); within
+a class the client with the fewest running jobs goes next, so one client's
+backlog cannot starve everyone else.
+
+Finished jobs are kept for a while so clients can read their results, then
+expired: after a TTL, or oldest first once the store holds too many.
+
+Backends: SQLite (one machine, any number of processes), MongoDB (many
+machines) and an in-memory store for single-process development.
+"""
+import asyncio
+import json
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Optional
+
+# Priority classes in claim order
+PRIORITIES = ('interactive', 'bulk')
+
+FINISHED_STATUSES = ('completed', 'failed', 'cancelled')
+
+# Job fields kept in their own SQLite columns (everything else is JSON)
+_COLUMNS = ('status', 'priority', 'client_id', 'created_at', 'finished_at', 'worker_id', 'heartbeat_at', 'attempts')
+
+STALLED_MESSAGE = "Worker stopped responding"
+CANCELLED_MESSAGE = "Cancelled"
+
+class JobStore(ABC):
+    """Interface of the job store backends; every method is a coroutine"""
+
+    @abstractmethod
+    async def create_jobs(self, jobs: list[dict]):
+        ...
+
+    @abstractmethod
+    async def get_job(self, job_id: str) -> Optional[dict]:
+        ...
+
+    @abstractmethod
+    async def get_jobs(self, job_ids: list[str]) -> list[dict]:
+        """Jobs in the order of job_ids; unknown ids are skipped"""
+
+    @abstractmethod
+    async def get_client_jobs(self, client_id: str, created_after: float = 0) -> list[dict]:
+        """Jobs a client created after a time, oldest first"""
+
+    @abstractmethod
+    async def update_job(self, job_id: str, fields: dict, worker_id: Optional[str] = None) -> bool:
+        """Merge fields into a job; with worker_id, only while that worker holds it"""
+
+    @abstractmethod
+    async def claim_job(self, worker_id: str, priorities: tuple = PRIORITIES) -> Optional[dict]:
+        """Atomically take the next queued job of the given priority classes"""
+
+    @abstractmethod
+    async def cancel_job(self, job_id: str) -> Optional[dict]:
+        """Cancel a queued job, or flag a running one for its worker; returns the job"""
+
+    async def heartbeat(self, job_id: str, worker_id: str, fields: Optional[dict] = None) -> bool:
+        """Renew a lease (and save progress); False when the job was lost"""
+        return await self.update_job(job_id, {**(fields or {}), "heartbeat_at": time.time()}, worker_id)
+
+    @abstractmethod
+    async def requeue_stalled(self, lease_seconds: float, max_attempts: int) -> int:
+        """Put jobs whose lease expired back in the queue, or fail them"""
+
+    @abstractmethod
+    async def count_queued(self, priority: Optional[str] = None) -> int:
+        ...
+
+    @abstractmethod
+    async def expire_jobs(self, ttl_seconds: float, max_jobs: int, limit: int = 1000) -> list[dict]:
+        """Remove up to limit finished jobs that outlived the TTL or exceed max_jobs; returns them"""
+
+    @abstractmethod
+    async def create_batch(self, batch_id: str, conversion_ids: list[str]):
+        ...
+
+    @abstractmethod
+    async def get_batch(self, batch_id: str) -> Optional[dict]:
+        ...
+
+    def close(self):
+        pass
+
+_CANCELLED = {"status": "cancelled", "message": CANCELLED_MESSAGE, "worker_id": None}
+
+def _stamp_finished(fields: dict) -> dict:
+    """Add the finish time to fields that finish a job, and drop its request"""
+    if fields.get("status") in FINISHED_STATUSES and "finished_at" not in fields:
+        # The request is only needed to run the job; results stay readable without it
+        return {**fields, "finished_at": time.time(), "request": None}
+    return fields
+
+def _stalled_update(job: dict, max_attempts: int) -> dict:
+    if job.get("cancel_requested"):
+        return _stamp_finished(_CANCELLED)
+    if job.get("attempts", 0) >= max_attempts:
+        return _stamp_finished({"status": "failed", "progress": 100, "message": STALLED_MESSAGE, "worker_id": None})
+    return {"status": "queued", "message": "Requeued after worker timeout", "worker_id": None}
+
+def _pick_client(heads: dict, running: dict):
+    """Client served next: fewest running jobs, then the oldest waiting job"""
+    return min(heads, key=lambda client: (running.get(client, 0), heads[client]))
+
+# Fields of a job record; anything else a caller adds goes in `extra`
+JOB_FIELDS = (
+    'id', 'status', 'priority', 'client_id', 'created_at', 'finished_at', 'worker_id',
+    'heartbeat_at', 'attempts', 'progress', 'message', 'file_id', 'original_filename',
+    'target_format', 'file_type', 'batch_id', 'request', 'output_file_id', 'outputs',
+    'cancel_requested'
+)
+_JOB_FIELD_SET = frozenset(JOB_FIELDS)
+
+class JobRecord:
+    """Fixed-slot job of the in-memory store; reads like the dict it was built from"""
+    __slots__ = JOB_FIELDS + ('extra',)
+
+    def __init__(self, fields: dict):
+        self.extra: Optional[dict] = None
+        self.update(fields)
+
+    def update(self, fields: Optional[dict] = None, **kwargs):
+        for key, value in {**(fields or {}), **kwargs}.items():
+            if key in _JOB_FIELD_SET:
+                setattr(self, key, value)
+            else:
+                if self.extra is None:
+                    self.extra = {}
+                self.extra[key] = value
+
+    def keys(self) -> list[str]:
+        return [field for field in JOB_FIELDS if hasattr(self, field)] + list(self.extra or ())
+
+    def __getitem__(self, key: str):
+        try:
+            return getattr(self, key) if key in _JOB_FIELD_SET else self.extra[key]
+        except (AttributeError, KeyError, TypeError):
+            raise KeyError(key) from None
+
+    def get(self, key: str, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+class MemoryJobStore(JobStore):
+    """Single-process store; state is lost on restart"""
+    def __init__(self):
+        self.jobs: dict[str, JobRecord] = {}
+        self.batches: dict[str, dict] = {}
+        # Finished job ids in finish order, oldest first
+        self._finished: dict[str, float] = {}
+
+    def _update(self, job: JobRecord, fields: dict):
+        fields = _stamp_finished(fields)
+        job.update(fields)
+        if "finished_at" in fields:
+            self._finished[job["id"]] = fields["finished_at"]
+
+    async def create_jobs(self, jobs: list[dict]):
+        for job in jobs:
+            self.jobs[job["id"]] = JobRecord(job)
+
+    async def get_job(self, job_id: str) -> Optional[dict]:
+        job = self.jobs.get(job_id)
+        return dict(job) if job else None
+
+    async def get_jobs(self, job_ids: list[str]) -> list[dict]:
+        return [dict(self.jobs[i]) for i in job_ids if i in self.jobs]
+
+    async def get_client_jobs(self, client_id: str, created_after: float = 0) -> list[dict]:
+        jobs = [dict(job) for job in self.jobs.values()
+                if job.get("client_id") == client_id and job["created_at"] > created_after]
+        return sorted(jobs, key=lambda j: j["created_at"])
+
+    async def update_job(self, job_id: str, fields: dict, worker_id: Optional[str] = None) -> bool:
+        job = self.jobs.get(job_id)
+        if not job or (worker_id is not None and job.get("worker_id") != worker_id):
+            return False
+        self._update(job, fields)
+        return True
+
+    async def claim_job(self, worker_id: str, priorities: tuple = PRIORITIES) -> Optional[dict]:
+        queued = [job for job in self.jobs.values()
+                  if job["status"] == "queued" and job.get("priority", PRIORITIES[0]) in priorities]
+        if not queued:
+            return None
+        priority = min((job.get("priority", PRIORITIES[0]) for job in queued), key=PRIORITIES.index)
+        queued = [job for job in queued if job.get("priority", PRIORITIES[0]) == priority]
+        heads, running = {}, {}
+        for job in queued:
+            heads[job.get("client_id")] = min(heads.get(job.get("client_id"), job["created_at"]), job["created_at"])
+        for job in self.jobs.values():
+            if job["status"] == "processing":
+                running[job.get("client_id")] = running.get(job.get("client_id"), 0) + 1
+        client = _pick_client(heads, running)
+        job = min((j for j in queued if j.get("client_id") == client), key=lambda j: j["created_at"])
+        job.update(status="processing", worker_id=worker_id, heartbeat_at=time.time(),
+                   attempts=job.get("attempts", 0) + 1)
+        return dict(job)
+
+    async def cancel_job(self, job_id: str) -> Optional[dict]:
+        job = self.jobs.get(job_id)
+        if job is None:
+            return None
+        if job["status"] == "queued":
+            self._update(job, _CANCELLED)
+        elif job["status"] == "processing":
+            job.update(cancel_requested=True)
+        return dict(job)
+
+    async def requeue_stalled(self, lease_seconds: float, max_attempts: int) -> int:
+        cutoff = time.time() - lease_seconds
+        stalled = [job for job in self.jobs.values()
+                   if job["status"] == "processing" and (job.get("heartbeat_at") or 0) < cutoff]
+        for job in stalled:
+            self._update(job, _stalled_update(job, max_attempts))
+        return len(stalled)
+
+    async def count_queued(self, priority: Optional[str] = None) -> int:
+        return sum(1 for job in self.jobs.values() if job["status"] == "queued"
+                   and priority in (None, job.get("priority", PRIORITIES[0])))
+
+    async def expire_jobs(self, ttl_seconds: float, max_jobs: int, limit: int = 1000) -> list[dict]:
+        cutoff = time.time() - ttl_seconds
+        expired = []
+        while self._finished and len(expired) < limit:
+            job_id, finished_at = next(iter(self._finished.items()))
+            if finished_at >= cutoff and len(self.jobs) <= max_jobs:
+                break
+            del self._finished[job_id]
+            job = self.jobs.pop(job_id, None)
+            if job is not None:
+                expired.append(dict(job))
+        # A batch goes once none of its jobs is left
+        for batch_id in [b for b, batch in self.batches.items() if batch["created_at"] < cutoff]:
+            if not any(i in self.jobs for i in self.batches[batch_id]["conversion_ids"]):
+                del self.batches[batch_id]
+        return expired
+
+    async def create_batch(self, batch_id: str, conversion_ids: list[str]):
+        self.batches[batch_id] = {"batch_id": batch_id, "conversion_ids": conversion_ids, "created_at": time.time()}
+
+    async def get_batch(self, batch_id: str) -> Optional[dict]:
+        return self.batches.get(batch_id)
+
+class SQLiteJobStore(JobStore):
+    """Store in a local SQLite file shared by every process on the machine"""
+    def __init__(self, path: str):
+        self.path = str(path)
+        Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                status TEXT NOT NULL,
+                priority TEXT NOT NULL DEFAULT 'interactive',
+                client_id TEXT,
+                created_at REAL NOT NULL,
+                finished_at REAL,
+                worker_id TEXT,
+                heartbeat_at REAL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                data TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS batches (
+                id TEXT PRIMARY KEY,
+                created_at REAL NOT NULL,
+                conversion_ids TEXT NOT NULL
+            );
+        """)
+        # Stores created before priorities kept these fields in the JSON data
+        existing = {row["name"] for row in conn.execute("PRAGMA table_info(jobs)")}
+        for column, definition in (
+            ('priority', "TEXT NOT NULL DEFAULT 'interactive'"), ('client_id', 'TEXT'), ('finished_at', 'REAL')
+        ):
+            if column not in existing:
+                conn.execute(f"ALTER TABLE jobs ADD COLUMN {column} {definition}")
+                conn.execute(f"UPDATE jobs SET {column} = COALESCE(json_extract(data, '$.{column}'), {column})")
+        if 'finished_at' not in existing:
+            # Jobs that finished before expiry existed expire from their last heartbeat
+            conn.execute(
+                "UPDATE jobs SET finished_at = COALESCE(heartbeat_at, created_at) "
+                "WHERE status IN ('completed', 'failed', 'cancelled')"
+            )
+        conn.executescript("""
+            DROP INDEX IF EXISTS jobs_status;
+            DROP INDEX IF EXISTS jobs_client;
+            CREATE INDEX IF NOT EXISTS jobs_queue ON jobs (status, priority, client_id, created_at);
+            CREATE INDEX IF NOT EXISTS jobs_client_id ON jobs (client_id, created_at);
+            CREATE INDEX IF NOT EXISTS jobs_finished ON jobs (finished_at) WHERE finished_at IS NOT NULL;
+        """)
+
+    def _conn(self) -> sqlite3.Connection:
+        # One connection per thread; asyncio.to_thread runs calls on a thread pool
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _to_job(row: sqlite3.Row) -> dict:
+        job = json.loads(row["data"])
+        job["id"] = row["id"]
+        job.update({column: row[column] for column in _COLUMNS})
+        return job
+
+    @staticmethod
+    def _to_row(job: dict) -> tuple:
+        data = {k: v for k, v in job.items() if k != "id" and k not in _COLUMNS}
+        defaults = {"priority": PRIORITIES[0], "attempts": 0}
+        return (job["id"], *(job.get(column, defaults.get(column)) for column in _COLUMNS),
+                json.dumps(data, default=str))
+
+    def _write(self, conn: sqlite3.Connection, jobs: list[dict]):
+        columns = ('id', *_COLUMNS, 'data')
+        conn.executemany(
+            f"INSERT OR REPLACE INTO jobs ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+            [self._to_row(job) for job in jobs]
+        )
+
+    def _transaction(self, fn):
+        """Run fn(conn) under a write lock so read-modify-write is atomic across processes"""
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            result = fn(conn)
+            conn.execute("COMMIT")
+            return result
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    async def create_jobs(self, jobs: list[dict]):
+        await asyncio.to_thread(self._transaction, lambda conn: self._write(conn, jobs))
+
+    def _get_jobs(self, job_ids: list[str]) -> list[dict]:
+        found = {}
+        conn = self._conn()
+        # Stay under SQLite's bound-parameter limit
+        for start in range(0, len(job_ids), 500):
+            chunk = job_ids[start:start + 500]
+            rows = conn.execute(
+                f"SELECT * FROM jobs WHERE id IN ({','.join('?' * len(chunk))})", chunk
+            ).fetchall()
+            found.update((row["id"], self._to_job(row)) for row in rows)
+        return [found[i] for i in job_ids if i in found]
+
+    async def get_job(self, job_id: str) -> Optional[dict]:
+        jobs = await asyncio.to_thread(self._get_jobs, [job_id])
+        return jobs[0] if jobs else None
+
+    async def get_jobs(self, job_ids: list[str]) -> list[dict]:
+        return await asyncio.to_thread(self._get_jobs, job_ids)
+
+    async def get_client_jobs(self, client_id: str, created_after: float = 0) -> list[dict]:
+        def get():
+            return self._conn().execute(
+                "SELECT * FROM jobs WHERE client_id = ? AND created_at > ? ORDER BY created_at",
+                (client_id, created_after)
+            ).fetchall()
+        return [self._to_job(row) for row in await asyncio.to_thread(get)]
+
+    async def update_job(self, job_id: str, fields: dict, worker_id: Optional[str] = None) -> bool:
+        def update(conn):
+            row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if row is None or (worker_id is not None and row["worker_id"] != worker_id):
+                return False
+            self._write(conn, [{**self._to_job(row), **_stamp_finished(fields)}])
+            return True
+        return await asyncio.to_thread(self._transaction, update)
+
+    async def claim_job(self, worker_id: str, priorities: tuple = PRIORITIES) -> Optional[dict]:
+        def claim(conn):
+            for priority in (p for p in PRIORITIES if p in priorities):
+                heads = dict(conn.execute(
+                    "SELECT client_id, MIN(created_at) FROM jobs "
+                    "WHERE status = 'queued' AND priority = ? GROUP BY client_id",
+                    (priority,)
+                ).fetchall())
+                if heads:
+                    break
+            else:
+                return None
+            running = dict(conn.execute(
+                "SELECT client_id, COUNT(*) FROM jobs WHERE status = 'processing' GROUP BY client_id"
+            ).fetchall())
+            row = conn.execute(
+                "SELECT * FROM jobs WHERE status = 'queued' AND priority = ? AND client_id IS ? "
+                "ORDER BY created_at LIMIT 1",
+                (priority, _pick_client(heads, running))
+            ).fetchone()
+            job = self._to_job(row)
+            job.update(status="processing", worker_id=worker_id, heartbeat_at=time.time(),
+                       attempts=job["attempts"] + 1)
+            self._write(conn, [job])
+            return job
+        return await asyncio.to_thread(self._transaction, claim)
+
+    async def cancel_job(self, job_id: str) -> Optional[dict]:
+        def cancel(conn):
+            row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if row is None:
+                return None
+            job = self._to_job(row)
+            if job["status"] == "queued":
+                job.update(_stamp_finished(_CANCELLED))
+            elif job["status"] == "processing":
+                job["cancel_requested"] = True
+            else:
+                return job
+            self._write(conn, [job])
+            return job
+        return await asyncio.to_thread(self._transaction, cancel)
+
+    async def requeue_stalled(self, lease_seconds: float, max_attempts: int) -> int:
+        def requeue(conn):
+            rows = conn.execute(
+                "SELECT * FROM jobs WHERE status = 'processing' AND heartbeat_at < ?",
+                (time.time() - lease_seconds,)
+            ).fetchall()
+            jobs = [self._to_job(row) for row in rows]
+            self._write(conn, [{**job, **_stalled_update(job, max_attempts)} for job in jobs])
+            return len(jobs)
+        return await asyncio.to_thread(self._transaction, requeue)
+
+    async def count_queued(self, priority: Optional[str] = None) -> int:
+        def count():
+            if priority is None:
+                return self._conn().execute("SELECT COUNT(*) FROM jobs WHERE status = 'queued'").fetchone()[0]
+            return self._conn().execute(
+                "SELECT COUNT(*) FROM jobs WHERE status = 'queued' AND priority = ?", (priority,)
+            ).fetchone()[0]
+        return await asyncio.to_thread(count)
+
+    async def expire_jobs(self, ttl_seconds: float, max_jobs: int, limit: int = 1000) -> list[dict]:
+        def expire(conn):
+            cutoff = time.time() - ttl_seconds
+            rows = conn.execute(
+                "SELECT * FROM jobs WHERE finished_at < ? ORDER BY finished_at LIMIT ?", (cutoff, limit)
+            ).fetchall()
+            excess = conn.execute("SELECT COUNT(*) FROM jobs").fetchone()[0] - len(rows) - max_jobs
+            if excess > 0 and len(rows) < limit:
+                rows += conn.execute(
+                    "SELECT * FROM jobs WHERE finished_at >= ? ORDER BY finished_at LIMIT ?",
+                    (cutoff, min(excess, limit - len(rows)))
+                ).fetchall()
+            conn.executemany("DELETE FROM jobs WHERE id = ?", [(row["id"],) for row in rows])
+            # A batch goes once it is past the TTL and none of its jobs is left
+            conn.execute(
+                "DELETE FROM batches WHERE created_at < ? AND NOT EXISTS ("
+                "SELECT 1 FROM json_each(batches.conversion_ids) AS ids JOIN jobs ON jobs.id = ids.value)",
+                (cutoff,)
+            )
+            return [self._to_job(row) for row in rows]
+        return await asyncio.to_thread(self._transaction, expire)
+
+    async def create_batch(self, batch_id: str, conversion_ids: list[str]):
+        def create():
+            self._conn().execute(
+                "INSERT INTO batches (id, created_at, conversion_ids) VALUES (?, ?, ?)",
+                (batch_id, time.time(), json.dumps(conversion_ids))
+            )
+        await asyncio.to_thread(create)
+
+    async def get_batch(self, batch_id: str) -> Optional[dict]:
+        def get():
+            return self._conn().execute("SELECT * FROM batches WHERE id = ?", (batch_id,)).fetchone()
+        row = await asyncio.to_thread(get)
+        if row is None:
+            return None
+        return {"batch_id": row["id"], "conversion_ids": json.loads(row["conversion_ids"]), "created_at": row["created_at"]}
+
+    def close(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+class MongoJobStore(JobStore):
+    """Store in MongoDB, shared by API and worker processes on any machine"""
+    def __init__(self, db):
+        self.jobs = db.conversion_jobs
+        self.batches = db.conversion_batches
+        self._indexed = False
+
+    async def _ensure_indexes(self):
+        if not self._indexed:
+            await self.jobs.create_index([("status", 1), ("priority", 1), ("client_id", 1), ("created_at", 1)])
+            await self.jobs.create_index([("client_id", 1), ("created_at", 1)])
+            await self.jobs.create_index([("finished_at", 1)], sparse=True)
+            self._indexed = True
+
+    @staticmethod
+    def _to_job(document: Optional[dict]) -> Optional[dict]:
+        if document is None:
+            return None
+        document["id"] = document.pop("_id")
+        return document
+
+    async def create_jobs(self, jobs: list[dict]):
+        await self._ensure_indexes()
+        await self.jobs.insert_many([{**{k: v for k, v in job.items() if k != "id"}, "_id": job["id"]} for job in jobs])
+
+    async def get_job(self, job_id: str) -> Optional[dict]:
+        return self._to_job(await self.jobs.find_one({"_id": job_id}))
+
+    async def get_jobs(self, job_ids: list[str]) -> list[dict]:
+        found = {}
+        async for document in self.jobs.find({"_id": {"$in": job_ids}}):
+            job = self._to_job(document)
+            found[job["id"]] = job
+        return [found[i] for i in job_ids if i in found]
+
+    async def get_client_jobs(self, client_id: str, created_after: float = 0) -> list[dict]:
+        cursor = self.jobs.find({"client_id": client_id, "created_at": {"$gt": created_after}}).sort("created_at", 1)
+        return [self._to_job(document) async for document in cursor]
+
+    async def update_job(self, job_id: str, fields: dict, worker_id: Optional[str] = None) -> bool:
+        query = {"_id": job_id}
+        if worker_id is not None:
+            query["worker_id"] = worker_id
+        result = await self.jobs.update_one(query, {"$set": _stamp_finished(fields)})
+        return result.matched_count == 1
+
+    async def _group(self, match: dict, accumulator: dict) -> dict:
+        pipeline = [{"$match": match}, {"$group": {"_id": "$client_id", "value": accumulator}}]
+        return {group["_id"]: group["value"] async for group in self.jobs.aggregate(pipeline)}
+
+    async def claim_job(self, worker_id: str, priorities: tuple = PRIORITIES) -> Optional[dict]:
+        from pymongo import ReturnDocument
+        for priority in (p for p in PRIORITIES if p in priorities):
+            # Another worker may take the chosen job first; pick again then
+            for _ in range(3):
+                heads = await self._group({"status": "queued", "priority": priority}, {"$min": "$created_at"})
+                if not heads:
+                    break
+                running = await self._group({"status": "processing"}, {"$sum": 1})
+                document = await self.jobs.find_one_and_update(
+                    {"status": "queued", "priority": priority, "client_id": _pick_client(heads, running)},
+                    {"$set": {"status": "processing", "worker_id": worker_id, "heartbeat_at": time.time()},
+                     "$inc": {"attempts": 1}},
+                    sort=[("created_at", 1)],
+                    return_document=ReturnDocument.AFTER
+                )
+                if document:
+                    return self._to_job(document)
+        return None
+
+    async def cancel_job(self, job_id: str) -> Optional[dict]:
+        from pymongo import ReturnDocument
+        document = await self.jobs.find_one_and_update(
+            {"_id": job_id, "status": "queued"}, {"$set": _stamp_finished(_CANCELLED)},
+            return_document=ReturnDocument.AFTER
+        ) or await self.jobs.find_one_and_update(
+            {"_id": job_id, "status": "processing"}, {"$set": {"cancel_requested": True}},
+            return_document=ReturnDocument.AFTER
+        ) or await self.jobs.find_one({"_id": job_id})
+        return self._to_job(document)
+
+    async def requeue_stalled(self, lease_seconds: float, max_attempts: int) -> int:
+        stalled = {"status": "processing", "heartbeat_at": {"$lt": time.time() - lease_seconds}}
+        cancelled = await self.jobs.update_many(
+            {**stalled, "cancel_requested": True}, {"$set": _stamp_finished(_CANCELLED)}
+        )
+        failed = await self.jobs.update_many(
+            {**stalled, "attempts": {"$gte": max_attempts}},
+            {"$set": _stalled_update({"attempts": max_attempts}, max_attempts)}
+        )
+        requeued = await self.jobs.update_many(stalled, {"$set": _stalled_update({"attempts": 0}, max_attempts)})
+        return cancelled.modified_count + failed.modified_count + requeued.modified_count
+
+    async def count_queued(self, priority: Optional[str] = None) -> int:
+        query = {"status": "queued"}
+        if priority is not None:
+            query["priority"] = priority
+        return await self.jobs.count_documents(query)
+
+    async def expire_jobs(self, ttl_seconds: float, max_jobs: int, limit: int = 1000) -> list[dict]:
+        cutoff = time.time() - ttl_seconds
+        documents = await self.jobs.find({"finished_at": {"$lt": cutoff}}).sort("finished_at", 1).limit(limit).to_list(None)
+        excess = await self.jobs.estimated_document_count() - len(documents) - max_jobs
+        if excess > 0 and len(documents) < limit:
+            count = min(excess, limit - len(documents))
+            documents += await self.jobs.find({"finished_at": {"$gte": cutoff}}).sort("finished_at", 1).limit(count).to_list(None)
+        if documents:
+            await self.jobs.delete_many({"_id": {"$in": [document["_id"] for document in documents]}})
+        # A batch goes once none of its jobs is left
+        async for batch in self.batches.find({"created_at": {"$lt": cutoff}}, {"conversion_ids": 1}):
+            if not await self.jobs.count_documents({"_id": {"$in": batch["conversion_ids"]}}, limit=1):
+                await self.batches.delete_one({"_id": batch["_id"]})
+        return [self._to_job(document) for document in documents]
+
+    async def create_batch(self, batch_id: str, conversion_ids: list[str]):
+        await self.batches.insert_one({"_id": batch_id, "conversion_ids": conversion_ids, "created_at": time.time()})
+
+    async def get_batch(self, batch_id: str) -> Optional[dict]:
+        document = await self.batches.find_one({"_id": batch_id})
+        if document is None:
+            return None
+        document["batch_id"] = document.pop("_id")
+        return document
+
+def create_job_store(backend: str, sqlite_path: Optional[str] = None, db=None) -> JobStore:
+    """Build the configured backend: 'sqlite', 'mongo' or 'memory'"""
+    if backend == 'sqlite':
+        return SQLiteJobStore(sqlite_path)
+    if backend == 'mongo':
+        return MongoJobStore(db)
+    if backend == 'memory':
+        return MemoryJobStore()
+    raise ValueError(f"Unknown job store backend: {backend}")
@@ -0,0 +1,86 @@
+"""
+In-process fan-out of job progress to streaming clients.
+
+Jobs running in this process publish every status and progress change as
+it happens; each open progress stream holds a subscription that keeps only
+the latest event per job, so a slow client never makes the bus buffer more
+than one event for each job it watches. Jobs running in other processes
+are not seen here; streams pick those up from the job store instead.
+"""
+import asyncio
+from typing import Optional
+
+# Job fields sent to clients
+EVENT_FIELDS = ('status', 'progress', 'message', 'output_file_id', 'outputs')
+
+def job_event(job: dict) -> dict:
+    """Client-facing progress event of a job"""
+    return {
+        "conversion_id": job["id"],
+        "batch_id": job.get("batch_id"),
+        **{field: job.get(field) for field in EVENT_FIELDS}
+    }
+
+class Subscription:
+    """Latest pending event per job of one progress stream"""
+    def __init__(
+        self,
+        job_ids: Optional[set] = None,
+        batch_id: Optional[str] = None,
+        client_id: Optional[str] = None
+    ):
+        self.job_ids = job_ids
+        self.batch_id = batch_id
+        self.client_id = client_id
+        self._pending: dict[str, dict] = {}
+        self._ready = asyncio.Event()
+
+    def matches(self, job: dict) -> bool:
+        if self.job_ids is not None and job["id"] in self.job_ids:
+            return True
+        if self.batch_id is not None and job.get("batch_id") == self.batch_id:
+            return True
+        return self.client_id is not None and job.get("client_id") == self.client_id
+
+    def push(self, event: dict):
+        # A newer event replaces one the client has not received yet
+        self._pending[event["conversion_id"]] = event
+        self._ready.set()
+
+    async def get(self, timeout: float) -> list[dict]:
+        """Pending events, waiting up to timeout for the first one"""
+        if not self._pending:
+            try:
+                await asyncio.wait_for(self._ready.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        events = list(self._pending.values())
+        self._pending.clear()
+        self._ready.clear()
+        return events
+
+class ProgressBus:
+    def __init__(self):
+        self._subscriptions: set[Subscription] = set()
+        # Jobs running in this process; their events arrive here first
+        self.local_jobs: set[str] = set()
+
+    def subscribe(self, **scope) -> Subscription:
+        subscription = Subscription(**scope)
+        self._subscriptions.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        self._subscriptions.discard(subscription)
+
+    def publish(self, job: dict):
+        if not self._subscriptions:
+            return
+        event = job_event(job)
+        for subscription in self._subscriptions:
+            if subscription.matches(job):
+                subscription.push(event)
+
+    @property
+    def subscribers(self) -> int:
+        return len(self._subscriptions)
@@ -0,0 +1,187 @@
+"""
+Persistent cache of conversion results.
+
+Entries are keyed on (source content digest, target format, normalized
+options) and stored as hard links to the converted file, so caching a
+result costs no copy (unless the cache is on another filesystem than the
+outputs). Eviction is least-recently-used by total size.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator, Optional
+
+from .conversion_service import DOCUMENT_TARGETS, link_or_copy, with_defaults
+
+# Counters kept in the index; 'bytes' is the total size of the entries
+_COUNTERS = ('bytes', 'hits', 'misses', 'evictions')
+
+# Options that change how a conversion runs, not what it produces
+RUNTIME_OPTIONS = ('page_window',)
+
+def normalize_options(target_format: str, options: Optional[dict]) -> dict:
+    """Fill in the converter's defaults and drop options that cannot affect the output,
+    so equal requests share a key"""
+    file_type = 'document' if target_format.upper() in DOCUMENT_TARGETS else 'image'
+    normalized = with_defaults(file_type, options)
+    for name in RUNTIME_OPTIONS:
+        normalized.pop(name, None)
+    if file_type == 'image' and not normalized.get('resize'):
+        normalized.pop('width', None)
+        normalized.pop('height', None)
+    return {k: v for k, v in normalized.items() if v is not None}
+
+class ResultCache:
+    """LRU cache of converted files, shared by every process using cache_dir.
+
+    Recency, sizes and the hit/miss counters live in a SQLite index next to
+    the entries (the files' mtimes are left alone: cached files are hard
+    linked to outputs, which age by their own clock), so all API processes
+    see one LRU order and one size budget.
+    """
+    def __init__(self, cache_dir: str, max_bytes: int):
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.path = str(self.cache_dir / "index.db")
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS entries (
+                key TEXT PRIMARY KEY,
+                path TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                used_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS entries_used ON entries (used_at);
+            CREATE TABLE IF NOT EXISTS counters (
+                name TEXT PRIMARY KEY,
+                value INTEGER NOT NULL
+            );
+        """)
+        with self._transaction() as conn:
+            conn.executemany(
+                "INSERT OR IGNORE INTO counters (name, value) VALUES (?, 0)",
+                [(name,) for name in _COUNTERS]
+            )
+            if conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0] == 0:
+                self._load(conn)
+
+    def _conn(self) -> sqlite3.Connection:
+        # One connection per thread; the API calls in through asyncio.to_thread
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def _load(self, conn: sqlite3.Connection):
+        """Index entries written before the index existed, oldest mtime first"""
+        rows = []
+        for bucket in os.scandir(self.cache_dir):
+            if len(bucket.name) != 2 or not bucket.is_dir():
+                continue
+            for entry in os.scandir(bucket.path):
+                if entry.is_file() and not entry.name.startswith('.'):
+                    stat = entry.stat()
+                    rows.append((entry.name.split('.')[0], entry.path, stat.st_size, stat.st_mtime))
+        conn.executemany("INSERT OR IGNORE INTO entries (key, path, size, used_at) VALUES (?, ?, ?, ?)", rows)
+        conn.execute("UPDATE counters SET value = (SELECT COALESCE(SUM(size), 0) FROM entries) WHERE name = 'bytes'")
+
+    @staticmethod
+    def _count(conn: sqlite3.Connection, name: str, delta: int = 1):
+        conn.execute("UPDATE counters SET value = value + ? WHERE name = ?", (delta, name))
+
+    @staticmethod
+    def make_key(source_digest: str, target_format: str, options: Optional[dict] = None) -> str:
+        payload = json.dumps(
+            {"source": source_digest, "format": target_format.upper(), "options": normalize_options(target_format, options)},
+            sort_keys=True
+        )
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def get(self, key: str) -> Optional[Path]:
+        """Return the cached artifact for key, if any (blocking I/O)"""
+        with self._transaction() as conn:
+            row = conn.execute("SELECT path, size FROM entries WHERE key = ?", (key,)).fetchone()
+            if row and Path(row[0]).exists():
+                conn.execute("UPDATE entries SET used_at = ? WHERE key = ?", (time.time(), key))
+                self._count(conn, 'hits')
+                return Path(row[0])
+            if row:
+                # Removed behind our back
+                conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                self._count(conn, 'bytes', -row[1])
+            self._count(conn, 'misses')
+            return None
+
+    def put(self, key: str, output_path: Path) -> Optional[Path]:
+        """Cache a freshly converted file by linking it into the cache (blocking I/O)"""
+        size = output_path.stat().st_size
+        if size > self.max_bytes:
+            return None
+
+        cache_path = self.cache_dir / key[:2] / f"{key}{output_path.suffix}"
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            link_or_copy(output_path, cache_path)
+        except FileExistsError:
+            return cache_path
+
+        with self._transaction() as conn:
+            replaced = conn.execute("SELECT size FROM entries WHERE key = ?", (key,)).fetchone()
+            if replaced:
+                self._count(conn, 'bytes', -replaced[0])
+            conn.execute(
+                "INSERT OR REPLACE INTO entries (key, path, size, used_at) VALUES (?, ?, ?, ?)",
+                (key, str(cache_path), size, time.time())
+            )
+            self._count(conn, 'bytes', size)
+            self._evict(conn)
+        return cache_path
+
+    def _evict(self, conn: sqlite3.Connection):
+        total = conn.execute("SELECT value FROM counters WHERE name = 'bytes'").fetchone()[0]
+        while total > self.max_bytes:
+            row = conn.execute("SELECT key, path, size FROM entries ORDER BY used_at LIMIT 1").fetchone()
+            if row is None:
+                break
+            conn.execute("DELETE FROM entries WHERE key = ?", (row[0],))
+            self._count(conn, 'bytes', -row[2])
+            self._count(conn, 'evictions')
+            total -= row[2]
+            try:
+                os.remove(row[1])
+            except FileNotFoundError:
+                pass
+
+    def stats(self) -> dict:
+        conn = self._conn()
+        counters = dict(conn.execute("SELECT name, value FROM counters").fetchall())
+        lookups = counters['hits'] + counters['misses']
+        return {
+            "entries": conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0],
+            "bytes": counters['bytes'],
+            "max_bytes": self.max_bytes,
+            "hits": counters['hits'],
+            "misses": counters['misses'],
+            "evictions": counters['evictions'],
+            "hit_rate": round(counters['hits'] / lookups, 4) if lookups else 0.0
+        }
@@ -0,0 +1,151 @@
+"""
+Memory-aware admission control for conversion jobs.
+
+Every job gets a peak memory estimate from the header metadata probed at
+upload time. Jobs are admitted in arrival order while the estimates of the
+running jobs fit in the memory budget; the rest wait in a queue, where
+interactive jobs are placed ahead of bulk ones. The queue is bounded before
+jobs get here: the API turns new work away with a retry hint (see
+retry_after) while the job store's queue is full.
+"""
+import asyncio
+import math
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Optional
+
+from .conversion_service import with_defaults
+from .file_probe import PDF_RASTER_DPI
+from .tiled_image import STRIP_BYTES
+
+# Interpreter, codecs and encoder buffers of a worker, whatever the input
+BASE_JOB_BYTES = 64 * 1024 * 1024  # 64MB
+
+class Ticket:
+    """A job's place in the admission queue"""
+    __slots__ = ('cost', 'priority', 'future', 'admitted_at')
+
+    def __init__(self, cost: int, priority: int = 0):
+        self.cost = cost
+        self.priority = priority
+        self.future: Optional[asyncio.Future] = None
+        self.admitted_at: Optional[float] = None
+
+class AdmissionScheduler:
+    def __init__(
+        self,
+        memory_budget: int,
+        max_running: int,
+        large_image_pixels: Optional[int] = None,
+        image_memory_limit: Optional[int] = None
+    ):
+        self.memory_budget = memory_budget
+        self.max_running = max_running
+        self.large_image_pixels = large_image_pixels
+        self.image_memory_limit = image_memory_limit
+        self.reserved = 0
+        self.running = 0
+        self.admitted = 0
+        self._waiting: deque[Ticket] = deque()
+        # Moving average of how long an admitted job holds its reservation
+        self._avg_duration = 5.0
+
+    def estimate(self, metadata: Optional[dict], file_type: str, options: Optional[dict] = None, outputs: int = 1) -> int:
+        """Estimate a job's peak memory from the probed header metadata"""
+        metadata = metadata or {}
+        options = with_defaults(file_type, options)
+        decode_bytes = metadata.get("decode_bytes") or 0
+
+        if file_type == 'image':
+            pixels = (metadata.get("width") or 0) * (metadata.get("height") or 0)
+            if self.large_image_pixels and pixels > self.large_image_pixels:
+                # Strip mode: a couple of bands plus at most one in-memory raster
+                return BASE_JOB_BYTES + 2 * STRIP_BYTES + min(decode_bytes, self.image_memory_limit or decode_bytes)
+            frames = metadata.get("frames") or 1
+            # Decoded source plus one working copy per output (resize, mode conversion);
+            # animated outputs are buffered frame by frame by the encoder
+            return BASE_JOB_BYTES + decode_bytes * (1 + outputs * frames)
+
+        if metadata.get("pages"):
+            # decode_bytes is one page at the probe DPI; two windows are alive at once
+            scale = (options['dpi'] / PDF_RASTER_DPI) ** 2
+            window = min(metadata["pages"], options['page_window'])
+            return BASE_JOB_BYTES + int(decode_bytes * scale * window * 2)
+
+        return BASE_JOB_BYTES + (metadata.get("size") or 0) * 4
+
+    def retry_after(self, backlog: Optional[int] = None) -> int:
+        """Seconds until a queue of `backlog` jobs (default: ours) likely has room again"""
+        backlog = (len(self._waiting) if backlog is None else backlog) + 1
+        return max(1, math.ceil(self._avg_duration * backlog / max(1, self.max_running)))
+
+    def _fits(self, ticket: Ticket) -> bool:
+        if self.running >= self.max_running:
+            return False
+        # A job larger than the whole budget still runs, but only on its own
+        return self.running == 0 or self.reserved + ticket.cost <= self.memory_budget
+
+    def _admit(self, ticket: Ticket):
+        self.reserved += ticket.cost
+        self.running += 1
+        self.admitted += 1
+        ticket.admitted_at = time.monotonic()
+
+    def enqueue(self, cost: int, priority: int = 0) -> Ticket:
+        """Queue behind jobs of equal or higher priority (0 is highest)"""
+        ticket = Ticket(cost, priority)
+        ticket.future = asyncio.get_running_loop().create_future()
+        position = next((i for i, t in enumerate(self._waiting) if t.priority > priority), len(self._waiting))
+        self._waiting.insert(position, ticket)
+        self._wake()
+        return ticket
+
+    def _wake(self):
+        # Strict queue order: a big job at the head is not starved by small ones
+        while self._waiting and self._fits(self._waiting[0]):
+            ticket = self._waiting.popleft()
+            self._admit(ticket)
+            if not ticket.future.done():
+                ticket.future.set_result(True)
+
+    def is_admitted(self, ticket: Ticket) -> bool:
+        return ticket.admitted_at is not None
+
+    def release(self, ticket: Ticket):
+        """Give back a ticket, admitted or still waiting"""
+        if ticket.admitted_at is None:
+            try:
+                self._waiting.remove(ticket)
+            except ValueError:
+                pass
+            if not ticket.future.done():
+                ticket.future.cancel()
+        else:
+            self.reserved -= ticket.cost
+            self.running -= 1
+            duration = time.monotonic() - ticket.admitted_at
+            self._avg_duration = 0.8 * self._avg_duration + 0.2 * duration
+            ticket.admitted_at = None
+        self._wake()
+
+    @asynccontextmanager
+    async def slot(self, ticket: Ticket):
+        """Wait until the ticket is admitted and hold its reservation for the block"""
+        try:
+            if not ticket.future.done():
+                await ticket.future
+            yield
+        finally:
+            self.release(ticket)
+
+    def stats(self) -> dict:
+        return {
+            "memory_budget": self.memory_budget,
+            "reserved_bytes": self.reserved,
+            "running": self.running,
+            "max_running": self.max_running,
+            "waiting": len(self._waiting),
+            "admitted": self.admitted,
+            "avg_job_seconds": round(self._avg_duration, 2)
+        }
@@ -0,0 +1,59 @@
+"""
+Hash-prefix sharded layout of the upload and output stores.
+
+A file `<file_id><ext>` is stored at `<root>/<aa>/<bb>/<file_id><ext>`, where
+aa and bb are the first two bytes (hex) of the SHA-1 of its ID. Two levels
+of 256 buckets keep every directory small, so creating, finding and
+deleting a file costs the same with a thousand files or a billion.
+
+Files still in the old flat layout (`<root>/<file_id><ext>`) are found
+until `migrate_storage.py` has moved them into their shards.
+"""
+import hashlib
+import os
+from pathlib import Path
+from typing import Iterator
+
+SHARD_LEVELS = 2
+
+def file_id_of(path: Path) -> str:
+    """IDs are the file name up to the first dot"""
+    return Path(path).name.split('.')[0]
+
+def shard_dir(root: Path, file_id: str) -> Path:
+    """Bucket directory of an ID under root"""
+    digest = hashlib.sha1(file_id.encode('utf-8')).hexdigest()
+    return Path(root).joinpath(*(digest[2 * level:2 * level + 2] for level in range(SHARD_LEVELS)))
+
+def sharded_path(root: Path, name: str, create: bool = False) -> Path:
+    """Where the file `name` belongs; create makes its bucket directory"""
+    path = shard_dir(root, file_id_of(Path(name))) / name
+    if create:
+        path.parent.mkdir(parents=True, exist_ok=True)
+    return path
+
+def _is_bucket(entry: os.DirEntry) -> bool:
+    return len(entry.name) == 2 and entry.is_dir()
+
+def iter_flat(root: Path) -> Iterator[os.DirEntry]:
+    """Files left in the old flat layout"""
+    for entry in os.scandir(root):
+        if entry.is_file() and not entry.name.startswith('.'):
+            yield entry
+
+def iter_files(root: Path) -> Iterator[os.DirEntry]:
+    """Every stored file under root, flat or sharded"""
+    root = Path(root)
+    if not root.exists():
+        return
+    yield from iter_flat(root)
+
+    def walk(directory: Path, level: int):
+        for entry in os.scandir(directory):
+            if level < SHARD_LEVELS:
+                if _is_bucket(entry):
+                    yield from walk(Path(entry.path), level + 1)
+            elif entry.is_file() and not entry.name.startswith('.'):
+                yield entry
+
+    yield from walk(root, 0)
@@ -0,0 +1,259 @@
+"""
+Storage backends for uploads and outputs.
+
+The local disk is always the working copy: conversions read and write
+local files. A backend decides where those files live besides that disk.
+`LocalStorage` keeps them only there (shared disks are needed across
+machines). `S3Storage` mirrors each file to an S3-compatible bucket (AWS,
+MinIO, ...) under the same relative path. Any process can then fetch a
+file it has not seen, and downloads can be redirected to presigned URLs.
+
+Content-addressed files shared by several IDs (upload blobs) are stored
+once: each ID adds a reference to the shared file. Removing the last
+reference leaves the stored file in place; `delete_orphans` removes files
+that have been left without references for a grace period, so a reference
+added while the last one goes never finds its file deleted.
+"""
+import os
+import shutil
+import time
+import uuid
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Optional
+
+from .sharding import file_id_of, shard_dir
+
+class StorageBackend(ABC):
+    """Mirror of the files under `root`, addressed by their local path"""
+    # True when files may exist in the backend without a local copy
+    remote = False
+
+    def __init__(self, root: Path):
+        self.root = Path(root)
+
+    def key(self, path: Path) -> str:
+        return Path(path).relative_to(self.root).as_posix()
+
+    @abstractmethod
+    def upload(self, path: Path):
+        """Store a freshly written local file"""
+
+    @abstractmethod
+    def download(self, path: Path) -> bool:
+        """Make sure a local copy of the file exists; False when it is stored nowhere.
+
+        A fetched copy keeps the stored file's modification time.
+        """
+
+    @abstractmethod
+    def delete(self, path: Path):
+        """Remove the stored file (the local copy is the caller's)"""
+
+    @abstractmethod
+    def find(self, file_id: str) -> Optional[Path]:
+        """Local path of a stored file by ID, without fetching it"""
+
+    @abstractmethod
+    def add_reference(self, path: Path, ref_id: str):
+        """Count ref_id as a user of a shared local file, storing the file unless it already is"""
+
+    @abstractmethod
+    def remove_reference(self, path: Path, ref_id: str):
+        """Stop counting ref_id as a user of a shared file (see delete_orphans)"""
+
+    def delete_orphans(self, directory: Path, grace: float) -> int:
+        """Remove stored shared files under directory that have no users and are older
+        than grace seconds; returns how many went"""
+        return 0
+
+    def presigned_url(self, path: Path, expires: int) -> Optional[str]:
+        """A URL the client can fetch the file from directly, if the backend has one"""
+        return None
+
+class LocalStorage(StorageBackend):
+    """Files live on the local disk only"""
+
+    def upload(self, path: Path):
+        pass
+
+    def download(self, path: Path) -> bool:
+        return Path(path).exists()
+
+    def delete(self, path: Path):
+        pass
+
+    def find(self, file_id: str) -> Optional[Path]:
+        return None
+
+    def add_reference(self, path: Path, ref_id: str):
+        pass
+
+    def remove_reference(self, path: Path, ref_id: str):
+        pass
+
+class S3Storage(StorageBackend):
+    """Files are mirrored to `<prefix><relative path>` in an S3-compatible bucket"""
+    remote = True
+
+    def __init__(
+        self,
+        root: Path,
+        bucket: str,
+        prefix: str = "",
+        endpoint_url: Optional[str] = None,
+        region: Optional[str] = None
+    ):
+        super().__init__(root)
+        # Optional dependency: only needed when this backend is configured
+        import boto3
+
+        self.bucket = bucket
+        self.prefix = prefix
+        # Credentials come from the usual AWS environment/config chain
+        self._client = boto3.client("s3", endpoint_url=endpoint_url, region_name=region)
+
+    def key(self, path: Path) -> str:
+        return self.prefix + super().key(path)
+
+    def upload(self, path: Path):
+        # upload_file streams the file and switches to multipart for large ones
+        self._client.upload_file(str(path), self.bucket, self.key(path))
+
+    def _is_missing(self, error) -> bool:
+        return error.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound")
+
+    def download(self, path: Path) -> bool:
+        from botocore.exceptions import ClientError
+
+        path = Path(path)
+        if path.exists():
+            return True
+        try:
+            response = self._client.get_object(Bucket=self.bucket, Key=self.key(path))
+        except ClientError as e:
+            if self._is_missing(e):
+                return False
+            raise
+        path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = path.with_name(f".{uuid.uuid4()}.tmp")
+        try:
+            with response["Body"] as body, open(temp_path, 'wb') as f:
+                shutil.copyfileobj(body, f, 1024 * 1024)
+            # Ages (and so expiry) count from when the file was stored, not fetched
+            modified = response["LastModified"].timestamp()
+            os.utime(temp_path, (modified, modified))
+            os.replace(temp_path, path)
+        except BaseException:
+            temp_path.unlink(missing_ok=True)
+            raise
+        return True
+
+    def delete(self, path: Path):
+        self._client.delete_object(Bucket=self.bucket, Key=self.key(path))
+
+    def _references(self, path: Path) -> str:
+        return f"{self.key(path)}.refs/"
+
+    def _is_referenced(self, key: str) -> bool:
+        listing = self._client.list_objects_v2(Bucket=self.bucket, Prefix=f"{key}.refs/", MaxKeys=1)
+        return bool(listing.get("KeyCount"))
+
+    def add_reference(self, path: Path, ref_id: str):
+        from botocore.exceptions import ClientError
+
+        # The reference goes first, so a concurrent last removal sees it and keeps the file
+        self._client.put_object(Bucket=self.bucket, Key=self._references(path) + ref_id, Body=b"")
+        try:
+            self._client.head_object(Bucket=self.bucket, Key=self.key(path))
+        except ClientError as e:
+            if not self._is_missing(e):
+                raise
+            self.upload(path)
+
+    def remove_reference(self, path: Path, ref_id: str):
+        # The file stays: a concurrent add_reference may have just found it (see delete_orphans)
+        self._client.delete_object(Bucket=self.bucket, Key=self._references(path) + ref_id)
+
+    def delete_orphans(self, directory: Path, grace: float) -> int:
+        stored, referenced = {}, set()
+        paginator = self._client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=self.key(directory) + "/"):
+            for item in page.get("Contents", []):
+                owner, refs, _ = item["Key"].partition(".refs/")
+                if refs:
+                    referenced.add(owner)
+                else:
+                    stored[item["Key"]] = item["LastModified"].timestamp()
+        cutoff = time.time() - grace
+        return sum(
+            1 for key, modified in stored.items()
+            if key not in referenced and modified < cutoff and self._delete_orphan(key)
+        )
+
+    def _delete_orphan(self, key: str) -> bool:
+        """Delete an unreferenced file, putting it back if a reference appears meanwhile.
+
+        add_reference stores its reference before checking for the file: a
+        reference stored after the recheck below finds the file gone and
+        uploads it again; one stored before it is seen, and the file is
+        restored from a copy kept until then.
+        """
+        from botocore.exceptions import ClientError
+
+        if self._is_referenced(key):
+            return False
+        # Unique per sweep, so concurrent janitors never share (or delete) each other's copy
+        kept = f"{key}.{uuid.uuid4().hex}.deleting"
+        try:
+            self._client.copy_object(Bucket=self.bucket, Key=kept, CopySource={"Bucket": self.bucket, "Key": key})
+        except ClientError as e:
+            if self._is_missing(e):
+                return False
+            raise
+        self._client.delete_object(Bucket=self.bucket, Key=key)
+        restored = self._is_referenced(key)
+        if restored:
+            self._client.copy_object(Bucket=self.bucket, Key=key, CopySource={"Bucket": self.bucket, "Key": kept})
+        # A copy left behind by an error is itself an orphan, and goes in a later sweep
+        self._client.delete_object(Bucket=self.bucket, Key=kept)
+        return not restored
+
+    def find(self, file_id: str) -> Optional[Path]:
+        # IDs are unique, so the ID's shard holds at most a handful of matches
+        listing = self._client.list_objects_v2(
+            Bucket=self.bucket, Prefix=self.key(shard_dir(self.root, file_id) / file_id), MaxKeys=10
+        )
+        for item in listing.get("Contents", []):
+            relative = item["Key"][len(self.prefix):]
+            if file_id_of(Path(relative)) == file_id:
+                return self.root / relative
+        return None
+
+    def presigned_url(self, path: Path, expires: int) -> Optional[str]:
+        return self._client.generate_presigned_url(
+            "get_object",
+            Params={
+                "Bucket": self.bucket,
+                "Key": self.key(path),
+                "ResponseContentDisposition": f'attachment; filename="{Path(path).name}"'
+            },
+            ExpiresIn=expires
+        )
+
+def create_storage(
+    kind: str,
+    root: Path,
+    prefix: str = "",
+    bucket: Optional[str] = None,
+    endpoint_url: Optional[str] = None,
+    region: Optional[str] = None
+) -> StorageBackend:
+    """Build the configured backend: 'local' or 's3'"""
+    if kind == 'local':
+        return LocalStorage(root)
+    if kind == 's3':
+        if not bucket:
+            raise ValueError("S3_BUCKET is required for the s3 storage backend")
+        return S3Storage(root, bucket, prefix, endpoint_url, region)
+    raise ValueError(f"Unknown storage backend: {kind}")
@@ -0,0 +1,176 @@
+"""
+Strip-based reading and writing of very large rasters.
+
+Uncompressed TIFF and BMP sources store their pixels as raw rows at known
+file offsets, so any band of rows can be read without decoding the rest of
+the image. PNG and baseline TIFF outputs can likewise be written one band
+at a time. Together they let a gigapixel image be converted with memory
+bounded by a single band.
+"""
+import math
+import struct
+import zlib
+from pathlib import Path
+from typing import Optional
+from PIL import Image
+
+# Target size of one band of decoded pixels
+STRIP_BYTES = 64 * 1024 * 1024  # 64MB
+
+# Bits per pixel of the raw layouts Pillow uses for uncompressed TIFF/BMP
+RAW_BITS = {
+    '1': 1, '1;I': 1, 'L': 8, 'L;I': 8, 'P': 8, 'LA': 16,
+    'RGB': 24, 'BGR': 24, 'RGBX': 32, 'RGBA': 32, 'BGRA': 32, 'BGRX': 32, 'CMYK': 32,
+}
+
+class StripReader:
+    """Read row bands of an image straight from its raw tiles"""
+    def __init__(self, img: Image.Image):
+        self.path = img.filename
+        self.mode = img.mode
+        self.size = img.size
+        self.palette = img.getpalette() if img.mode == 'P' else None
+        self.tiles = []
+        for codec, extents, offset, args in img.tile:
+            args = args if isinstance(args, tuple) else (args,)
+            rawmode = args[0]
+            stride = args[1] if len(args) > 1 else 0
+            orientation = args[2] if len(args) > 2 else 1
+            tile_w = extents[2] - extents[0]
+            self.tiles.append((extents, offset, rawmode, stride or math.ceil(tile_w * RAW_BITS[rawmode] / 8), orientation))
+        self._fp = open(self.path, 'rb')
+
+    @classmethod
+    def open(cls, img: Image.Image) -> Optional["StripReader"]:
+        """Return a reader when every tile is raw rows, else None"""
+        if not img.tile or not isinstance(img.filename, str):
+            return None
+        for codec, extents, offset, args in img.tile:
+            args = args if isinstance(args, tuple) else (args,)
+            orientation = args[2] if len(args) > 2 else 1
+            if codec != 'raw' or args[0] not in RAW_BITS or orientation not in (1, -1):
+                return None
+        return cls(img)
+
+    def read(self, top: int, bottom: int) -> Image.Image:
+        """Decode rows [top, bottom) into a new image"""
+        band = Image.new(self.mode, (self.size[0], bottom - top))
+        if self.palette:
+            band.putpalette(self.palette)
+        for (x0, y0, x1, y1), offset, rawmode, stride, orientation in self.tiles:
+            first, last = max(y0, top), min(y1, bottom)
+            if first >= last:
+                continue
+            # Bottom-up tiles (BMP) store their last row first
+            skip = first - y0 if orientation == 1 else y1 - last
+            self._fp.seek(offset + skip * stride)
+            data = self._fp.read((last - first) * stride)
+            piece = Image.frombytes(self.mode, (x1 - x0, last - first), data, 'raw', rawmode, stride, orientation)
+            band.paste(piece, (x0, first - top))
+        return band
+
+    def close(self):
+        self._fp.close()
+
+class PngStripWriter:
+    """Write an 8-bit PNG band by band through one streaming deflate"""
+    COLOR_TYPES = {'L': 0, 'RGB': 2, 'LA': 4, 'RGBA': 6}
+
+    def __init__(self, path: Path, size: tuple[int, int], mode: str):
+        self.mode = mode if mode in self.COLOR_TYPES else ('RGBA' if 'A' in mode or mode == 'P' else 'RGB')
+        self._fp = open(path, 'wb')
+        self._compressor = zlib.compressobj(6)
+        self._fp.write(b'\x89PNG\r\n\x1a\n')
+        self._chunk(b'IHDR', struct.pack('>IIBBBBB', size[0], size[1], 8, self.COLOR_TYPES[self.mode], 0, 0, 0))
+
+    def _chunk(self, kind: bytes, data: bytes):
+        self._fp.write(struct.pack('>I', len(data)) + kind + data)
+        self._fp.write(struct.pack('>I', zlib.crc32(kind + data) & 0xffffffff))
+
+    def write(self, band: Image.Image):
+        if band.mode != self.mode:
+            band = band.convert(self.mode)
+        raw = band.tobytes()
+        stride = len(raw) // band.height
+        # Filter type 0 (none) in front of every row
+        rows = b''.join(b'\x00' + raw[i:i + stride] for i in range(0, len(raw), stride))
+        data = self._compressor.compress(rows)
+        if data:
+            self._chunk(b'IDAT', data)
+
+    def close(self):
+        self._chunk(b'IDAT', self._compressor.flush())
+        self._chunk(b'IEND', b'')
+        self._fp.close()
+
+class TiffStripWriter:
+    """Write an uncompressed baseline TIFF, one strip per band"""
+    PHOTOMETRIC = {'L': 1, 'RGB': 2, 'RGBA': 2}
+    MAX_BYTES = 2 ** 32 - 1  # classic TIFF uses 32-bit offsets
+
+    def __init__(self, path: Path, size: tuple[int, int], mode: str):
+        self.mode = mode if mode in self.PHOTOMETRIC else ('RGBA' if 'A' in mode or mode == 'P' else 'RGB')
+        self.size = size
+        self.bands = len(self.mode)
+        if size[0] * size[1] * self.bands > self.MAX_BYTES:
+            raise ValueError("TIFF çıktısı 4GB sınırını aşıyor")
+        self._fp = open(path, 'wb')
+        # Header; the IFD offset is patched in once the strips are written
+        self._fp.write(b'II*\x00\x00\x00\x00\x00')
+        self.offsets: list[int] = []
+        self.counts: list[int] = []
+        self.rows_per_strip = None
+
+    def write(self, band: Image.Image):
+        if band.mode != self.mode:
+            band = band.convert(self.mode)
+        if self.rows_per_strip is None:
+            self.rows_per_strip = band.height
+        data = band.tobytes()
+        self.offsets.append(self._fp.tell())
+        self.counts.append(len(data))
+        self._fp.write(data)
+
+    def _array(self, fmt: str, values: list[int]) -> int:
+        """Write an out-of-line value array and return its offset"""
+        if self._fp.tell() % 2:
+            self._fp.write(b'\x00')
+        offset = self._fp.tell()
+        self._fp.write(struct.pack(f'<{len(values)}{fmt}', *values))
+        return offset
+
+    def close(self):
+        SHORT, LONG = 3, 4
+
+        def entry(tag, kind, values, fmt):
+            # Values that fit in 4 bytes are stored inline
+            if len(values) * struct.calcsize(fmt) <= 4:
+                inline = struct.pack(f'<{len(values)}{fmt}', *values).ljust(4, b'\x00')
+                return struct.pack('<HHI', tag, kind, len(values)) + inline
+            return struct.pack('<HHII', tag, kind, len(values), self._array(fmt, values))
+
+        entries = [
+            entry(256, LONG, [self.size[0]], 'I'),
+            entry(257, LONG, [self.size[1]], 'I'),
+            entry(258, SHORT, [8] * self.bands, 'H'),
+            entry(259, SHORT, [1], 'H'),
+            entry(262, SHORT, [self.PHOTOMETRIC[self.mode]], 'H'),
+            entry(273, LONG, self.offsets, 'I'),
+            entry(277, SHORT, [self.bands], 'H'),
+            entry(278, LONG, [self.rows_per_strip or self.size[1]], 'I'),
+            entry(279, LONG, self.counts, 'I'),
+            entry(284, SHORT, [1], 'H'),
+        ]
+        if self.mode == 'RGBA':
+            entries.append(entry(338, SHORT, [2], 'H'))  # unassociated alpha
+
+        if self._fp.tell() % 2:
+            self._fp.write(b'\x00')
+        ifd_offset = self._fp.tell()
+        self._fp.write(struct.pack('<H', len(entries)) + b''.join(entries) + struct.pack('<I', 0))
+        self._fp.seek(4)
+        self._fp.write(struct.pack('<I', ifd_offset))
+        self._fp.close()
+
+# Targets that can be written without holding the whole output
+STRIP_WRITERS = {'PNG': PngStripWriter, 'TIFF': TiffStripWriter}
@@ -0,0 +1,181 @@
+"""
+Resumable chunked upload sessions.
+
+A session pre-allocates its target file; each chunk is written straight to
+its own offset, so chunks can arrive in parallel and in any order. A marker
+file per stored chunk lets clients ask which chunks still need sending.
+"""
+import os
+import json
+import asyncio
+import shutil
+import time
+import uuid
+from pathlib import Path
+from typing import Optional, AsyncIterator
+import aiofiles
+from .file_probe import SNIFF_SIZE
+
+DEFAULT_CHUNK_SIZE = 8 * 1024 * 1024  # 8MB
+MIN_CHUNK_SIZE = 256 * 1024  # 256KB
+MAX_CHUNK_SIZE = 64 * 1024 * 1024  # 64MB
+
+class UploadSessionManager:
+    def __init__(self, sessions_dir: str, file_handler, max_file_size: int):
+        self.sessions_dir = Path(sessions_dir)
+        self.file_handler = file_handler
+        self.max_file_size = max_file_size
+        self.sessions_dir.mkdir(parents=True, exist_ok=True)
+
+    def _session_dir(self, session_id: str) -> Path:
+        # Session ids are generated by us; refuse anything that could escape the directory
+        return self.sessions_dir / Path(session_id).name
+
+    def _load(self, session_id: str) -> Optional[dict]:
+        meta_path = self._session_dir(session_id) / "session.json"
+        if not meta_path.exists():
+            return None
+        with open(meta_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def _chunk_length(self, session: dict, index: int) -> int:
+        start = index * session["chunk_size"]
+        return min(session["chunk_size"], session["total_size"] - start)
+
+    def create_session(
+        self,
+        filename: str,
+        file_type: str,
+        total_size: int,
+        chunk_size: Optional[int] = None
+    ) -> tuple[bool, str, Optional[dict]]:
+        """Create a session and pre-allocate its target file"""
+        is_valid, validation_msg = self.file_handler.validate_upload(filename, file_type)
+        if not is_valid:
+            return False, validation_msg, None
+
+        if total_size <= 0:
+            return False, "Geçersiz dosya boyutu", None
+        if total_size > self.max_file_size:
+            return False, f"Dosya boyutu {self.max_file_size / (1024*1024*1024):.0f}GB'den büyük olamaz", None
+
+        chunk_size = chunk_size or DEFAULT_CHUNK_SIZE
+        if not MIN_CHUNK_SIZE <= chunk_size <= MAX_CHUNK_SIZE:
+            return False, f"Parça boyutu {MIN_CHUNK_SIZE} ile {MAX_CHUNK_SIZE} byte arasında olmalı", None
+
+        session_id = str(uuid.uuid4())
+        session_dir = self._session_dir(session_id)
+        (session_dir / "chunks").mkdir(parents=True)
+
+        # Sparse pre-allocation: chunks are written in place at their offsets
+        with open(session_dir / "data.part", 'wb') as f:
+            f.truncate(total_size)
+
+        session = {
+            "session_id": session_id,
+            "filename": filename,
+            "file_type": file_type,
+            "total_size": total_size,
+            "chunk_size": chunk_size,
+            "total_chunks": (total_size + chunk_size - 1) // chunk_size,
+            "created_at": time.time()
+        }
+        with open(session_dir / "session.json", 'w', encoding='utf-8') as f:
+            json.dump(session, f)
+
+        return True, "Yükleme oturumu oluşturuldu", session
+
+    def get_session(self, session_id: str) -> Optional[dict]:
+        """Get session info including the chunk indexes already stored"""
+        session = self._load(session_id)
+        if not session:
+            return None
+
+        chunks_dir = self._session_dir(session_id) / "chunks"
+        received = sorted(int(name) for name in os.listdir(chunks_dir) if name.isdigit())
+        session["received_chunks"] = received
+        session["complete"] = len(received) == session["total_chunks"]
+        return session
+
+    async def write_chunk(
+        self,
+        session_id: str,
+        index: int,
+        stream: AsyncIterator[bytes]
+    ) -> tuple[bool, str]:
+        """Write one chunk at its offset from an async byte stream"""
+        session = self._load(session_id)
+        if not session:
+            return False, "Yükleme oturumu bulunamadı"
+        if not 0 <= index < session["total_chunks"]:
+            return False, f"Geçersiz parça numarası: {index}"
+
+        expected = self._chunk_length(session, index)
+        session_dir = self._session_dir(session_id)
+        received = 0
+        # Catch mislabeled files on the first chunk, not at completion. Network
+        # reads can be tiny, so its head is held back until it can be sniffed.
+        head: Optional[bytes] = b"" if index == 0 else None
+
+        async with aiofiles.open(str(session_dir / "data.part"), 'r+b') as f:
+            await f.seek(index * session["chunk_size"])
+            async for data in stream:
+                received += len(data)
+                if received > expected:
+                    return False, f"Parça {index} beklenenden büyük ({expected} byte)"
+                if head is not None:
+                    head += data
+                    if len(head) < SNIFF_SIZE and received < expected:
+                        continue
+                    is_valid, validation_msg = self.file_handler.validate_content(head[:SNIFF_SIZE], session["filename"])
+                    if not is_valid:
+                        return False, validation_msg
+                    data, head = head, None
+                await f.write(data)
+
+        if received != expected:
+            return False, f"Parça {index} eksik: {received}/{expected} byte"
+
+        # Mark the chunk only after its bytes are fully written
+        (session_dir / "chunks" / str(index)).touch()
+        return True, f"Parça {index} kaydedildi"
+
+    async def complete_session(self, session_id: str) -> tuple[bool, str, Optional[str], Optional[dict]]:
+        """Hand the assembled file over to the FileHandler layout.
+        
+        Hashing the assembled file is blocking, so it runs in a worker thread.
+        """
+        session = self.get_session(session_id)
+        if not session:
+            return False, "Yükleme oturumu bulunamadı", None, None
+
+        if not session["complete"]:
+            missing = session["total_chunks"] - len(session["received_chunks"])
+            return False, f"{missing} parça eksik", None, session
+
+        session_dir = self._session_dir(session_id)
+        success, message, file_id = await asyncio.to_thread(
+            self.file_handler.adopt_upload, session_dir / "data.part", session["filename"], session["file_type"]
+        )
+        if success:
+            await asyncio.to_thread(shutil.rmtree, session_dir, True)
+        return success, message, file_id, session
+
+    def abort_session(self, session_id: str) -> bool:
+        """Abort a session and free its pre-allocated file"""
+        session_dir = self._session_dir(session_id)
+        if not (session_dir / "session.json").exists():
+            return False
+        shutil.rmtree(session_dir, ignore_errors=True)
+        return True
+
+    def cleanup_stale_sessions(self, hours: int = 24):
+        """Remove sessions that were never completed"""
+        cutoff_time = time.time() - (hours * 60 * 60)
+        try:
+            for entry in os.scandir(self.sessions_dir):
+                session = self._load(entry.name) if entry.is_dir() else None
+                if session and session["created_at"] < cutoff_time:
+                    shutil.rmtree(entry.path, ignore_errors=True)
+        except Exception as e:
+            print(f"Eski yükleme oturumlarını temizleme hatası: {str(e)}")
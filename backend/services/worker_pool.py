@@ -0,0 +1,273 @@
+"""
+Process pool that runs conversions off the event loop.
+
+PIL, pdf2image and python-docx work is CPU-bound and synchronous; running
+it in worker processes keeps the API responsive and lets a multi-core box
+convert several files at once. A crashed or timed-out worker only costs
+its own job: the pool is rebuilt and the other in-flight jobs are retried.
+
+A job whose caller stops waiting (cancellation) is flagged in a table
+shared with the workers; the worker notices at its next progress report
+(frame, page or row band), stops and removes what it had written.
+"""
+import asyncio
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from typing import Optional, Callable, Any
+
+logger = logging.getLogger(__name__)
+
+class PoolQueueFullError(Exception):
+    """Raised when the pool already holds its maximum number of jobs"""
+
+class ConversionTimeoutError(Exception):
+    """Raised when a job runs longer than the per-job timeout"""
+
+class WorkerCrashedError(Exception):
+    """Raised when a job keeps killing its worker process"""
+
+class ConversionCancelledError(Exception):
+    """Raised inside a worker when its job has been cancelled"""
+
+# Cancellation flags outlive a job that never reached a worker; drop them after this
+CANCEL_FLAG_SECONDS = 3600
+
+# ConversionService instance owned by each worker process
+_service = None
+# Queue shared by all workers for (job_id, percent, message) progress events
+_progress_queue = None
+# Shared job_id -> cancel time table of cancelled jobs
+_cancelled = None
+
+def _init_worker(output_dir: str, progress_queue, service_options: dict, cancelled=None):
+    """Build the per-process service and load codecs once, not per job"""
+    global _service, _progress_queue, _cancelled
+    from PIL import Image
+    from .conversion_service import ConversionService
+
+    Image.init()
+    _service = ConversionService(output_dir, **service_options)
+    # The service enforces its own pixel and memory limits; keep PIL's bomb check in line
+    Image.MAX_IMAGE_PIXELS = _service.max_image_pixels
+    _progress_queue = progress_queue
+    _cancelled = cancelled
+
+def _is_cancelled(job_id: Optional[str]) -> bool:
+    return job_id is not None and _cancelled is not None and job_id in _cancelled
+
+def _reporter(job_id: Optional[str]):
+    """Progress callback that forwards events to the parent process.
+
+    It is called between frames, pages and row bands, which makes it the
+    point where a cancelled job stops.
+    """
+    if job_id is None or _progress_queue is None:
+        return None
+    def report(percent: int, message: str):
+        if _is_cancelled(job_id):
+            raise ConversionCancelledError("İptal edildi")
+        _progress_queue.put((job_id, percent, message))
+    return report
+
+def _finish_cancellable(job_id: Optional[str], results: list) -> list:
+    """Delete the outputs of a job that was cancelled while it ran"""
+    if not _is_cancelled(job_id):
+        return results
+    _cancelled.pop(job_id, None)
+    for success, message, output_path in results:
+        if output_path:
+            Path(output_path).unlink(missing_ok=True)
+    return [(False, "İptal edildi", None)] * len(results)
+
+def _warmup() -> int:
+    return os.getpid()
+
+def run_conversion(
+    file_type: str,
+    file_path: str,
+    target_format: str,
+    options: dict,
+    job_id: Optional[str] = None
+) -> tuple[bool, str, Optional[Path]]:
+    """Worker-side entry point for a single conversion job"""
+    if _is_cancelled(job_id):
+        return _finish_cancellable(job_id, [(False, "", None)])[0]
+    result = _service.convert(file_type, Path(file_path), target_format, options, _reporter(job_id))
+    return _finish_cancellable(job_id, [result])[0]
+
+def run_fanout(
+    file_path: str,
+    targets: list[dict],
+    job_id: Optional[str] = None
+) -> list[tuple[bool, str, Optional[Path]]]:
+    """Worker-side entry point for a decode-once, encode-many job"""
+    if _is_cancelled(job_id):
+        return _finish_cancellable(job_id, [(False, "", None)] * len(targets))
+    return _finish_cancellable(job_id, _service.convert_image_multi(Path(file_path), targets))
+
+class ConversionWorkerPool:
+    def __init__(
+        self,
+        output_dir: str,
+        max_workers: Optional[int] = None,
+        max_queue: int = 100,
+        job_timeout: Optional[float] = None,
+        service_options: Optional[dict] = None
+    ):
+        self.output_dir = output_dir
+        self.service_options = service_options or {}
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.max_queue = max_queue
+        self.job_timeout = job_timeout
+        self.pending = 0
+        self._executor: Optional[ProcessPoolExecutor] = None
+        # spawn: never fork a process that is running an event loop and DB threads
+        self._context = multiprocessing.get_context('spawn')
+        self._progress_queue = None
+        self._manager = None
+        self._cancelled = None
+        self._progress_thread: Optional[threading.Thread] = None
+        self._listeners: dict[str, Callable[[int, str], None]] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def _create_executor(self) -> ProcessPoolExecutor:
+        return ProcessPoolExecutor(
+            max_workers=self.max_workers,
+            mp_context=self._context,
+            initializer=_init_worker,
+            initargs=(self.output_dir, self._progress_queue, self.service_options, self._cancelled)
+        )
+
+    def _pump_progress(self):
+        """Forward worker progress events to their listeners on the event loop"""
+        while True:
+            event = self._progress_queue.get()
+            if event is None:
+                return
+            job_id, percent, message = event
+            listener = self._listeners.get(job_id)
+            if listener:
+                self._loop.call_soon_threadsafe(listener, percent, message)
+
+    async def start(self):
+        """Create the pool and wait until every worker is up"""
+        self._loop = asyncio.get_running_loop()
+        self._progress_queue = self._context.Queue()
+        self._manager = self._context.Manager()
+        self._cancelled = self._manager.dict()
+        self._progress_thread = threading.Thread(target=self._pump_progress, daemon=True)
+        self._progress_thread.start()
+        
+        self._executor = self._create_executor()
+        loop = self._loop
+        pids = await asyncio.gather(*[
+            loop.run_in_executor(self._executor, _warmup) for _ in range(self.max_workers)
+        ])
+        logger.info(f"Conversion pool ready: {len(set(pids))} workers")
+
+    def _restart(self, executor: ProcessPoolExecutor):
+        """Replace a broken or stuck executor (only once per incident)"""
+        if self._executor is not executor:
+            return
+        # ProcessPoolExecutor has no public way to kill a running task
+        for process in list((executor._processes or {}).values()):
+            process.terminate()
+        executor.shutdown(wait=False, cancel_futures=True)
+        self._executor = self._create_executor()
+        logger.warning("Conversion pool restarted")
+
+    def cancel(self, job_id: str):
+        """Tell the worker running job_id to stop at its next progress report"""
+        if self._cancelled is None:
+            return
+        now = time.time()
+        for stale in [k for k, at in self._cancelled.items() if at < now - CANCEL_FLAG_SECONDS]:
+            self._cancelled.pop(stale, None)
+        self._cancelled[job_id] = now
+
+    def is_full(self) -> bool:
+        return self.pending >= self.max_queue
+
+    async def submit(
+        self,
+        fn: Callable,
+        *args,
+        job_id: Optional[str] = None,
+        on_progress: Optional[Callable[[int, str], None]] = None,
+        retries: int = 1
+    ) -> Any:
+        """Run fn(*args) in a worker process and await its result.
+        
+        When job_id is given it is appended to args, and progress the
+        worker reports for it is delivered to on_progress on the event loop.
+        Cancelling the caller also stops the job in its worker; the
+        cancellation propagates only once the worker is done with the job,
+        so whatever the caller holds for it (a scheduler slot) is held until then.
+        """
+        if self.is_full():
+            raise PoolQueueFullError(f"Conversion queue is full ({self.max_queue} jobs)")
+        if self._executor is None:
+            await self.start()
+
+        if job_id is not None:
+            args = (*args, job_id)
+            if self._cancelled is not None:
+                # A requeued job may run again under the same id
+                self._cancelled.pop(job_id, None)
+            if on_progress:
+                self._listeners[job_id] = on_progress
+
+        self.pending += 1
+        try:
+            loop = asyncio.get_running_loop()
+            for attempt in range(retries + 1):
+                executor = self._executor
+                future = executor.submit(fn, *args)
+                try:
+                    return await asyncio.wait_for(asyncio.wrap_future(future, loop=loop), timeout=self.job_timeout)
+                except asyncio.TimeoutError:
+                    self._restart(executor)
+                    raise ConversionTimeoutError(f"Job exceeded {self.job_timeout:g}s timeout")
+                except BrokenProcessPool:
+                    # Either this job or a neighbour killed the worker; retry on a fresh pool
+                    self._restart(executor)
+                    if attempt == retries:
+                        raise WorkerCrashedError("Worker process crashed during conversion")
+                except asyncio.CancelledError:
+                    if job_id is not None:
+                        self.cancel(job_id)
+                    await self._until_done(future)
+                    raise
+        finally:
+            self.pending -= 1
+            if job_id is not None:
+                self._listeners.pop(job_id, None)
+
+    async def _until_done(self, future: Future):
+        """Wait for a job that has started to leave its worker, even if cancelled again meanwhile"""
+        finished = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        future.add_done_callback(lambda _: loop.call_soon_threadsafe(finished.set))
+        while not future.done():
+            try:
+                await asyncio.shield(finished.wait())
+            except asyncio.CancelledError:
+                pass
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+        if self._progress_queue is not None:
+            self._progress_queue.put(None)
+            self._progress_queue = None
+        if self._manager is not None:
+            self._manager.shutdown()
+            self._manager = None
+            self._cancelled = None
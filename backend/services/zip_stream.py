@@ -0,0 +1,72 @@
+"""
+Streaming ZIP archive builder.
+
+The archive is produced as a byte generator while it is written: zipfile
+writes to a sink that is drained after every write, so no temporary
+archive touches the disk and memory stays at roughly one chunk.
+"""
+import io
+import zipfile
+from pathlib import Path
+from typing import Iterable, Iterator
+
+ZIP_CHUNK_SIZE = 1024 * 1024  # 1MB
+
+# Formats that are already compressed; deflating them again only costs CPU
+STORED_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.webp', '.gif', '.ico', '.docx', '.zip'}
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only, unseekable stream that buffers until drained"""
+    def __init__(self):
+        self._chunks: list[bytes] = []
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+def unique_names(names: Iterable[str]) -> list[str]:
+    """Make archive member names unique: a.png, a (1).png, ..."""
+    seen: dict[str, int] = {}
+    result = []
+    for name in names:
+        count = seen.get(name, 0)
+        seen[name] = count + 1
+        if count:
+            path = Path(name)
+            name = f"{path.stem} ({count}){path.suffix}"
+        result.append(name)
+    return result
+
+def iter_zip(entries: Iterable[tuple[Path, str]], chunk_size: int = ZIP_CHUNK_SIZE) -> Iterator[bytes]:
+    """Yield a ZIP archive of (file path, archive name) entries as it is built"""
+    sink = _ChunkSink()
+    # An unseekable sink makes zipfile use data descriptors instead of seeking back
+    with zipfile.ZipFile(sink, mode='w') as archive:
+        for path, name in entries:
+            info = zipfile.ZipInfo.from_file(path, arcname=name)
+            info.compress_type = (
+                zipfile.ZIP_STORED if path.suffix.lower() in STORED_EXTENSIONS else zipfile.ZIP_DEFLATED
+            )
+            # file_size lets zipfile decide on zip64 before any data is written
+            with open(path, 'rb') as src, archive.open(info, mode='w') as dest:
+                while True:
+                    data = src.read(chunk_size)
+                    if not data:
+                        break
+                    dest.write(data)
+                    chunk = sink.drain()
+                    if chunk:
+                        yield chunk
+            chunk = sink.drain()
+            if chunk:
+                yield chunk
+    # Central directory is written when the archive closes
+    yield sink.drain()
@@ -0,0 +1,194 @@
+"""
+Conditional and partial responses for stored files.
+
+Files are served with a strong ETag (their content digest), Last-Modified
+and Accept-Ranges. Matching If-None-Match / If-Modified-Since requests get
+an empty 304; Range requests get a 206 with one range or a
+multipart/byteranges body with several (If-Range is honoured).
+"""
+import uuid
+from email.utils import formatdate, parsedate_to_datetime
+from pathlib import Path
+from typing import AsyncIterator, Optional
+from urllib.parse import quote
+
+import aiofiles
+from fastapi import Request
+from fastapi.responses import FileResponse, Response, StreamingResponse
+from starlette.background import BackgroundTask
+
+# Bytes read per chunk of a range
+RANGE_CHUNK_SIZE = 64 * 1024
+
+# More ranges than this (after merging) are ignored and the whole file is sent
+MAX_RANGES = 16
+
+# For content that never changes under its URL
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+class RangeNotSatisfiableError(Exception):
+    """Raised when no requested range overlaps the file"""
+
+def content_etag(digest: str) -> str:
+    """Strong ETag of a content digest"""
+    return f'"{digest}"'
+
+def _etag_list(header: str) -> list[str]:
+    return [tag.strip() for tag in header.split(',') if tag.strip()]
+
+def is_not_modified(request: Request, etag: str, mtime: float) -> bool:
+    """True when the client's cached copy is current; If-None-Match wins over If-Modified-Since"""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        # Weak comparison: W/"x" matches "x"
+        tags = [tag.removeprefix("W/") for tag in _etag_list(if_none_match)]
+        return "*" in tags or etag in tags
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            since = parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+        return int(mtime) <= since
+    return False
+
+def parse_ranges(header: Optional[str], size: int) -> Optional[list[tuple[int, int]]]:
+    """Inclusive (start, end) byte ranges of a Range header, merged and sorted.
+
+    Returns None when the header is absent, malformed or asks for too many
+    ranges (the whole file is sent then).
+    """
+    if not header:
+        return None
+    unit, _, spec = header.partition('=')
+    if unit.strip().lower() != 'bytes' or not spec:
+        return None
+
+    ranges = []
+    for part in spec.split(','):
+        first, sep, last = part.strip().partition('-')
+        if not sep:
+            return None
+        try:
+            if not first:
+                # Suffix range: the last N bytes
+                length = int(last)
+                if length <= 0:
+                    continue
+                start, end = max(0, size - length), size - 1
+            else:
+                start = int(first)
+                end = int(last) if last else None
+                if end is not None and end < start:
+                    return None
+                if start >= size:
+                    continue
+                end = size - 1 if end is None else min(end, size - 1)
+        except ValueError:
+            return None
+        ranges.append((start, end))
+    if not ranges:
+        raise RangeNotSatisfiableError(f"No satisfiable range for {size} bytes")
+
+    ranges.sort()
+    merged = [ranges[0]]
+    for start, end in ranges[1:]:
+        if start <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged if len(merged) <= MAX_RANGES else None
+
+async def iter_file_range(path: Path, start: int, end: int) -> AsyncIterator[bytes]:
+    """Stream bytes start..end (inclusive) of a file"""
+    async with aiofiles.open(str(path), 'rb') as f:
+        await f.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = await f.read(min(RANGE_CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+def content_disposition(filename: str) -> str:
+    """Attachment disposition of a download name, RFC 5987-encoded when not plain ASCII"""
+    quoted = quote(filename)
+    if quoted != filename:
+        return f"attachment; filename*=utf-8''{quoted}"
+    return f'attachment; filename="{filename}"'
+
+def _part_header(boundary: str, media_type: str, start: int, end: int, size: int) -> bytes:
+    return (
+        f"--{boundary}\r\n"
+        f"Content-Type: {media_type}\r\n"
+        f"Content-Range: bytes {start}-{end}/{size}\r\n\r\n"
+    ).encode('latin-1')
+
+async def _iter_multipart(path: Path, ranges: list[tuple[int, int]], boundary: str, media_type: str, size: int):
+    for start, end in ranges:
+        yield _part_header(boundary, media_type, start, end, size)
+        async for chunk in iter_file_range(path, start, end):
+            yield chunk
+        yield b"\r\n"
+    yield f"--{boundary}--\r\n".encode('latin-1')
+
+def file_response(
+    request: Request,
+    path: Path,
+    stat_result,
+    media_type: str,
+    etag: str,
+    filename: Optional[str] = None,
+    cache_control: str = IMMUTABLE_CACHE_CONTROL,
+    background: Optional[BackgroundTask] = None
+) -> Response:
+    """Serve a stored file with validators, answering conditional and Range requests"""
+    size = stat_result.st_size
+    headers = {
+        "ETag": etag,
+        "Last-Modified": formatdate(stat_result.st_mtime, usegmt=True),
+        "Cache-Control": cache_control,
+        "Accept-Ranges": "bytes"
+    }
+    if is_not_modified(request, etag, stat_result.st_mtime):
+        return Response(status_code=304, headers=headers, background=background)
+
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if if_range is not None and if_range.strip() != etag:
+        # The client's partial copy is of another version: send it all
+        range_header = None
+    try:
+        ranges = parse_ranges(range_header, size)
+    except RangeNotSatisfiableError:
+        return Response(
+            status_code=416, headers={**headers, "Content-Range": f"bytes */{size}"}, background=background
+        )
+
+    if ranges is None:
+        return FileResponse(
+            path=path, media_type=media_type, filename=filename,
+            headers=headers, stat_result=stat_result, background=background
+        )
+
+    if filename:
+        headers["Content-Disposition"] = content_disposition(filename)
+    if len(ranges) == 1:
+        start, end = ranges[0]
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+        headers["Content-Length"] = str(end - start + 1)
+        return StreamingResponse(
+            iter_file_range(path, start, end), status_code=206,
+            media_type=media_type, headers=headers, background=background
+        )
+
+    boundary = uuid.uuid4().hex
+    headers["Content-Length"] = str(
+        sum(len(_part_header(boundary, media_type, start, end, size)) + end - start + 1 + 2 for start, end in ranges)
+        + len(f"--{boundary}--\r\n")
+    )
+    return StreamingResponse(
+        _iter_multipart(path, ranges, boundary, media_type, size), status_code=206,
+        media_type=f"multipart/byteranges; boundary={boundary}", headers=headers, background=background
+    )
@@ -0,0 +1,127 @@
+"""
+Streaming reader for multipart/form-data uploads.
+
+Starlette's form parsing (`UploadFile = File(...)`) receives the whole body
+and spools it to a temporary file before the endpoint runs. Here the
+endpoint drives the parser instead: the request body is read only as fast
+as the file part is consumed, so size limits are enforced as bytes arrive,
+an oversized upload is cut off without being received, and the file is
+written to disk once, by the caller.
+"""
+from typing import AsyncIterator, Optional
+
+try:
+    from python_multipart import MultipartParser
+    from python_multipart.multipart import parse_options_header
+except ImportError:  # python-multipart before 0.0.13
+    from multipart import MultipartParser
+    from multipart.multipart import parse_options_header
+
+class MultipartError(Exception):
+    """Raised when the body is not multipart/form-data or holds no usable file part"""
+
+def _decode(value: bytes) -> str:
+    # Browsers send UTF-8 file names; anything else is kept byte for byte
+    try:
+        return value.decode('utf-8')
+    except UnicodeDecodeError:
+        return value.decode('latin-1')
+
+class MultipartFileStream:
+    """The first file part named `field_name` of a multipart body.
+
+    Call `open()` to read up to the end of the part's headers (`filename`
+    and `content_type` are set then), then `read(size)` until it returns
+    b"". Other fields are skipped as they stream past.
+    """
+    def __init__(self, body: AsyncIterator[bytes], content_type: Optional[str], field_name: str = "file"):
+        media_type, params = parse_options_header(content_type or "")
+        if media_type != b"multipart/form-data" or not params.get(b"boundary"):
+            raise MultipartError("Expected a multipart/form-data body")
+        self.field_name = field_name
+        self.filename: Optional[str] = None
+        self.content_type: Optional[str] = None
+        self._body = body.__aiter__()
+        self._parser = MultipartParser(params[b"boundary"], {
+            "on_part_begin": self._on_part_begin,
+            "on_header_field": self._on_header_field,
+            "on_header_value": self._on_header_value,
+            "on_header_end": self._on_header_end,
+            "on_headers_finished": self._on_headers_finished,
+            "on_part_data": self._on_part_data,
+            "on_part_end": self._on_part_end,
+        })
+        self._headers: dict[bytes, bytes] = {}
+        self._header_name = b""
+        self._header_value = b""
+        # Wanted part: headers seen / data being received / fully received
+        self._found = False
+        self._in_file = False
+        self._finished = False
+        self._exhausted = False
+        self._data = bytearray()
+
+    # ============ PARSER CALLBACKS ============
+
+    def _on_part_begin(self):
+        self._headers = {}
+
+    def _on_header_field(self, data: bytes, start: int, end: int):
+        self._header_name += data[start:end]
+
+    def _on_header_value(self, data: bytes, start: int, end: int):
+        self._header_value += data[start:end]
+
+    def _on_header_end(self):
+        self._headers[self._header_name.lower()] = self._header_value
+        self._header_name = b""
+        self._header_value = b""
+
+    def _on_headers_finished(self):
+        if self._found:
+            return
+        _, options = parse_options_header(self._headers.get(b"content-disposition", b""))
+        if options.get(b"name") != self.field_name.encode('utf-8') or b"filename" not in options:
+            return
+        self._found = self._in_file = True
+        self.filename = _decode(options[b"filename"])
+        content_type = self._headers.get(b"content-type")
+        self.content_type = _decode(content_type) if content_type else None
+
+    def _on_part_data(self, data: bytes, start: int, end: int):
+        if self._in_file:
+            self._data += data[start:end]
+
+    def _on_part_end(self):
+        if self._in_file:
+            self._in_file = False
+            self._finished = True
+
+    # ============ READING ============
+
+    async def _feed(self):
+        """Pass the next piece of the request body through the parser"""
+        try:
+            chunk = await self._body.__anext__()
+        except StopAsyncIteration:
+            self._exhausted = True
+            self._parser.finalize()
+            return
+        self._parser.write(chunk)
+
+    async def open(self):
+        """Read until the file part's headers; raises MultipartError when there is none"""
+        while not self._found and not self._exhausted:
+            await self._feed()
+        if not self._found:
+            raise MultipartError(f"No file in the '{self.field_name}' field")
+
+    async def read(self, size: int) -> bytes:
+        """Up to `size` bytes of the file; b"" once it has been read completely"""
+        while len(self._data) < size and not self._finished:
+            if self._exhausted:
+                raise MultipartError("Upload ended before the file was complete")
+            await self._feed()
+        chunk = bytes(self._data[:size])
+        del self._data[:size]
+        return chunk
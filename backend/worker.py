@@ -0,0 +1,40 @@
+"""
+Standalone conversion worker.
+
+Claims jobs from the shared job store and converts them without serving
+HTTP, so conversion capacity can be scaled separately from the API:
+
+    python worker.py
+
+Run the API with RUN_CONVERSION_WORKER=false to keep conversions off the
+API processes entirely. Workers on other machines need JOB_STORE=mongo and
+either STORAGE_BACKEND=s3 (uploads and outputs are fetched from and
+published to the bucket) or the same UPLOAD_DIR/CONVERTED_DIR mounted
+everywhere.
+"""
+import asyncio
+import signal
+
+import server
+
+async def main():
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    await server.start_conversion_worker()
+    # Outputs written here are only indexed here, so they are expired here too
+    janitor = asyncio.create_task(server.expire_files_periodically())
+    server.logger.info(f"Conversion worker running: {server.dispatcher.worker_id}")
+    await stop.wait()
+
+    server.logger.info("Conversion worker stopping")
+    janitor.cancel()
+    await server.stop_conversion_worker()
+    await server.history_writer.close()
+    server.job_store.close()
+    server.client.close()
+
+if __name__ == "__main__":
+    asyncio.run(main())
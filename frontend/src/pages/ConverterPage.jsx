@@ -1,4 +1,4 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useRef } from 'react';
 import Header from '../components/layout/Header';
 import Footer from '../components/layout/Footer';
 import FileUploader from '../components/converter/FileUploader';
@@ -8,10 +8,43 @@ import { toast } from 'sonner';
 
 const API_BASE_URL = process.env.REACT_APP_API_URL || 'http://localhost:8000/api';
 
+// Sekme başına kimlik: tüm dönüştürmelerin ilerlemesi tek bir akıştan gelir
+const getClientId = () => {
+  let clientId = sessionStorage.getItem('converterClientId');
+  if (!clientId) {
+    clientId = Math.random().toString(36).substr(2, 9) + Date.now().toString(36);
+    sessionStorage.setItem('converterClientId', clientId);
+  }
+  return clientId;
+};
+
+const CLIENT_ID = getClientId();
+
 export const ConverterPage = () => {
   const [files, setFiles] = useState([]);
   const [selectedFile, setSelectedFile] = useState(null);
   const [isUploading, setIsUploading] = useState(false);
+  // conversion_id -> dosya id'si; henüz eşleşmemiş olaylar ve batch sayaçları
+  const conversionsRef = useRef({});
+  const pendingEventsRef = useRef({});
+  const batchesRef = useRef({});
+
+  // Sunucudan gelen ilerleme olaylarını tek bir EventSource ile dinle
+  useEffect(() => {
+    const source = new EventSource(
+      `${API_BASE_URL}/convert/events?client_id=${encodeURIComponent(CLIENT_ID)}`
+    );
+    source.addEventListener('progress', (message) => {
+      const event = JSON.parse(message.data);
+      if (conversionsRef.current[event.conversion_id]) {
+        applyProgressEvent(event);
+      } else {
+        // Olay, istek cevabından önce gelebilir
+        pendingEventsRef.current[event.conversion_id] = event;
+      }
+    });
+    return () => source.close();
+  }, []);
 
   // Dosya yükleme işlemi
   const handleFilesAdded = async (newFiles) => {
@@ -80,7 +113,19 @@ export const ConverterPage = () => {
     );
   };
 
+  // Sunucuda bekleyen veya çalışan dönüştürmeyi iptal et
+  const cancelConversion = (file) => {
+    if (file.status !== 'processing' || !file.conversionId) {
+      return;
+    }
+    fetch(`${API_BASE_URL}/convert/${file.conversionId}`, { method: 'DELETE' }).catch(() => {});
+  };
+
   const handleFileRemove = (fileId) => {
+    const file = files.find((f) => f.id === fileId);
+    if (file) {
+      cancelConversion(file);
+    }
     setFiles((prev) => prev.filter((f) => f.id !== fileId));
     if (selectedFile?.id === fileId) {
       setSelectedFile(null);
@@ -113,6 +158,7 @@ export const ConverterPage = () => {
         method: 'POST',
         headers: {
           'Content-Type': 'application/json',
+          'X-Client-Id': CLIENT_ID,
         },
         body: JSON.stringify({
           file_id: file.fileId,
@@ -130,6 +176,14 @@ export const ConverterPage = () => {
         throw new Error('Sunucudan hatalı cevap alındı');
       }
 
+      if (response.status === 429) {
+        // Sunucu kuyruğu dolu: Retry-After kadar bekleyip tekrar dene
+        const retryAfter = parseInt(response.headers.get('Retry-After'), 10) || 5;
+        toast.info(`Sunucu yoğun, ${retryAfter} sn sonra tekrar denenecek`);
+        setTimeout(() => performConversion(file), retryAfter * 1000);
+        return;
+      }
+
       if (!response.ok) {
         throw new Error(data.detail || 'Dönüştürme başarısız');
       }
@@ -138,8 +192,8 @@ export const ConverterPage = () => {
 
       handleFileUpdate(file.id, { conversionId });
 
-      // Progress'i takip et
-      monitorConversion(file.id, conversionId);
+      // İlerleme, istemci akışından gelir
+      trackConversion(file.id, conversionId);
     } catch (error) {
       handleFileUpdate(file.id, {
         status: 'failed',
@@ -149,38 +203,62 @@ export const ConverterPage = () => {
     }
   };
 
-  // Dönüştürme ilerleme takibi
-  const monitorConversion = (fileId, conversionId) => {
-    const checkInterval = setInterval(async () => {
-      try {
-        const response = await fetch(
-          `${API_BASE_URL}/convert/status/${conversionId}`
-        );
+  // Dönüştürmeyi bir dosyaya bağla ve önceden gelen olayı uygula
+  const trackConversion = (fileId, conversionId, batchId = null) => {
+    conversionsRef.current[conversionId] = { fileId, batchId, finished: false };
+    const pending = pendingEventsRef.current[conversionId];
+    if (pending) {
+      delete pendingEventsRef.current[conversionId];
+      applyProgressEvent(pending);
+    }
+  };
 
-        if (!response.ok) {
-          throw new Error('Status check failed');
-        }
+  // Dönüştürme ilerleme olayı
+  const applyProgressEvent = (event) => {
+    const conversion = conversionsRef.current[event.conversion_id];
+    if (conversion.finished) {
+      return;
+    }
 
-        const data = await response.json();
+    if (event.status === 'cancelled') {
+      // İptal edilen dosya yeniden başlatılabilir
+      handleFileUpdate(conversion.fileId, { status: 'queued', progress: 0 });
+    } else {
+      handleFileUpdate(conversion.fileId, {
+        // Sunucu kuyruğunda bekleyen iş, arayüzde hâlâ işleniyor sayılır
+        status: event.status === 'queued' ? 'processing' : event.status,
+        progress: event.progress,
+        outputFileId: event.output_file_id,
+      });
+    }
 
-        handleFileUpdate(fileId, {
-          status: data.status,
-          progress: data.progress,
-          outputFileId: data.output_file_id,
-        });
+    if (!['completed', 'failed', 'cancelled'].includes(event.status)) {
+      return;
+    }
+    conversion.finished = true;
+
+    const batch = conversion.batchId && batchesRef.current[conversion.batchId];
+    if (!batch) {
+      if (event.status === 'cancelled') {
+        toast.info('Dönüştürme iptal edildi');
+      } else if (event.status === 'completed') {
+        toast.success('Dosya başarıyla dönüştürüldü!');
+      } else {
+        toast.error(`Dönüştürme hatası: ${event.message}`);
+      }
+      return;
+    }
 
-        if (data.status === 'completed') {
-          clearInterval(checkInterval);
-          toast.success('Dosya başarıyla dönüştürüldü!');
-        } else if (data.status === 'failed') {
-          clearInterval(checkInterval);
-          toast.error(`Dönüştürme hatası: ${data.message}`);
-        }
-      } catch (error) {
-        clearInterval(checkInterval);
-        toast.error('Progress takibi hatası');
+    batch.remaining -= 1;
+    batch[event.status] = (batch[event.status] || 0) + 1;
+    if (batch.remaining === 0) {
+      delete batchesRef.current[conversion.batchId];
+      if (batch.failed > 0) {
+        toast.error(`${batch.failed} dosya dönüştürülemedi`);
+      } else {
+        toast.success(`${batch.completed} dosya başarıyla dönüştürüldü!`);
       }
-    }, 1000); // Her 1 saniyede bir kontrol et
+    }
   };
 
   // Dosya indirme
@@ -224,15 +302,80 @@ export const ConverterPage = () => {
     }
   };
 
-  const handleStartAll = () => {
-    files.forEach((file) => {
-      if (file.status === 'queued' && file.outputFormat) {
-        handleStartConversion(file.id);
+  // Tüm kuyruğu tek bir batch isteği ile başlat
+  const handleStartAll = async () => {
+    const pending = files.filter(
+      (file) => file.status === 'queued' && file.outputFormat && file.fileId
+    );
+    if (pending.length === 0) {
+      return;
+    }
+
+    performBatchConversion(pending);
+  };
+
+  const performBatchConversion = async (pending) => {
+    try {
+      pending.forEach((file) =>
+        handleFileUpdate(file.id, { status: 'processing', progress: 0 })
+      );
+
+      const response = await fetch(`${API_BASE_URL}/convert/batch`, {
+        method: 'POST',
+        headers: {
+          'Content-Type': 'application/json',
+          'X-Client-Id': CLIENT_ID,
+        },
+        body: JSON.stringify({
+          items: pending.map((file) => ({
+            file_id: file.fileId,
+            original_filename: file.name,
+            file_type: file.type.startsWith('image/') ? 'image' : 'document',
+            target_format: file.outputFormat,
+            options: file.options,
+          })),
+        }),
+      });
+
+      let data;
+      try {
+        data = await response.json();
+      } catch (e) {
+        throw new Error('Sunucudan hatalı cevap alındı');
       }
-    });
+
+      if (response.status === 429) {
+        // Sunucu kuyruğu dolu: Retry-After kadar bekleyip tüm grubu tekrar dene
+        const retryAfter = parseInt(response.headers.get('Retry-After'), 10) || 5;
+        toast.info(`Sunucu yoğun, ${retryAfter} sn sonra tekrar denenecek`);
+        setTimeout(() => performBatchConversion(pending), retryAfter * 1000);
+        return;
+      }
+
+      if (!response.ok) {
+        throw new Error(data.detail || 'Dönüştürme başarısız');
+      }
+
+      // conversion_ids, items ile aynı sırada döner
+      batchesRef.current[data.batch_id] = {
+        remaining: data.conversion_ids.length,
+        completed: 0,
+        failed: 0,
+      };
+      data.conversion_ids.forEach((conversionId, index) => {
+        handleFileUpdate(pending[index].id, { conversionId });
+        trackConversion(pending[index].id, conversionId, data.batch_id);
+      });
+    } catch (error) {
+      pending.forEach((file) =>
+        handleFileUpdate(file.id, { status: 'failed', progress: 0 })
+      );
+      toast.error(`Dönüştürme hatası: ${error.message}`);
+    }
   };
 
   const handleCancelAll = () => {
+    files.forEach(cancelConversion);
     setFiles([]);
     setSelectedFile(null);
   };
@@ -0,0 +1,47 @@
+"""
+Shared test setup.
+
+Puts backend/ on the import path and points the API's storage, cache and
+job store at a throwaway directory before `server` is first imported.
+"""
+import atexit
+import os
+import shutil
+import sys
+import tempfile
+from pathlib import Path
+
+import pytest
+
+from tests.helpers import API_MAX_FILE_SIZE, image_bytes
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / "backend"
+sys.path.insert(0, str(BACKEND_DIR))
+
+_api_root = Path(tempfile.mkdtemp(prefix="ryloze-api-"))
+atexit.register(shutil.rmtree, _api_root, ignore_errors=True)
+os.environ.update({
+    "UPLOAD_DIR": str(_api_root / "uploads"),
+    "CONVERTED_DIR": str(_api_root / "converted"),
+    "RESULT_CACHE_DIR": str(_api_root / "cache"),
+    "MAX_FILE_SIZE": str(API_MAX_FILE_SIZE),
+    "JOB_STORE": "memory",
+    "RUN_CONVERSION_WORKER": "false",
+    "STORAGE_BACKEND": "local",
+    "DEBUG": "false",
+})
+
+@pytest.fixture
+def png_bytes() -> bytes:
+    return image_bytes("PNG")
+
+@pytest.fixture(scope="session")
+def api():
+    """The API app without its startup hooks (no worker pool, no janitors)"""
+    import server
+    return server
+
+@pytest.fixture(scope="session")
+def client(api):
+    from fastapi.testclient import TestClient
+    return TestClient(api.app)
@@ -0,0 +1,53 @@
+"""
+Helpers shared by the test modules
+"""
+import io
+
+from PIL import Image
+
+# MAX_FILE_SIZE of the API under test; small enough that size-limit tests stay fast
+API_MAX_FILE_SIZE = 1024 * 1024
+
+def image_bytes(fmt: str = "PNG", size: tuple = (64, 48), mode: str = "RGB", color=(200, 40, 40)) -> bytes:
+    """Encode a solid test image"""
+    buffer = io.BytesIO()
+    Image.new(mode, size, color).save(buffer, format=fmt)
+    return buffer.getvalue()
+
+def pdf_bytes(pages: list, image_pages: tuple = ()) -> bytes:
+    """A minimal PDF; each page shows its line(s) of text in Helvetica, or nothing for None.
+    Pages whose index is in image_pages also draw a 1x1 image."""
+    objects = [
+        "<< /Type /Catalog /Pages 2 0 R >>",
+        None,
+        "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+        "<< /Type /XObject /Subtype /Image /Width 1 /Height 1 /ColorSpace /DeviceGray "
+        "/BitsPerComponent 8 /Length 1 >>\nstream\n\x80\nendstream",
+    ]
+    kids = []
+    for index, text in enumerate(pages):
+        lines = text.split("\n") if text else []
+        stream = "BT /F1 12 Tf 72 720 Td 14 TL " + " ".join(
+            "({}) '".format(line.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")) for line in lines
+        ) + " ET"
+        if index in image_pages:
+            stream += " q 100 0 0 100 72 72 cm /Im1 Do Q"
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream")
+        xobjects = "/XObject << /Im1 4 0 R >> " if index in image_pages else ""
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            f"/Resources << /Font << /F1 3 0 R >> {xobjects}>> /Contents {len(objects)} 0 R >>"
+        )
+        kids.append(f"{len(objects)} 0 R")
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {len(kids)} >>"
+
+    out = b"%PDF-1.4\n"
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += f"{number} 0 obj\n{body}\nendobj\n".encode("latin-1")
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    out += "".join(f"{offset:010d} 00000 n \n" for offset in offsets).encode()
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    return out
@@ -1,88 +1,372 @@
 """
 Test suite for Ryloze Converter API
 """
-import pytest
 import asyncio
-from fastapi.testclient import TestClient
-import sys
+import io
 from pathlib import Path
+import uuid
+import zipfile
+
+import pytest
 
-# Add backend to path
-sys.path.insert(0, str(Path(__file__).parent))
+from tests.helpers import API_MAX_FILE_SIZE, image_bytes
 
 # Mock for testing
 class MockDB:
     async def command(self, cmd):
         return {"ok": 1}
 
-# Test imports
-# from server import app
+BOUNDARY = "ryloze-test-boundary"
+
+def multipart_body(filename: str, content: bytes, content_type: str = "image/png") -> bytes:
+    return (
+        f"--{BOUNDARY}\r\n"
+        f'Content-Disposition: form-data; name="file"; filename="{filename}"\r\n'
+        f"Content-Type: {content_type}\r\n\r\n"
+    ).encode() + content + f"\r\n--{BOUNDARY}--\r\n".encode()
 
-# Create test client
-# client = TestClient(app)
+def stored_output(api, content: bytes, suffix: str = ".png") -> str:
+    """Register a converted file as if a job had produced it; returns its id"""
+    output_path = api.conversion_service._output_path(f"{uuid.uuid4()}{suffix}")
+    output_path.write_bytes(content)
+    assert api.conversion_service.register_output(output_path)[0]
+    return output_path.name.split(".")[0]
+
+def upload(client, filename: str, content: bytes, content_type: str = "image/png"):
+    return client.post("/api/upload", files={"file": (filename, content, content_type)})
 
 class TestHealthCheck:
     """Health check endpoint tests"""
-    
-    def test_health_endpoint_exists(self):
+
+    def test_health_endpoint_exists(self, client, api, monkeypatch):
         """Test health endpoint is available"""
-        # In production, uncomment and run:
-        # response = client.get("/api/health")
-        # assert response.status_code == 200
-        pass
+        monkeypatch.setattr(api, "db", MockDB())
+        response = client.get("/api/health")
+        assert response.status_code == 200
+        assert response.json()["database"] == "connected"
 
 class TestFileUpload:
     """File upload endpoint tests"""
-    
-    def test_upload_valid_image(self):
+
+    def test_upload_valid_image(self, client, api):
         """Test uploading a valid image"""
-        # response = client.post("/api/upload", files={"file": ("test.jpg", b"fake image data")})
-        # assert response.status_code == 200
-        pass
-    
-    def test_upload_oversized_file(self):
+        content = image_bytes("PNG", (40, 30))
+        response = upload(client, "test.png", content)
+        assert response.status_code == 200
+        data = response.json()
+        assert data["file_type"] == "image"
+        assert data["size"] == len(content)
+        assert data["metadata"]["width"] == 40 and data["metadata"]["height"] == 30
+
+        stored = api.file_handler.get_file_path(data["file_id"], "image")
+        assert stored.read_bytes() == content
+
+    def test_upload_non_ascii_filename(self, client):
+        """File names keep their UTF-8 characters"""
+        response = upload(client, "çizim.png", image_bytes("PNG"))
+        assert response.status_code == 200
+        assert response.json()["filename"] == "çizim.png"
+
+    def test_upload_oversized_file(self, client, api):
         """Test uploading file exceeding size limit"""
-        # response = client.post("/api/upload", files={"file": ("test.jpg", b"x" * (3 * 1024**3))})
-        # assert response.status_code == 413
-        pass
-    
-    def test_upload_unsupported_format(self):
+        # Content-Length alone is enough to refuse it
+        response = upload(client, "test.png", b"\x89PNG\r\n\x1a\n" + b"x" * (API_MAX_FILE_SIZE + 128 * 1024))
+        assert response.status_code == 413
+
+    def test_upload_oversized_stream_stops_reading(self, client):
+        """Without a Content-Length the limit is enforced while the body arrives"""
+        body = multipart_body("test.png", b"\x89PNG\r\n\x1a\n" + b"x" * (API_MAX_FILE_SIZE * 4))
+        piece = 64 * 1024
+
+        def chunks():
+            for start in range(0, len(body), piece):
+                yield body[start:start + piece]
+
+        response = client.post(
+            "/api/upload",
+            content=chunks(),
+            headers={"Content-Type": f"multipart/form-data; boundary={BOUNDARY}"}
+        )
+        assert response.status_code == 413
+
+    def test_upload_unsupported_format(self, client):
         """Test uploading unsupported file format"""
-        # response = client.post("/api/upload", files={"file": ("test.exe", b"fake exe")})
-        # assert response.status_code == 400
-        pass
+        response = upload(client, "test.exe", b"fake exe", "application/octet-stream")
+        assert response.status_code == 400
+
+    def test_upload_mislabeled_content(self, client):
+        """Content that does not match its extension is refused"""
+        response = upload(client, "test.png", image_bytes("JPEG"))
+        assert response.status_code == 400
+
+    def test_upload_without_file_field(self, client):
+        response = client.post("/api/upload", data={"other": "value"}, files={"not_file": ("a.png", b"x")})
+        assert response.status_code == 400
 
 class TestConversion:
     """File conversion endpoint tests"""
-    
-    def test_conversion_start(self):
+
+    def test_conversion_start(self, client):
         """Test starting a conversion"""
-        # response = client.post("/api/convert", json={
-        #     "file_id": "test123",
-        #     "original_filename": "image.jpg",
-        #     "file_type": "image",
-        #     "target_format": "PNG",
-        #     "options": {}
-        # })
-        # assert response.status_code == 200
-        # data = response.json()
-        # assert "conversion_id" in data
-        pass
-    
-    def test_conversion_status_check(self):
+        file_id = upload(client, "image.png", image_bytes("PNG")).json()["file_id"]
+        response = client.post("/api/convert", json={
+            "file_id": file_id,
+            "original_filename": "image.png",
+            "file_type": "image",
+            "target_format": "WEBP",
+            "options": {}
+        })
+        assert response.status_code == 200
+        data = response.json()
+        assert "conversion_id" in data
+        assert data["status"] == "queued"
+
+    def test_conversion_status_check(self, client):
         """Test checking conversion status"""
-        # response = client.get("/api/convert/status/conv123")
-        # assert response.status_code == 200 or response.status_code == 404
-        pass
+        response = client.get("/api/convert/status/conv123")
+        assert response.status_code == 404
+
+        file_id = upload(client, "image.png", image_bytes("PNG")).json()["file_id"]
+        conversion_id = client.post("/api/convert", json={
+            "file_id": file_id, "original_filename": "image.png", "file_type": "image", "target_format": "GIF"
+        }).json()["conversion_id"]
+        response = client.get(f"/api/convert/status/{conversion_id}")
+        assert response.status_code == 200
+        assert response.json()["status"] == "queued"
+
+    def test_full_queue_is_refused_with_retry_hint(self, client, api, monkeypatch):
+        """New work is turned away while the queue is full"""
+        file_id = upload(client, "image.png", image_bytes("PNG")).json()["file_id"]
+        monkeypatch.setattr(api, "CONVERSION_QUEUE_SIZE", 0)
+        response = client.post("/api/convert", json={
+            "file_id": file_id, "original_filename": "image.png", "file_type": "image", "target_format": "GIF"
+        })
+        assert response.status_code == 429
+        assert int(response.headers["retry-after"]) >= 1
+
+    def test_cancel_queued_conversion(self, client, api):
+        """A queued job is cancelled at once; its client and priority were recorded"""
+        file_id = upload(client, "image.png", image_bytes("PNG")).json()["file_id"]
+        conversion_id = client.post("/api/convert", headers={"X-Client-Id": "tab-1"}, json={
+            "file_id": file_id, "original_filename": "image.png", "file_type": "image", "target_format": "GIF"
+        }).json()["conversion_id"]
+        job = asyncio.run(api.job_store.get_job(conversion_id))
+        assert job["client_id"] == "tab-1" and job["priority"] == "interactive"
+
+        response = client.delete(f"/api/convert/{conversion_id}")
+        assert response.status_code == 200
+        assert response.json()["status"] == "cancelled"
+        assert client.get(f"/api/convert/status/{conversion_id}").json()["status"] == "cancelled"
+        assert client.delete("/api/convert/conv123").status_code == 404
+
+    def test_cancel_finished_conversion(self, client, api):
+        """A finished job cannot be cancelled"""
+        asyncio.run(api.job_store.create_jobs([{
+            "id": "finished-job", "status": "completed", "progress": 100, "priority": "interactive",
+            "client_id": "tab-1", "created_at": 0, "attempts": 1, "request": None
+        }]))
+        response = client.delete("/api/convert/finished-job")
+        assert response.status_code == 409
+
+class TestBatchConversion:
+    """Batch conversion endpoint tests"""
+
+    def items(self, client, count: int) -> list:
+        return [
+            {"file_id": upload(client, f"{i}.png", image_bytes("PNG")).json()["file_id"],
+             "original_filename": f"{i}.png", "file_type": "image"}
+            for i in range(count)
+        ]
+
+    def test_batch_start_and_status(self, client, api):
+        items = self.items(client, 2)
+        items[1]["target_format"] = "JPEG"
+        items[1]["options"] = {"quality": 70}
+        response = client.post("/api/convert/batch", json={
+            "items": items, "target_format": "WEBP", "options": {"quality": 80, "resize": False}
+        })
+        assert response.status_code == 200
+        data = response.json()
+        assert data["total"] == 2 and len(data["conversion_ids"]) == 2
+
+        jobs = asyncio.run(api.job_store.get_jobs(data["conversion_ids"]))
+        requests = {job["id"]: job["request"] for job in jobs}
+        first, second = (requests[i] for i in data["conversion_ids"])
+        assert first["target_format"] == "WEBP" and first["options"] == {"quality": 80, "resize": False}
+        # Item settings override the batch's
+        assert second["target_format"] == "JPEG" and second["options"] == {"quality": 70, "resize": False}
+        assert all(job["priority"] == "bulk" for job in jobs)
+
+        status = client.get(f"/api/convert/batch/{data['batch_id']}").json()
+        assert status["status"] == "processing"
+        assert status["total"] == 2 and status["queued"] == 2
+        assert [item["conversion_id"] for item in status["items"]] == data["conversion_ids"]
+
+    def test_batch_validation(self, client, api, monkeypatch):
+        assert client.post("/api/convert/batch", json={"items": []}).status_code == 400
+        # No target format for the batch or the item
+        assert client.post("/api/convert/batch", json={"items": self.items(client, 1)}).status_code == 400
+        assert client.post("/api/convert/batch", json={
+            "items": self.items(client, 1), "target_format": "PNG", "priority": "urgent"
+        }).status_code == 400
+        monkeypatch.setattr(api, "MAX_BATCH_SIZE", 1)
+        assert client.post("/api/convert/batch", json={
+            "items": self.items(client, 2), "target_format": "PNG"
+        }).status_code == 400
+
+    def test_unknown_batch(self, client):
+        assert client.get("/api/convert/batch/nonexistent").status_code == 404
+
+class TestResultCacheFailures:
+    """A broken result cache never fails a conversion that succeeded"""
+
+    class BrokenCache:
+        @staticmethod
+        def make_key(*args):
+            return "key"
+
+        def get(self, key):
+            raise OSError("cache unavailable")
+
+        def put(self, key, output_path):
+            raise OSError(18, "Invalid cross-device link")
+
+    @pytest.fixture
+    def broken_cache(self, api, monkeypatch):
+        history = []
+
+        async def run_admitted(job, request, fn, *args, **kwargs):
+            # In-process stand-in for the worker pool
+            kwargs.pop("on_progress", None)
+            return fn(*args, **kwargs)
+
+        async def save_conversion_history(request, output_file_id, *args, **kwargs):
+            history.append((output_file_id, kwargs.get("error")))
+
+        monkeypatch.setattr(api, "result_cache", self.BrokenCache())
+        monkeypatch.setattr(api, "run_admitted", run_admitted)
+        monkeypatch.setattr(api, "save_conversion_history", save_conversion_history)
+        monkeypatch.setattr(api, "run_conversion", lambda *args, job_id=None: api.conversion_service.convert(
+            args[0], Path(args[1]), args[2], args[3]))
+        monkeypatch.setattr(api, "run_fanout", lambda path, targets, job_id=None:
+                            api.conversion_service.convert_image_multi(Path(path), targets))
+        return history
+
+    def convert(self, api, client, **fields):
+        file_id = upload(client, "image.png", image_bytes("PNG")).json()["file_id"]
+        request = api.ConversionRequest(file_id=file_id, original_filename="image.png", file_type="image", **fields)
+        job = {"id": str(uuid.uuid4()), "status": "processing", "progress": 0}
+        asyncio.run(api.perform_conversion(job, request, api.file_handler, api.conversion_service))
+        return job
+
+    def test_single_target(self, api, client, broken_cache):
+        job = self.convert(api, client, target_format="WEBP")
+        assert job["status"] == "completed", job["message"]
+        assert api.conversion_service.get_output_file(job["output_file_id"])
+        assert broken_cache == [(job["output_file_id"], None)]
+
+    def test_fanout(self, api, client, broken_cache):
+        job = self.convert(api, client, targets=[{"format": "WEBP"}, {"format": "PNG", "width": 16}])
+        assert job["status"] == "completed"
+        assert [o["status"] for o in job["outputs"]] == ["completed", "completed"]
+        assert [error for _, error in broken_cache] == [None, None]
 
 class TestDownload:
     """File download endpoint tests"""
-    
-    def test_download_nonexistent_file(self):
+
+    def test_download_nonexistent_file(self, client):
         """Test downloading non-existent file"""
-        # response = client.get("/api/download/nonexistent")
-        # assert response.status_code == 404
-        pass
+        response = client.get("/api/download/nonexistent")
+        assert response.status_code == 404
+
+    def test_download_with_validators(self, client, api):
+        """The whole file comes with a strong ETag; a matching revalidation gets 304"""
+        content = image_bytes("PNG", (40, 30))
+        output_file_id = stored_output(api, content)
+        response = client.get(f"/api/download/{output_file_id}")
+        assert response.status_code == 200
+        assert response.content == content
+        assert response.headers["accept-ranges"] == "bytes"
+        etag = response.headers["etag"]
+        assert etag.startswith('"') and "immutable" in response.headers["cache-control"]
+
+        for headers in ({"If-None-Match": etag}, {"If-None-Match": f'"other", W/{etag}'}, {"If-None-Match": "*"},
+                        {"If-Modified-Since": response.headers["last-modified"]}):
+            revalidated = client.get(f"/api/download/{output_file_id}", headers=headers)
+            assert revalidated.status_code == 304 and revalidated.content == b""
+            assert revalidated.headers["etag"] == etag
+        assert client.get(f"/api/download/{output_file_id}", headers={"If-None-Match": '"other"'}).status_code == 200
+
+    def test_download_range(self, client, api):
+        """A single range comes back as 206 with its Content-Range"""
+        content = bytes(range(256)) * 40
+        output_file_id = stored_output(api, content, ".bmp")
+        response = client.get(f"/api/download/{output_file_id}", headers={"Range": "bytes=100-199"})
+        assert response.status_code == 206
+        assert response.content == content[100:200]
+        assert response.headers["content-range"] == f"bytes 100-199/{len(content)}"
+        assert response.headers["content-length"] == "100"
+
+        response = client.get(f"/api/download/{output_file_id}", headers={"Range": "bytes=-10"})
+        assert response.content == content[-10:]
+
+    def test_download_multiple_ranges(self, client, api):
+        """Several ranges come back as multipart/byteranges"""
+        content = bytes(range(256)) * 40
+        output_file_id = stored_output(api, content, ".bmp")
+        response = client.get(f"/api/download/{output_file_id}", headers={"Range": "bytes=0-9, 500-509"})
+        assert response.status_code == 206
+        media_type, _, boundary = response.headers["content-type"].partition("; boundary=")
+        assert media_type == "multipart/byteranges"
+        assert int(response.headers["content-length"]) == len(response.content)
+
+        parts = response.content.split(f"--{boundary}".encode())
+        assert parts[0] == b"" and parts[-1] == b"--\r\n"
+        bodies = []
+        for part in parts[1:-1]:
+            head, _, body = part.partition(b"\r\n\r\n")
+            assert b"Content-Range: bytes" in head
+            bodies.append(body[:-2])
+        assert bodies == [content[0:10], content[500:510]]
+
+    def test_download_unsatisfiable_range(self, client, api):
+        """A range past the end gets 416 with the file size"""
+        content = image_bytes("PNG", (40, 30))
+        output_file_id = stored_output(api, content)
+        response = client.get(f"/api/download/{output_file_id}", headers={"Range": f"bytes={len(content)}-"})
+        assert response.status_code == 416
+        assert response.headers["content-range"] == f"bytes */{len(content)}"
+
+    def test_download_if_range(self, client, api):
+        """A range applies only while If-Range still names the current version"""
+        content = image_bytes("PNG", (40, 30))
+        output_file_id = stored_output(api, content)
+        etag = client.get(f"/api/download/{output_file_id}").headers["etag"]
+
+        response = client.get(f"/api/download/{output_file_id}", headers={"Range": "bytes=0-9", "If-Range": etag})
+        assert response.status_code == 206 and response.content == content[:10]
+        response = client.get(f"/api/download/{output_file_id}", headers={"Range": "bytes=0-9", "If-Range": '"old"'})
+        assert response.status_code == 200 and response.content == content
+
+class TestZipDownload:
+    """Multi-file ZIP download tests"""
+
+    def test_zip_of_outputs(self, client, api):
+        contents = [image_bytes("PNG", (10, 10)), image_bytes("PNG", (20, 20))]
+        ids = [stored_output(api, content) for content in contents]
+        response = client.post("/api/download/zip", json={"output_file_ids": ids})
+        assert response.status_code == 200
+        assert response.headers["content-type"] == "application/zip"
+        with zipfile.ZipFile(io.BytesIO(response.content)) as archive:
+            assert archive.testzip() is None
+            assert [archive.read(f"{file_id}.png") for file_id in ids] == contents
+
+    def test_zip_of_unknown_output(self, client, api):
+        response = client.post("/api/download/zip", json={
+            "output_file_ids": [stored_output(api, b"x"), "nonexistent"]
+        })
+        assert response.status_code == 404
+        assert client.get("/api/download/batch/nonexistent/zip").status_code == 404
 
 if __name__ == "__main__":
     pytest.main([__file__, "-v"])
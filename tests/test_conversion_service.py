@@ -0,0 +1,228 @@
+"""
+Tests for image and document conversions
+"""
+import pytest
+from PIL import Image
+
+from services.conversion_service import ConversionService
+from services.worker_pool import ConversionCancelledError
+from tests.helpers import image_bytes, pdf_bytes
+
+@pytest.fixture
+def service(tmp_path):
+    return ConversionService(str(tmp_path / "converted"))
+
+def source(tmp_path, fmt: str = "JPEG", size: tuple = (800, 600), name: str = None, **kwargs):
+    path = tmp_path / (name or f"source.{fmt.lower()}")
+    path.write_bytes(image_bytes(fmt, size, **kwargs))
+    return path
+
+def converted_size(result) -> tuple:
+    success, message, output_path = result
+    assert success, message
+    with Image.open(output_path) as img:
+        return img.size
+
+class TestResize:
+    @pytest.mark.parametrize("options, expected", [
+        ({"resize": True, "width": 200, "height": 200, "resize_mode": "exact"}, (200, 200)),
+        ({"resize": True, "width": 200, "height": 200, "resize_mode": "fit"}, (200, 150)),
+        ({"resize": True, "width": 200, "height": 200, "resize_mode": "fill"}, (200, 200)),
+        ({"resize": True, "width": 400}, (400, 300)),
+        ({"max_dimension": 100}, (100, 75)),
+        ({"max_dimension": 5000}, (800, 600)),
+    ])
+    def test_jpeg_is_shrunk_on_load(self, service, tmp_path, options, expected):
+        path = source(tmp_path)
+        assert converted_size(service.convert("image", path, "PNG", options)) == expected
+
+    def test_palette_source(self, service, tmp_path):
+        path = source(tmp_path, "GIF", (300, 300), mode="P", color=3)
+        assert converted_size(service.convert("image", path, "PNG", {"resize": True, "width": 30})) == (30, 30)
+
+    def test_ico_is_capped_at_256(self, service, tmp_path):
+        path = source(tmp_path, "PNG", (1024, 512))
+        assert max(converted_size(service.convert("image", path, "ICO"))) <= 256
+
+    def test_fill_crops_the_center(self, service, tmp_path):
+        img = Image.new("RGB", (300, 100), (255, 0, 0))
+        img.paste((0, 0, 255), (100, 0, 200, 100))
+        path = tmp_path / "bands.png"
+        img.save(path)
+        success, _, output_path = service.convert(
+            "image", path, "PNG", {"resize": True, "width": 50, "height": 50, "resize_mode": "fill"}
+        )
+        with Image.open(output_path) as out:
+            # Only the blue middle third survives the crop
+            assert out.convert("RGB").getpixel((25, 25)) == (0, 0, 255)
+
+class TestFanOut:
+    def test_one_decode_many_outputs(self, service, tmp_path):
+        path = source(tmp_path, "JPEG", (800, 600))
+        results = service.convert_image_multi(path, [
+            {"format": "WEBP", "width": 200},
+            {"format": "PNG", "max_dimension": 100},
+            {"format": "JPEG", "quality": 60},
+            {"format": "ICO"},
+        ])
+        sizes = [converted_size(result) for result in results]
+        assert sizes[:3] == [(200, 150), (100, 75), (800, 600)]
+        assert max(sizes[3]) <= 256
+        formats = []
+        for _, _, output_path in results:
+            with Image.open(output_path) as img:
+                formats.append(img.format)
+        assert formats == ["WEBP", "PNG", "JPEG", "ICO"]
+        assert len({output_path for _, _, output_path in results}) == 4
+
+    def test_a_failing_target_does_not_fail_the_others(self, service, tmp_path):
+        path = source(tmp_path, "PNG", (64, 64), mode="RGBA", color=(0, 0, 0, 0))
+        results = service.convert_image_multi(path, [{"format": "XYZ"}, {"format": "JPEG"}])
+        assert not results[0][0] and results[0][2] is None
+        assert converted_size(results[1]) == (64, 64)
+
+    def test_unreadable_source_fails_every_target(self, service, tmp_path):
+        path = tmp_path / "broken.png"
+        path.write_bytes(b"\x89PNG\r\n\x1a\nnot really")
+        results = service.convert_image_multi(path, [{"format": "JPEG"}, {"format": "WEBP"}])
+        assert len(results) == 2 and not any(success for success, _, _ in results)
+
+@pytest.fixture
+def rasterized(monkeypatch):
+    """Stands in for pdftoppm, recording the page windows it is asked for"""
+    import pdf2image
+    windows = []
+
+    def rasterize(path, dpi, first_page, last_page, thread_count):
+        windows.append((first_page, last_page))
+        return [Image.new("RGB", (85, 110), (page * 20, 0, 0)) for page in range(first_page, last_page + 1)]
+
+    monkeypatch.setattr(pdf2image, "convert_from_path", rasterize)
+    return windows
+
+def pdf(tmp_path, pages: list, **kwargs):
+    path = tmp_path / "source.pdf"
+    path.write_bytes(pdf_bytes(pages, **kwargs))
+    return path
+
+def docx_content(output_path) -> tuple[list, int]:
+    from docx import Document
+    document = Document(str(output_path))
+    return [p.text for p in document.paragraphs if p.text], len(document.inline_shapes)
+
+class TestPdfToDocx:
+    def test_scanned_pages_are_rasterized_in_windows(self, service, tmp_path, rasterized):
+        path = pdf(tmp_path, [None] * 5)
+        events = []
+        success, message, output_path = service.convert(
+            "document", path, "DOCX", {"page_window": 2}, lambda percent, _: events.append(percent)
+        )
+        assert success, message
+        assert rasterized == [(1, 2), (3, 4), (5, 5)]
+        assert events[-1] == 100
+        assert docx_content(output_path) == ([f"Page {n}" for n in range(1, 6)], 5)
+
+    def test_text_pages_skip_rasterization(self, service, tmp_path, rasterized):
+        text = "Born-digital page with a real text layer"
+        path = pdf(tmp_path, [text, None, None, f"{text}\nand a second line"])
+        success, message, output_path = service.convert("document", path, "DOCX", {"page_window": 4})
+        assert success, message
+        # Only the scanned run in the middle is rasterized
+        assert rasterized == [(2, 3)]
+        paragraphs, pictures = docx_content(output_path)
+        assert paragraphs == ["Page 1", text, "Page 2", "Page 3", "Page 4", f"{text}\nand a second line"]
+        assert pictures == 2
+
+    def test_pages_with_images_keep_their_pictures(self, service, tmp_path, rasterized):
+        text = "Text next to a figure, long enough to count"
+        path = pdf(tmp_path, [text, text], image_pages=(1,))
+        assert service.convert("document", path, "DOCX")[0]
+        assert rasterized == [(2, 2)]
+
+    def test_text_layer_can_be_turned_off(self, service, tmp_path, rasterized):
+        path = pdf(tmp_path, ["Born-digital page with a real text layer"] * 2)
+        success, _, output_path = service.convert("document", path, "DOCX", {"text_layer": False})
+        assert success
+        assert rasterized == [(1, 2)]
+        assert docx_content(output_path)[1] == 2
+
+def animated(path, fmt: str = "GIF", frames: int = 4, size: tuple = (32, 24)):
+    images = [Image.new("RGB", size, (i * 50, 255 - i * 50, 0)) for i in range(frames)]
+    images[0].save(path, format=fmt, save_all=True, append_images=images[1:], duration=40, loop=0)
+    return path
+
+def frame_sizes(output_path) -> list:
+    with Image.open(output_path) as img:
+        sizes = []
+        for index in range(getattr(img, "n_frames", 1)):
+            img.seek(index)
+            sizes.append(img.size)
+        return sizes
+
+class TestFrames:
+    @pytest.mark.parametrize("target", ["WEBP", "PNG", "GIF", "TIFF"])
+    def test_animation_keeps_its_frames(self, service, tmp_path, target):
+        path = animated(tmp_path / "anim.gif")
+        success, message, output_path = service.convert("image", path, target, {"resize": True, "width": 16})
+        assert success, message
+        assert frame_sizes(output_path) == [(16, 12)] * 4
+
+    def test_single_frame_target_takes_the_first_frame(self, service, tmp_path):
+        path = animated(tmp_path / "anim.gif")
+        assert frame_sizes(service.convert("image", path, "JPEG")[2]) == [(32, 24)]
+
+    @pytest.mark.parametrize("target", ["WEBP", "PNG", "GIF", "TIFF"])
+    def test_mpo_preview_is_not_a_frame(self, service, tmp_path, target):
+        # Camera JPEGs (MPO) carry a second, smaller image
+        path = tmp_path / "photo.jpg"
+        Image.new("RGB", (64, 48), (10, 20, 30)).save(
+            path, format="MPO", save_all=True, append_images=[Image.new("RGB", (32, 24))]
+        )
+        with Image.open(path) as img:
+            assert img.format == "MPO" and img.n_frames == 2
+        success, message, output_path = service.convert("image", path, target)
+        assert success, message
+        assert frame_sizes(output_path) == [(64, 48)]
+
+    def test_tiff_pages_of_other_sizes(self, service, tmp_path):
+        path = tmp_path / "scan.tiff"
+        pages = [Image.new("RGB", (40, 30), "white"), Image.new("RGB", (10, 8), "gray"), Image.new("RGB", (40, 30), "black")]
+        pages[0].save(path, format="TIFF", save_all=True, append_images=pages[1:])
+
+        # Animations need one canvas: the odd page is left out
+        success, message, output_path = service.convert("image", path, "WEBP")
+        assert success, message
+        assert frame_sizes(output_path) == [(40, 30)] * 2
+        assert message.startswith("2 ")
+        # TIFF keeps every page at its own size
+        assert frame_sizes(service.convert("image", path, "TIFF")[2]) == [(40, 30), (10, 8), (40, 30)]
+
+    def test_large_frames_take_the_strip_path(self, tmp_path):
+        service = ConversionService(str(tmp_path / "converted"), large_image_pixels=500)
+        path = animated(tmp_path / "anim.gif")
+        success, message, output_path = service.convert("image", path, "WEBP")
+        assert success, message
+        assert frame_sizes(output_path) == [(32, 24)]
+
+    def test_kept_frames_must_fit_in_memory(self, tmp_path):
+        service = ConversionService(str(tmp_path / "converted"), memory_limit=32 * 24 * 4 * 3)
+        path = animated(tmp_path / "anim.gif")
+        assert not service.convert("image", path, "WEBP")[0]
+        # TIFF pages go to disk one at a time
+        assert service.convert("image", path, "TIFF")[0]
+        assert not list((tmp_path / "converted").rglob("*.webp"))
+
+    @pytest.mark.parametrize("target", ["WEBP", "TIFF"])
+    def test_cancellation_stops_at_a_frame_and_leaves_no_output(self, service, tmp_path, target):
+        path = animated(tmp_path / "anim.gif", frames=6)
+        reported = []
+
+        def progress(percent, message):
+            reported.append(percent)
+            if len(reported) == 2:
+                raise ConversionCancelledError("cancelled")
+
+        success, _, output_path = service.convert("image", path, target, {}, progress)
+        assert not success and output_path is None
+        assert len(reported) == 2
+        assert not [p for p in (tmp_path / "converted").rglob("*") if p.is_file()]
@@ -0,0 +1,44 @@
+"""
+Tests for the append-only DOCX writer
+"""
+import io
+
+import pytest
+from docx import Document
+from PIL import Image
+
+from services.docx_writer import DocxStreamWriter
+
+def encoded(fmt: str, size: tuple, color) -> bytes:
+    buffer = io.BytesIO()
+    Image.new("RGB", size, color).save(buffer, format=fmt)
+    return buffer.getvalue()
+
+def test_document_opens_with_python_docx(tmp_path):
+    pictures = [encoded("PNG", (200, 100), (255, 0, 0)), encoded("JPEG", (100, 200), (0, 0, 255))]
+    path = tmp_path / "out.docx"
+    with DocxStreamWriter(path) as doc:
+        doc.add_paragraph("Page 1")
+        doc.add_paragraph("Çok satırlı\nmetin & <işaretler>\x0c")
+        doc.add_picture(pictures[0], (200, 100), "PNG", width_inches=6)
+        doc.add_paragraph("Page 2")
+        doc.add_picture(pictures[1], (100, 200), "JPEG", width_inches=6)
+
+    document = Document(str(path))
+    texts = [p.text for p in document.paragraphs if p.text]
+    assert texts == ["Page 1", "Çok satırlı\nmetin & <işaretler>", "Page 2"]
+
+    shapes = document.inline_shapes
+    assert len(shapes) == 2
+    assert shapes[0].width == 6 * 914400 and shapes[0].height == 3 * 914400
+    assert shapes[1].height == 12 * 914400
+    blobs = [part.blob for part in document.part.package.image_parts]
+    assert sorted(blobs) == sorted(pictures)
+
+def test_failure_leaves_no_file(tmp_path):
+    path = tmp_path / "out.docx"
+    with pytest.raises(RuntimeError):
+        with DocxStreamWriter(path) as doc:
+            doc.add_picture(encoded("PNG", (10, 10), (0, 0, 0)), (10, 10), "PNG", width_inches=6)
+            raise RuntimeError("cancelled")
+    assert not path.exists()
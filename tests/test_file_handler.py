@@ -0,0 +1,102 @@
+"""
+Tests for the upload store (FileHandler)
+"""
+import asyncio
+import os
+import time
+
+import pytest
+
+from services.file_handler import FileHandler
+from tests.helpers import image_bytes
+
+class Source:
+    """Async `read(size)` over bytes, counting how much was read"""
+    def __init__(self, data: bytes):
+        self.data = data
+        self.position = 0
+
+    async def read(self, size: int) -> bytes:
+        chunk = self.data[self.position:self.position + size]
+        self.position += len(chunk)
+        return chunk
+
+@pytest.fixture
+def handler(tmp_path):
+    return FileHandler(str(tmp_path / "uploads"), max_file_size=4 * 1024 * 1024)
+
+def save(handler: FileHandler, data: bytes, name: str = "a.png", file_type: str = "image"):
+    return asyncio.run(handler.save_upload_stream(Source(data), name, file_type, chunk_size=256 * 1024))
+
+class TestStreamingUpload:
+    def test_stream_is_stored(self, handler):
+        content = image_bytes("PNG", (30, 20))
+        success, _, file_id, size = save(handler, content)
+        assert success and size == len(content)
+        assert handler.get_file_path(file_id, "image").read_bytes() == content
+
+    def test_limit_stops_reading(self, handler):
+        source = Source(b"\x89PNG\r\n\x1a\n" + b"x" * (handler.max_file_size * 3))
+        success, _, file_id, received = asyncio.run(
+            handler.save_upload_stream(source, "big.png", "image", chunk_size=256 * 1024)
+        )
+        assert not success and file_id is None
+        assert received > handler.max_file_size
+        # Reading stopped at the first chunk past the limit
+        assert source.position <= handler.max_file_size + 256 * 1024
+        # Nothing is left behind
+        assert not [p for p in handler.blob_dir.rglob("*") if p.is_file()]
+
+    def test_bad_extension_reads_nothing(self, handler):
+        source = Source(b"MZ" + b"x" * 100)
+        success, _, _, _ = asyncio.run(handler.save_upload_stream(source, "a.exe", "image"))
+        assert not success
+        assert source.position == 0
+
+    def test_mislabeled_content_is_refused(self, handler):
+        success, message, file_id, _ = save(handler, image_bytes("JPEG"), "a.png")
+        assert not success and file_id is None
+
+class TestDeduplication:
+    def blob(self, handler: FileHandler, file_id: str):
+        return handler._blob_path(handler.get_record(file_id)["sha256"])
+
+    def test_same_content_is_stored_once(self, handler):
+        content = image_bytes("PNG", (30, 20))
+        first, second = save(handler, content)[2], save(handler, content, "b.png")[2]
+        assert first != second
+        blobs = [p for p in handler.blob_dir.rglob("*") if p.is_file()]
+        assert blobs == [self.blob(handler, first)]
+        # The blob plus one hard link per file_id
+        assert blobs[0].stat().st_nlink == 3
+
+    def test_blob_goes_with_its_last_reference(self, handler):
+        content = image_bytes("PNG", (30, 20))
+        first, second = save(handler, content)[2], save(handler, content)[2]
+        blob = self.blob(handler, first)
+
+        assert handler.delete_file(first, "image")
+        assert blob.exists() and blob.stat().st_nlink == 2
+        assert handler.get_file_path(second, "image").read_bytes() == content
+
+        assert handler.delete_file(second, "image")
+        assert not blob.exists()
+        assert not handler.delete_file(second, "image")
+
+    def test_each_reference_keeps_its_own_age(self, tmp_path):
+        handler = FileHandler(str(tmp_path / "uploads"), max_file_size=1024 * 1024, ttl=3600)
+        content = image_bytes("PNG", (30, 20))
+        old = save(handler, content)[2]
+        # Pretend the first upload happened two hours ago (as seen after a restart)
+        record_path = handler._find_record(old)
+        hours_ago = time.time() - 7200
+        os.utime(record_path, (hours_ago, hours_ago))
+        os.utime(self.blob(handler, old), (hours_ago, hours_ago))
+        handler.index.rebuild()
+
+        new = save(handler, content)[2]
+        # A duplicate upload neither keeps the old one alive nor ages the new one
+        assert self.blob(handler, old).stat().st_mtime == pytest.approx(hours_ago)
+        assert handler.delete_expired(10) == 1
+        assert handler.get_file_path(old, "image") is None
+        assert handler.get_file_path(new, "image").read_bytes() == content
@@ -0,0 +1,105 @@
+"""
+Tests for the stored file index
+"""
+import time
+
+from services.conversion_service import ConversionService
+from services.file_handler import FileHandler
+from services.file_index import FileIndex
+from services.sharding import sharded_path
+from tests.helpers import image_bytes
+from tests.test_file_handler import save
+
+def store(root, name: str, data: bytes = b"data"):
+    path = sharded_path(root, name, create=True)
+    path.write_bytes(data)
+    return path
+
+class Locator:
+    """Exact candidate paths for an ID, recording the lookups"""
+    def __init__(self, root):
+        self.root = root
+        self.calls = []
+
+    def __call__(self, file_id: str):
+        self.calls.append(file_id)
+        name = f"{file_id}.png"
+        return [sharded_path(self.root, name), self.root / name]
+
+def test_lookup_and_size(tmp_path):
+    path = store(tmp_path, "abc.png", b"12345")
+    index = FileIndex([tmp_path])
+    assert index.rebuild() == 1
+    entry = index.get("abc")
+    assert entry.path == path and entry.size == 5 and entry.mime_type == "image/png"
+
+def test_deleted_file_is_dropped(tmp_path):
+    path = store(tmp_path, "abc.png")
+    locate = Locator(tmp_path)
+    index = FileIndex([tmp_path], locate=locate)
+    index.add(path)
+    # Another process deleted it
+    path.unlink()
+    assert index.get("abc") is None
+    assert len(index) == 0
+    assert locate.calls == ["abc"]
+
+def test_miss_checks_the_exact_paths(tmp_path):
+    locate = Locator(tmp_path)
+    index = FileIndex([tmp_path], locate=locate)
+    index.rebuild()
+    # Written by another process after the index was built
+    path = store(tmp_path, "abc.png")
+    assert index.get("abc").path == path
+    assert index.get("abc").path == path
+    assert locate.calls == ["abc"]
+    assert index.get("missing") is None
+    # Without a locator a miss is final
+    assert FileIndex([tmp_path]).get("abc") is None
+
+def test_migrated_file_is_found_in_its_shard(tmp_path):
+    flat = tmp_path / "abc.png"
+    flat.write_bytes(b"data")
+    index = FileIndex([tmp_path], locate=Locator(tmp_path))
+    index.rebuild()
+    assert index.get("abc").path == flat
+
+    sharded = sharded_path(tmp_path, "abc.png", create=True)
+    flat.rename(sharded)
+    assert index.get("abc").path == sharded
+
+def test_due_follows_creation_time(tmp_path):
+    index = FileIndex([tmp_path], ttl=60)
+    now = time.time()
+    index.add(store(tmp_path, "new.png"), created=now)
+    index.add(store(tmp_path, "old.png"), created=now - 120)
+    index.add(store(tmp_path, "older.png"), created=now - 180)
+
+    assert [file_id for file_id, _ in index.due(limit=1, now=now)] == ["older"]
+    assert [file_id for file_id, _ in index.due(limit=10, now=now)] == ["old"]
+    assert index.due(limit=10, now=now) == []
+    assert len(index) == 1
+
+def test_uploads_from_another_process(tmp_path):
+    ours = FileHandler(str(tmp_path / "uploads"), max_file_size=1024 * 1024)
+    theirs = FileHandler(str(tmp_path / "uploads"), max_file_size=1024 * 1024)
+    content = image_bytes("PNG", (30, 20))
+    file_id = save(theirs, content, "Photo.PNG")[2]
+
+    # Found from its record, suffix case included
+    assert ours.get_file_path(file_id, "image").read_bytes() == content
+    assert ours.get_file_path(file_id, "document") is None
+
+    assert theirs.delete_file(file_id, "image")
+    assert ours.get_file_path(file_id, "image") is None
+
+def test_outputs_from_another_process(tmp_path):
+    ours = ConversionService(str(tmp_path / "converted"))
+    theirs = ConversionService(str(tmp_path / "converted"))
+    source = tmp_path / "a.png"
+    source.write_bytes(image_bytes("PNG", (30, 20)))
+
+    success, message, output_path = theirs.convert("image", source, "WEBP")
+    assert success, message
+    file_id = output_path.name.split(".")[0]
+    assert ours.get_output_file(file_id) == output_path
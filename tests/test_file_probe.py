@@ -0,0 +1,47 @@
+"""
+Tests for header-only format probing
+"""
+import io
+
+import pytest
+from PIL import Image
+
+from services.file_probe import SNIFF_SIZE, matches_extension, probe_file, sniff_format
+from tests.helpers import image_bytes
+
+@pytest.mark.parametrize("fmt", ["JPEG", "PNG", "GIF", "WEBP", "TIFF", "BMP", "ICO"])
+def test_sniffs_images_from_their_head(fmt):
+    assert sniff_format(image_bytes(fmt)[:SNIFF_SIZE]) == fmt
+
+def test_sniffs_documents():
+    assert sniff_format(b"%PDF-1.7\n") == "PDF"
+    assert sniff_format(b"PK\x03\x04" + b"\x00" * 12) == "DOCX"
+    assert sniff_format(b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1") == "DOC"
+    assert sniff_format(b"MZ\x90\x00") is None
+
+def test_extension_must_match_content():
+    assert matches_extension(image_bytes("JPEG")[:SNIFF_SIZE], "photo.JPG")
+    assert not matches_extension(image_bytes("JPEG")[:SNIFF_SIZE], "photo.png")
+    assert not matches_extension(b"", "photo.png")
+
+def test_probes_dimensions_without_decoding(tmp_path):
+    path = tmp_path / "a.png"
+    path.write_bytes(image_bytes("PNG", (120, 80), mode="RGBA"))
+    metadata = probe_file(path)
+    assert metadata["format"] == "PNG" and metadata["mime_type"] == "image/png"
+    assert (metadata["width"], metadata["height"], metadata["frames"]) == (120, 80, 1)
+    assert metadata["decode_bytes"] == 120 * 80 * 4
+
+def test_counts_gif_frames(tmp_path):
+    frames = [Image.new("RGB", (20, 20), (i * 40, 0, 0)) for i in range(5)]
+    buffer = io.BytesIO()
+    frames[0].save(buffer, format="GIF", save_all=True, append_images=frames[1:], duration=50)
+    path = tmp_path / "anim.gif"
+    path.write_bytes(buffer.getvalue())
+    assert probe_file(path)["frames"] == 5
+
+def test_unknown_content(tmp_path):
+    path = tmp_path / "a.bin"
+    path.write_bytes(b"not a known format")
+    metadata = probe_file(path)
+    assert metadata["format"] is None and metadata["mime_type"] == "application/octet-stream"
@@ -0,0 +1,117 @@
+"""
+Tests for the write-behind conversion history buffer
+"""
+import asyncio
+
+from pymongo.errors import BulkWriteError
+
+from services.history_writer import HistoryWriter
+
+class Collection:
+    """insert_many recorder; fails with the queued errors first"""
+    def __init__(self, errors=()):
+        self.batches: list[list[dict]] = []
+        self.errors = list(errors)
+        self.release = None
+
+    async def insert_many(self, documents, ordered=True):
+        assert not ordered
+        if self.release is not None:
+            await self.release.wait()
+        if self.errors:
+            raise self.errors.pop(0)
+        self.batches.append(list(documents))
+
+def records(count: int) -> list[dict]:
+    return [{"id": str(i)} for i in range(count)]
+
+def test_full_batches_and_the_rest_on_close():
+    collection = Collection()
+
+    async def scenario():
+        writer = HistoryWriter(collection, batch_size=3, flush_seconds=60)
+        for record in records(7):
+            await writer.add(record)
+        await writer.close()
+        return writer
+
+    writer = asyncio.run(scenario())
+    assert [len(batch) for batch in collection.batches] == [3, 3, 1]
+    assert [r["id"] for batch in collection.batches for r in batch] == [str(i) for i in range(7)]
+    assert writer.stats() == {"pending": 0, "written": 7, "failed": 0, "batches": 3}
+
+def test_partial_batch_is_flushed_after_a_while():
+    collection = Collection()
+
+    async def scenario():
+        writer = HistoryWriter(collection, batch_size=100, flush_seconds=0.05)
+        await writer.add({"id": "a"})
+        await asyncio.sleep(0.3)
+        written = writer.written
+        await writer.close()
+        return written
+
+    assert asyncio.run(scenario()) == 1
+    assert collection.batches == [[{"id": "a"}]]
+
+def test_full_buffer_makes_add_wait():
+    collection = Collection()
+
+    async def scenario():
+        collection.release = asyncio.Event()
+        writer = HistoryWriter(collection, batch_size=1, flush_seconds=0, max_pending=2)
+        for record in records(3):
+            # One is being written, two are buffered
+            await writer.add(record)
+        blocked = asyncio.create_task(writer.add({"id": "3"}))
+        await asyncio.sleep(0.05)
+        assert not blocked.done()
+
+        collection.release.set()
+        await asyncio.wait_for(blocked, 5)
+        await writer.close()
+        return writer
+
+    assert asyncio.run(scenario()).written == 4
+
+def test_rejected_documents_are_counted():
+    collection = Collection([BulkWriteError({"writeErrors": [{"index": 1, "code": 11000}]})])
+
+    async def scenario():
+        writer = HistoryWriter(collection, batch_size=3, flush_seconds=60)
+        for record in records(3):
+            await writer.add(record)
+        await writer.close()
+        return writer
+
+    writer = asyncio.run(scenario())
+    assert (writer.written, writer.failed, writer.batches) == (2, 1, 1)
+
+def test_transient_errors_are_retried(monkeypatch):
+    sleep = asyncio.sleep
+    monkeypatch.setattr(asyncio, "sleep", lambda delay: sleep(0))
+    collection = Collection([ConnectionError("down")])
+
+    async def scenario():
+        writer = HistoryWriter(collection, batch_size=2, flush_seconds=60)
+        for record in records(2):
+            await writer.add(record)
+        await writer.close()
+        return writer
+
+    assert asyncio.run(scenario()).written == 2
+    assert len(collection.batches) == 1
+
+def test_batch_is_dropped_after_the_last_attempt():
+    collection = Collection([ConnectionError("down")])
+
+    async def scenario():
+        writer = HistoryWriter(collection, batch_size=2, flush_seconds=60, max_attempts=1)
+        for record in records(2):
+            await writer.add(record)
+        await writer.close()
+        return writer
+
+    writer = asyncio.run(scenario())
+    assert (writer.written, writer.failed, writer.pending) == (0, 2, 0)
+    assert collection.batches == []
@@ -0,0 +1,36 @@
+"""
+Tests for Range parsing and conditional request helpers
+"""
+import pytest
+
+from utils.http_cache import MAX_RANGES, RangeNotSatisfiableError, content_disposition, parse_ranges
+
+@pytest.mark.parametrize("header, expected", [
+    ("bytes=0-9", [(0, 9)]),
+    ("bytes=90-", [(90, 99)]),
+    ("bytes=-10", [(90, 99)]),
+    ("bytes=-500", [(0, 99)]),
+    ("bytes=50-500", [(50, 99)]),
+    # Overlapping and adjacent ranges are merged and sorted
+    ("bytes=20-29, 0-9, 5-14, 30-39", [(0, 14), (20, 39)]),
+    # Ranges past the end are skipped while others are satisfiable
+    ("bytes=0-9, 200-300", [(0, 9)]),
+])
+def test_ranges(header, expected):
+    assert parse_ranges(header, 100) == expected
+
+@pytest.mark.parametrize("header", [
+    None, "", "items=0-9", "bytes=", "bytes=9-0", "bytes=a-b", "bytes=5",
+    "bytes=" + ",".join(f"{i * 10}-{i * 10 + 1}" for i in range(MAX_RANGES + 1)),
+])
+def test_whole_file_is_sent(header):
+    assert parse_ranges(header, 1000) is None
+
+@pytest.mark.parametrize("header", ["bytes=100-", "bytes=200-300", "bytes=-0"])
+def test_unsatisfiable(header):
+    with pytest.raises(RangeNotSatisfiableError):
+        parse_ranges(header, 100)
+
+def test_content_disposition():
+    assert content_disposition("a.png") == 'attachment; filename="a.png"'
+    assert content_disposition("ş.png") == "attachment; filename*=utf-8''%C5%9F.png"
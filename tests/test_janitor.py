@@ -0,0 +1,87 @@
+"""
+Tests for the expiry of stored outputs and uploads
+"""
+import asyncio
+import os
+import time
+
+import pytest
+
+from services.conversion_service import ConversionService
+from tests.helpers import image_bytes
+
+@pytest.fixture
+def service(tmp_path):
+    return ConversionService(str(tmp_path / "converted"), output_ttl=3600)
+
+def output(service: ConversionService, age: float = 0, name: str = None):
+    """A registered output written `age` seconds ago"""
+    path = service._output_path(name or f"{len(service.index)}-{time.monotonic_ns()}.png")
+    path.write_bytes(image_bytes("PNG", (8, 8)))
+    service.index.add(path, time.time() - age)
+    return path
+
+def test_only_outputs_past_the_ttl_go(service):
+    old, new = output(service, 7200), output(service)
+    assert service.delete_expired(10) == 1
+    assert not old.exists() and new.exists()
+    assert service.delete_expired(10) == 0
+
+def test_expiry_is_batched(service):
+    paths = [output(service, 7200 + i) for i in range(5)]
+    assert service.delete_expired(2) == 2
+    # Oldest first
+    assert [p.exists() for p in paths] == [True, True, True, False, False]
+    assert service.delete_expired(10) == 3
+
+def test_linked_output_keeps_its_own_age(service, tmp_path):
+    # A cache hit links an old artifact under a new output id
+    artifact = tmp_path / "artifact.png"
+    artifact.write_bytes(image_bytes("PNG", (8, 8)))
+    hours_ago = time.time() - 7200
+    os.utime(artifact, (hours_ago, hours_ago))
+    linked = service.link_output(artifact)
+    service.register_output(linked)
+
+    # Also after a restart, when ages come from disk
+    service.index.rebuild()
+    assert service.delete_expired(10) == 0
+    assert linked.exists()
+
+    marker = service._created_marker(linked)
+    os.utime(marker, (hours_ago, hours_ago))
+    service.index.rebuild()
+    assert service.delete_expired(10) == 1
+    assert not linked.exists() and not marker.exists()
+    assert artifact.exists()
+
+def test_output_deleted_elsewhere_is_skipped(service):
+    path = output(service, 7200)
+    path.unlink()
+    assert service.delete_expired(10) == 0
+    assert len(service.index) == 0
+
+def test_janitor_drains_in_batches(api, monkeypatch, service, tmp_path):
+    from services.file_handler import FileHandler
+
+    paths = [output(service, 7200) for _ in range(5)]
+    uploads = FileHandler(str(tmp_path / "uploads"), max_file_size=1024 * 1024, ttl=3600)
+    monkeypatch.setattr(api, "conversion_service", service)
+    monkeypatch.setattr(api, "file_handler", uploads)
+    monkeypatch.setattr(api, "FILE_EXPIRY_BATCH", 2)
+    calls = []
+    delete_expired = service.delete_expired
+    monkeypatch.setattr(service, "delete_expired", lambda limit: calls.append(limit) or delete_expired(limit))
+
+    async def scenario():
+        janitor = asyncio.create_task(api.expire_files_periodically())
+        deadline = time.monotonic() + 5
+        while any(p.exists() for p in paths):
+            assert time.monotonic() < deadline
+            await asyncio.sleep(0.01)
+        janitor.cancel()
+        await asyncio.gather(janitor, return_exceptions=True)
+
+    asyncio.run(scenario())
+    # Three rounds: 2 + 2 + 1, the short one ending the pass
+    assert calls == [2, 2, 2]
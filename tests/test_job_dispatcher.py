@@ -0,0 +1,106 @@
+"""
+Tests for the job dispatcher: slot sharing between priorities and cancellation
+"""
+import asyncio
+import time
+
+import pytest
+
+from services.job_dispatcher import JobDispatcher
+from services.job_store import CANCELLED_MESSAGE, MemoryJobStore
+
+def job(job_id: str, priority: str = "interactive", client_id: str = "client-a") -> dict:
+    return {"id": job_id, "status": "queued", "progress": 0, "priority": priority,
+            "client_id": client_id, "created_at": time.time(), "attempts": 0, "request": {}}
+
+async def wait_for(condition, timeout: float = 5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        await asyncio.sleep(0.01)
+
+class Handler:
+    """Job handler that runs until released, recording what it started"""
+    def __init__(self):
+        self.started: list[str] = []
+        self.release = asyncio.Event()
+
+    async def __call__(self, job: dict):
+        self.started.append(job["id"])
+        await self.release.wait()
+        job.update(status="completed", progress=100)
+
+def test_bulk_backlog_leaves_slots_for_interactive_jobs():
+    async def scenario():
+        store, handler = MemoryJobStore(), Handler()
+        await store.create_jobs([job(f"bulk-{i}", "bulk") for i in range(5)])
+        dispatcher = JobDispatcher(store, handler, concurrency=3, bulk_slots=2, poll_seconds=0.01)
+        dispatcher.start()
+        try:
+            await wait_for(lambda: len(handler.started) == 2)
+            await asyncio.sleep(0.05)
+            # The third slot stays free for interactive work
+            assert len(handler.started) == 2
+
+            await store.create_jobs([job("quick", client_id="client-b")])
+            dispatcher.notify()
+            await wait_for(lambda: "quick" in handler.started)
+            assert len(handler.started) == 3
+
+            handler.release.set()
+            await wait_for(lambda: len(handler.started) == 6)
+        finally:
+            await dispatcher.stop()
+
+    asyncio.run(scenario())
+
+@pytest.mark.parametrize("flagged_in_store", [False, True])
+def test_running_job_is_cancelled(flagged_in_store):
+    async def scenario():
+        store, handler = MemoryJobStore(), Handler()
+        finished = []
+        await store.create_jobs([job("a")])
+        dispatcher = JobDispatcher(
+            store, handler, concurrency=1, heartbeat_seconds=0.02, poll_seconds=0.01,
+            on_finish=lambda job, recorded: finished.append((job["status"], recorded))
+        )
+        dispatcher.start()
+        try:
+            await wait_for(lambda: handler.started == ["a"])
+            assert (await store.cancel_job("a"))["cancel_requested"]
+            if not flagged_in_store:
+                # The API process runs the job itself and stops it at once
+                assert dispatcher.cancel("a")
+            # Otherwise the next heartbeat sees the flag
+            await wait_for(lambda: finished)
+        finally:
+            await dispatcher.stop()
+
+        assert finished == [("cancelled", True)]
+        stored = await store.get_job("a")
+        assert stored["status"] == "cancelled" and stored["message"] == CANCELLED_MESSAGE
+        assert stored["worker_id"] is None
+        assert not dispatcher.cancel("a")
+
+    asyncio.run(scenario())
+
+def test_failing_handler_fails_the_job():
+    async def handler(job):
+        raise RuntimeError("boom")
+
+    async def scenario():
+        store, finished = MemoryJobStore(), []
+        await store.create_jobs([job("a")])
+        dispatcher = JobDispatcher(
+            store, handler, concurrency=1, poll_seconds=0.01,
+            on_finish=lambda job, recorded: finished.append(recorded)
+        )
+        dispatcher.start()
+        try:
+            await wait_for(lambda: finished)
+        finally:
+            await dispatcher.stop()
+        return await store.get_job("a")
+
+    failed = asyncio.run(scenario())
+    assert failed["status"] == "failed" and "boom" in failed["message"]
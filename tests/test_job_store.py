@@ -0,0 +1,148 @@
+"""
+Tests for the job store backends (memory, SQLite and MongoDB)
+"""
+import asyncio
+import time
+
+import pytest
+
+from services.job_store import JobStore, MemoryJobStore, MongoJobStore, SQLiteJobStore
+
+@pytest.fixture(params=["memory", "sqlite", "mongo"])
+def store(request, tmp_path):
+    if request.param == "memory":
+        store = MemoryJobStore()
+    elif request.param == "sqlite":
+        store = SQLiteJobStore(str(tmp_path / "jobs.db"))
+    else:
+        mongomock_motor = pytest.importorskip("mongomock_motor")
+        store = MongoJobStore(mongomock_motor.AsyncMongoMockClient()["ryloze_test"])
+    yield store
+    store.close()
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+def job(job_id: str, client_id: str = "client-a", priority: str = "interactive", created_at: float = None, **fields) -> dict:
+    return {
+        "id": job_id,
+        "status": "queued",
+        "progress": 0,
+        "priority": priority,
+        "client_id": client_id,
+        "created_at": created_at if created_at is not None else time.time(),
+        "attempts": 0,
+        "request": {"file_id": f"file-{job_id}"},
+        **fields
+    }
+
+def test_interface_is_abstract():
+    with pytest.raises(TypeError):
+        JobStore()
+
+def test_create_and_read(store):
+    run(store.create_jobs([job("a", created_at=1), job("b", created_at=2), job("c", client_id="client-b", created_at=3)]))
+    assert run(store.get_job("a"))["request"] == {"file_id": "file-a"}
+    assert run(store.get_job("missing")) is None
+    assert [j["id"] for j in run(store.get_jobs(["c", "missing", "a"]))] == ["c", "a"]
+    assert [j["id"] for j in run(store.get_client_jobs("client-a", created_after=1))] == ["b"]
+    assert run(store.count_queued()) == 3
+    assert run(store.count_queued("bulk")) == 0
+
+def test_claims_interactive_first_and_fairly(store):
+    run(store.create_jobs([
+        job("bulk", priority="bulk", created_at=0),
+        job("a1", client_id="a", created_at=1),
+        job("a2", client_id="a", created_at=2),
+        job("b1", client_id="b", created_at=3),
+    ]))
+    first = run(store.claim_job("worker-1"))
+    assert first["id"] == "a1" and first["status"] == "processing" and first["attempts"] == 1
+    # Client b has nothing running yet, so it goes before a's second job
+    assert run(store.claim_job("worker-1"))["id"] == "b1"
+    assert run(store.claim_job("worker-1"))["id"] == "a2"
+    assert run(store.claim_job("worker-1", priorities=("interactive",))) is None
+    assert run(store.claim_job("worker-1"))["id"] == "bulk"
+    assert run(store.claim_job("worker-1")) is None
+
+def test_updates_respect_the_lease(store):
+    run(store.create_jobs([job("a")]))
+    run(store.claim_job("worker-1"))
+    assert not run(store.update_job("a", {"progress": 50}, worker_id="worker-2"))
+    assert run(store.heartbeat("a", "worker-1", {"progress": 50}))
+    assert run(store.get_job("a"))["progress"] == 50
+
+    assert run(store.update_job("a", {"status": "completed", "output_file_id": "out"}))
+    finished = run(store.get_job("a"))
+    # Finishing stamps the time and drops the request
+    assert finished["finished_at"] and finished["request"] is None
+
+def test_cancel(store):
+    run(store.create_jobs([job("queued", created_at=1), job("running", created_at=0)]))
+    run(store.claim_job("worker-1"))
+    cancelled = run(store.cancel_job("queued"))
+    assert cancelled["status"] == "cancelled" and cancelled["finished_at"]
+    flagged = run(store.cancel_job("running"))
+    assert flagged["status"] == "processing" and flagged["cancel_requested"]
+    assert run(store.cancel_job("missing")) is None
+
+def test_stalled_jobs_are_requeued_then_failed(store):
+    run(store.create_jobs([job("a", created_at=1), job("b", created_at=2), job("c", created_at=3)]))
+    for _ in range(3):
+        run(store.claim_job("worker-1"))
+    run(store.cancel_job("c"))
+    run(store.update_job("b", {"attempts": 3}))
+    time.sleep(0.05)
+
+    assert run(store.requeue_stalled(lease_seconds=0.01, max_attempts=3)) == 3
+    jobs = {j["id"]: j for j in run(store.get_jobs(["a", "b", "c"]))}
+    assert jobs["a"]["status"] == "queued" and jobs["a"]["worker_id"] is None
+    assert jobs["b"]["status"] == "failed"
+    assert jobs["c"]["status"] == "cancelled"
+    # The requeued job is claimed again with its attempt counted
+    assert run(store.claim_job("worker-2"))["attempts"] == 2
+
+def test_batches(store):
+    run(store.create_batch("batch", ["a", "b"]))
+    batch = run(store.get_batch("batch"))
+    assert batch["batch_id"] == "batch" and batch["conversion_ids"] == ["a", "b"]
+    assert run(store.get_batch("missing")) is None
+
+def finish(store, job_id: str, finished_at: float = None):
+    fields = {"status": "completed", "progress": 100}
+    if finished_at is not None:
+        fields["finished_at"] = finished_at
+    assert run(store.update_job(job_id, fields))
+
+class TestExpiry:
+    def test_jobs_past_the_ttl_go(self, store):
+        run(store.create_jobs([job("old"), job("new"), job("queued")]))
+        finish(store, "old", time.time() - 100)
+        finish(store, "new")
+        expired = run(store.expire_jobs(ttl_seconds=50, max_jobs=100))
+        assert [j["id"] for j in expired] == ["old"]
+        assert [j["id"] for j in run(store.get_jobs(["old", "new", "queued"]))] == ["new", "queued"]
+
+    def test_oldest_finished_jobs_go_past_max_jobs(self, store):
+        now = time.time()
+        run(store.create_jobs([job(f"done-{i}") for i in range(3)] + [job("queued")]))
+        for i in range(3):
+            finish(store, f"done-{i}", now - 30 + i)
+        expired = run(store.expire_jobs(ttl_seconds=3600, max_jobs=2))
+        assert [j["id"] for j in expired] == ["done-0", "done-1"]
+        assert run(store.count_queued()) == 1
+
+    def test_batch_goes_with_its_last_job(self, store):
+        run(store.create_jobs([job("a", batch_id="batch"), job("b", batch_id="batch")]))
+        run(store.create_batch("batch", ["a", "b"]))
+        time.sleep(0.3)
+        finish(store, "a", time.time() - 100)
+        finish(store, "b")
+
+        # b finished within the TTL, so its batch stays readable
+        assert [j["id"] for j in run(store.expire_jobs(ttl_seconds=0.2, max_jobs=100))] == ["a"]
+        assert run(store.get_batch("batch")) is not None
+
+        time.sleep(0.3)
+        assert [j["id"] for j in run(store.expire_jobs(ttl_seconds=0.2, max_jobs=100))] == ["b"]
+        assert run(store.get_batch("batch")) is None
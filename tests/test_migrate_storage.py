@@ -0,0 +1,100 @@
+"""
+Tests for moving stored files from the flat layout into shards
+"""
+import json
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+from migrate_storage import migrate_directory
+from services.conversion_service import ConversionService
+from services.file_handler import FileHandler
+from services.sharding import sharded_path
+from tests.helpers import image_bytes
+
+def flat_upload(handler: FileHandler, file_id: str, content: bytes):
+    """An upload as written before the sharded layout"""
+    (handler.upload_dir / "image").mkdir(exist_ok=True)
+    (handler.upload_dir / "image" / f"{file_id}.png").write_bytes(content)
+    (handler.meta_dir / f"{file_id}.json").write_text(json.dumps({
+        "file_id": file_id, "filename": "a.png", "file_type": "image", "size": len(content)
+    }))
+
+def test_flat_files_move_into_their_shards(tmp_path):
+    root = tmp_path / "converted"
+    root.mkdir()
+    for name in ("one.png", "two.pdf"):
+        (root / name).write_bytes(name.encode())
+    already = sharded_path(root, "three.png", create=True)
+    already.write_bytes(b"three")
+
+    assert migrate_directory(root, dry_run=True) == 2
+    assert (root / "one.png").exists()
+
+    assert migrate_directory(root) == 2
+    for name in ("one.png", "two.pdf"):
+        assert not (root / name).exists()
+        assert sharded_path(root, name).read_bytes() == name.encode()
+    assert already.read_bytes() == b"three"
+    # A second run has nothing left to do
+    assert migrate_directory(root) == 0
+    assert migrate_directory(tmp_path / "missing") == 0
+
+def test_uploads_stay_readable_across_the_move(tmp_path):
+    handler = FileHandler(str(tmp_path / "uploads"), max_file_size=1024 * 1024)
+    content = image_bytes("PNG", (30, 20))
+    flat_upload(handler, "legacy", content)
+    handler.index.rebuild()
+    assert handler.get_file_path("legacy", "image") == handler.upload_dir / "image" / "legacy.png"
+
+    # Moved while the API is serving
+    assert migrate_directory(handler.upload_dir / "image") == 1
+    assert migrate_directory(handler.meta_dir) == 1
+    path = handler.get_file_path("legacy", "image")
+    assert path == sharded_path(handler.upload_dir / "image", "legacy.png")
+    assert path.read_bytes() == content
+    assert handler.get_record("legacy")["size"] == len(content)
+
+def test_outputs_stay_readable_across_the_move(tmp_path):
+    service = ConversionService(str(tmp_path / "converted"))
+    flat = service.output_dir / "legacy.webp"
+    flat.write_bytes(b"webp")
+    # Found on a miss before the migration too
+    assert service.get_output_file("legacy") == flat
+
+    assert migrate_directory(service.output_dir) == 1
+    assert service.get_output_file("legacy") == sharded_path(service.output_dir, "legacy.webp")
+    assert not os.path.exists(flat)
+
+def test_linked_outputs_keep_their_age(tmp_path):
+    service = ConversionService(str(tmp_path / "converted"), output_ttl=3600)
+    cached = tmp_path / "cache.webp"
+    cached.write_bytes(b"webp")
+    hours_ago = time.time() - 7200
+    os.utime(cached, (hours_ago, hours_ago))
+    # A linked output as written before the sharded layout: the file shares the cache
+    # entry's mtime, and its own creation time is in the marker
+    flat = service.output_dir / "legacy.webp"
+    os.link(cached, flat)
+    (service.output_dir / ".legacy.webp.created").touch()
+
+    assert migrate_directory(service.output_dir) == 1
+    moved = sharded_path(service.output_dir, "legacy.webp")
+    assert sorted(p.name for p in moved.parent.iterdir()) == [".legacy.webp.created", "legacy.webp"]
+    assert not list(service.output_dir.glob(".legacy*"))
+    service.index.rebuild()
+    assert service.index.due(10) == []
+
+def test_runs_without_the_api(tmp_path):
+    # Importing server would connect to Mongo and start the job store, cache and worker pool
+    backend = Path(__file__).parent.parent / "backend"
+    env = {**os.environ, "UPLOAD_DIR": str(tmp_path / "uploads"), "CONVERTED_DIR": str(tmp_path / "converted")}
+    (tmp_path / "converted").mkdir()
+    (tmp_path / "converted" / "legacy.webp").write_bytes(b"webp")
+    subprocess.run(
+        [sys.executable, "-c", "import sys, migrate_storage; migrate_storage.main(); assert 'server' not in sys.modules"],
+        cwd=backend, env=env, check=True, capture_output=True
+    )
+    assert sharded_path(tmp_path / "converted", "legacy.webp").exists()
@@ -0,0 +1,83 @@
+"""
+Tests for the streaming multipart/form-data reader
+"""
+import asyncio
+
+import pytest
+
+from utils.multipart_stream import MultipartError, MultipartFileStream
+
+BOUNDARY = "b0undary"
+CONTENT_TYPE = f"multipart/form-data; boundary={BOUNDARY}"
+
+def form(*parts: tuple) -> bytes:
+    """Body with (name, filename or None, data) parts"""
+    body = b""
+    for name, filename, data in parts:
+        disposition = f'form-data; name="{name}"' + (f'; filename="{filename}"' if filename else "")
+        body += f"--{BOUNDARY}\r\nContent-Disposition: {disposition}\r\n".encode()
+        if filename:
+            body += b"Content-Type: image/png\r\n"
+        body += b"\r\n" + data + b"\r\n"
+    return body + f"--{BOUNDARY}--\r\n".encode()
+
+class Body:
+    """Request body delivered in fixed pieces, counting what was pulled"""
+    def __init__(self, data: bytes, piece: int):
+        self.pieces = [data[i:i + piece] for i in range(0, len(data), piece)]
+        self.pulled = 0
+
+    async def __aiter__(self):
+        for piece in self.pieces:
+            self.pulled += 1
+            yield piece
+
+def read_all(stream: MultipartFileStream, size: int) -> bytes:
+    async def run():
+        await stream.open()
+        data = b""
+        while chunk := await stream.read(size):
+            assert len(chunk) <= size
+            data += chunk
+        return data
+    return asyncio.run(run())
+
+@pytest.mark.parametrize("piece", [1, 7, 4096, 1 << 20])
+def test_file_part_read_whatever_the_network_pieces(piece):
+    payload = bytes(range(256)) * 300
+    stream = MultipartFileStream(
+        Body(form(("note", None, b"hello"), ("file", "resim.png", payload)), piece).__aiter__(), CONTENT_TYPE
+    )
+    assert read_all(stream, 1000) == payload
+    assert stream.filename == "resim.png"
+    assert stream.content_type == "image/png"
+
+def test_body_is_pulled_only_as_fast_as_it_is_read():
+    body = Body(form(("file", "a.png", b"x" * 100_000)), 1000)
+    stream = MultipartFileStream(body.__aiter__(), CONTENT_TYPE)
+
+    async def run():
+        await stream.open()
+        await stream.read(5000)
+    asyncio.run(run())
+    assert body.pulled < 10
+
+def test_utf8_filename():
+    stream = MultipartFileStream(Body(form(("file", "ğüş.png", b"data")), 64).__aiter__(), CONTENT_TYPE)
+    read_all(stream, 10)
+    assert stream.filename == "ğüş.png"
+
+def test_missing_file_field():
+    stream = MultipartFileStream(Body(form(("note", None, b"x")), 64).__aiter__(), CONTENT_TYPE)
+    with pytest.raises(MultipartError):
+        asyncio.run(stream.open())
+
+def test_not_multipart():
+    with pytest.raises(MultipartError):
+        MultipartFileStream(Body(b"{}", 64).__aiter__(), "application/json")
+
+def test_truncated_body():
+    body = form(("file", "a.png", b"x" * 5000))[:2000]
+    stream = MultipartFileStream(Body(body, 512).__aiter__(), CONTENT_TYPE)
+    with pytest.raises(MultipartError):
+        read_all(stream, 1024)
@@ -0,0 +1,140 @@
+"""
+Tests for progress events: the in-process bus and the SSE streams
+"""
+import asyncio
+import json
+import time
+
+import pytest
+
+from services.job_store import MemoryJobStore
+from services.progress_bus import ProgressBus, Subscription
+
+def job(job_id: str, status: str = "queued", progress: int = 0, **fields) -> dict:
+    return {"id": job_id, "status": status, "progress": progress, "message": None,
+            "client_id": "client-a", "created_at": time.time(), **fields}
+
+class TestBus:
+    def test_only_latest_event_per_job_is_kept(self):
+        bus = ProgressBus()
+        subscription = bus.subscribe(job_ids={"a"})
+        for progress in (10, 20, 30):
+            bus.publish(job("a", "processing", progress))
+        bus.publish(job("b", "processing", 50))
+
+        events = asyncio.run(subscription.get(0))
+        assert [(e["conversion_id"], e["progress"]) for e in events] == [("a", 30)]
+        assert asyncio.run(subscription.get(0)) == []
+
+    def test_scopes(self):
+        assert Subscription(batch_id="x").matches(job("a", batch_id="x"))
+        assert not Subscription(batch_id="x").matches(job("a", batch_id="y"))
+        assert Subscription(client_id="client-a").matches(job("a"))
+        assert not Subscription(job_ids={"b"}).matches(job("a"))
+
+    def test_get_waits_for_a_push(self):
+        async def scenario():
+            subscription = Subscription(job_ids={"a"})
+            asyncio.get_running_loop().call_later(0.01, subscription.push, {"conversion_id": "a"})
+            return await subscription.get(5)
+
+        assert asyncio.run(scenario()) == [{"conversion_id": "a"}]
+
+    def test_unsubscribed_streams_get_nothing(self):
+        bus = ProgressBus()
+        subscription = bus.subscribe(job_ids={"a"})
+        bus.unsubscribe(subscription)
+        bus.publish(job("a", "processing", 10))
+        assert bus.subscribers == 0
+        assert asyncio.run(subscription.get(0)) == []
+
+class Connected:
+    """A request whose client never disconnects"""
+    async def is_disconnected(self) -> bool:
+        return False
+
+def parse(chunks: list[str]) -> list[tuple[str, dict]]:
+    events = []
+    for chunk in chunks:
+        if chunk.startswith("event: "):
+            name, data = chunk.split("\n")[:2]
+            events.append((name[len("event: "):], json.loads(data[len("data: "):])))
+    return events
+
+@pytest.fixture
+def stream(api, monkeypatch):
+    """stream_progress over a fresh store and bus; yields (store, bus)"""
+    store, bus = MemoryJobStore(), ProgressBus()
+    monkeypatch.setattr(api, "job_store", store)
+    monkeypatch.setattr(api, "progress_bus", bus)
+    monkeypatch.setattr(api, "PROGRESS_POLL_SECONDS", 0.02)
+    return store, bus
+
+def collect(api, bus: ProgressBus, jobs: list[dict], during) -> list[tuple[str, dict]]:
+    """Run a job stream to its end while `during(job_store, bus)` makes progress"""
+    async def scenario():
+        subscription = bus.subscribe(job_ids={j["id"] for j in jobs})
+        chunks = []
+
+        async def read():
+            async for chunk in api.stream_progress(Connected(), subscription, jobs):
+                chunks.append(chunk)
+
+        reader = asyncio.create_task(read())
+        await asyncio.sleep(0.01)
+        await during(api.job_store, bus)
+        await asyncio.wait_for(reader, 5)
+        return parse(chunks)
+
+    return asyncio.run(scenario())
+
+def test_local_progress_is_pushed(api, stream):
+    store, bus = stream
+    queued = job("a")
+    asyncio.run(store.create_jobs([queued]))
+
+    async def run_job(store, bus):
+        bus.local_jobs.add("a")
+        for progress in (40, 80):
+            bus.publish(job("a", "processing", progress))
+            await asyncio.sleep(0.01)
+        bus.publish(job("a", "completed", 100, output_file_id="out"))
+
+    events = collect(api, bus, [queued], run_job)
+    assert [(e["status"], e["progress"]) for _, e in events[:-1]] == [
+        ("queued", 0), ("processing", 40), ("processing", 80), ("completed", 100)
+    ]
+    assert events[-2][1]["output_file_id"] == "out"
+    assert events[-1] == ("end", {"finished": 1})
+    assert bus.subscribers == 0
+
+def test_jobs_run_elsewhere_are_polled(api, stream):
+    store, bus = stream
+    queued = job("a")
+    asyncio.run(store.create_jobs([queued]))
+
+    async def run_job(store, bus):
+        # Another process only updates the store
+        await store.update_job("a", {"status": "completed", "progress": 100})
+
+    events = collect(api, bus, [queued], run_job)
+    assert [(name, e.get("status")) for name, e in events] == [
+        ("progress", "queued"), ("progress", "completed"), ("end", None)
+    ]
+
+def test_stream_endpoint(api, client, stream):
+    store, _ = stream
+    asyncio.run(store.create_jobs([job("done", "completed", 100, output_file_id="out")]))
+
+    response = client.get("/api/convert/status/done/events")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = parse(response.text.split("\n\n"))
+    assert events == [
+        ("progress", {"conversion_id": "done", "batch_id": None, "status": "completed", "progress": 100,
+                      "message": None, "output_file_id": "out", "outputs": None}),
+        ("end", {"finished": 1}),
+    ]
+
+    assert client.get("/api/convert/status/missing/events").status_code == 404
+    assert client.get("/api/convert/events").status_code == 400
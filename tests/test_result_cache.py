@@ -0,0 +1,139 @@
+"""
+Tests for the conversion result cache
+"""
+import errno
+import os
+import time
+
+import pytest
+
+from services.conversion_service import ConversionService
+from services.result_cache import ResultCache
+
+def output(tmp_path, name: str, size: int):
+    path = tmp_path / "out" / name
+    path.parent.mkdir(exist_ok=True)
+    path.write_bytes(b"x" * size)
+    return path
+
+@pytest.fixture
+def cache(tmp_path):
+    return ResultCache(str(tmp_path / "cache"), max_bytes=250)
+
+def test_hit_and_miss(cache, tmp_path):
+    key = cache.make_key("digest", "webp")
+    assert cache.get(key) is None
+    cached = cache.put(key, output(tmp_path, "a.webp", 100))
+    assert cache.get(key) == cached and cached.read_bytes() == b"x" * 100
+    stats = cache.stats()
+    assert (stats["entries"], stats["bytes"], stats["hits"], stats["misses"]) == (1, 100, 1, 1)
+    assert stats["hit_rate"] == 0.5
+
+def test_least_recently_used_is_evicted(cache, tmp_path):
+    keys = [cache.make_key(f"d{i}", "PNG") for i in range(3)]
+    cache.put(keys[0], output(tmp_path, "0.png", 100))
+    cache.put(keys[1], output(tmp_path, "1.png", 100))
+    assert cache.get(keys[0])
+    cache.put(keys[2], output(tmp_path, "2.png", 100))
+
+    assert cache.get(keys[1]) is None
+    assert cache.get(keys[0]) and cache.get(keys[2])
+    assert cache.stats()["evictions"] == 1 and cache.stats()["bytes"] == 200
+
+def test_hits_leave_the_file_alone(cache, tmp_path):
+    key = cache.make_key("digest", "PNG")
+    cached = cache.put(key, output(tmp_path, "a.png", 10))
+    os.utime(cached, (1000, 1000))
+    assert cache.get(key)
+    # Cached files are hard links of outputs; their mtime is not the cache's to change
+    assert cached.stat().st_mtime == 1000
+
+def test_processes_share_recency_and_counters(tmp_path):
+    first = ResultCache(str(tmp_path / "cache"), max_bytes=250)
+    second = ResultCache(str(tmp_path / "cache"), max_bytes=250)
+    keys = [first.make_key(f"d{i}", "PNG") for i in range(3)]
+    first.put(keys[0], output(tmp_path, "0.png", 100))
+    first.put(keys[1], output(tmp_path, "1.png", 100))
+    # A hit seen by another process counts for eviction here
+    assert second.get(keys[0])
+    first.put(keys[2], output(tmp_path, "2.png", 100))
+
+    assert second.get(keys[1]) is None
+    assert first.stats() == second.stats()
+    assert first.stats()["hits"] == 1
+
+def test_vanished_entries_are_dropped(cache, tmp_path):
+    key = cache.make_key("digest", "PNG")
+    cache.put(key, output(tmp_path, "a.png", 100)).unlink()
+    assert cache.get(key) is None
+    assert cache.stats()["bytes"] == 0 and cache.stats()["entries"] == 0
+
+def test_entries_from_before_the_index_are_loaded(tmp_path):
+    key = ResultCache.make_key("digest", "PNG")
+    legacy = tmp_path / "cache" / key[:2] / f"{key}.png"
+    legacy.parent.mkdir(parents=True)
+    legacy.write_bytes(b"x" * 10)
+    cache = ResultCache(str(tmp_path / "cache"), max_bytes=250)
+    assert cache.get(key) == legacy
+    assert cache.stats()["bytes"] == 10
+
+def test_linked_outputs_age_on_their_own(cache, tmp_path):
+    service = ConversionService(str(tmp_path / "converted"), output_ttl=3600)
+    source = output(tmp_path, "a.png", 10)
+    cached = cache.put(cache.make_key("digest", "PNG"), source)
+    hours_ago = time.time() - 7200
+    os.utime(cached, (hours_ago, hours_ago))
+
+    linked = service.link_output(cached)
+    service.index.rebuild()
+    # The cache entry is old; the output made from it just now is not
+    assert service.index.due(10) == []
+    assert service.delete_output(linked.name.split(".")[0])
+    assert not list(linked.parent.iterdir())
+
+@pytest.fixture
+def cross_device(monkeypatch):
+    """Hard links between stores fail as between filesystems (EXDEV); links within a directory work"""
+    link = os.link
+
+    def cross_device_link(source, target):
+        if os.path.dirname(source) != os.path.dirname(target):
+            raise OSError(errno.EXDEV, os.strerror(errno.EXDEV))
+        link(source, target)
+    monkeypatch.setattr(os, "link", cross_device_link)
+
+def test_cache_on_another_filesystem_holds_copies(tmp_path, cross_device):
+    cache = ResultCache(str(tmp_path / "cache"), max_bytes=1000)
+    service = ConversionService(str(tmp_path / "converted"))
+    source = output(tmp_path, "a.png", 10)
+    key = cache.make_key("digest", "PNG")
+
+    cached = cache.put(key, source)
+    assert cached.read_bytes() == source.read_bytes()
+    assert cached.stat().st_ino != source.stat().st_ino
+    assert cache.get(key) == cached
+    assert cache.put(key, source) == cached
+
+    linked = service.link_output(cached)
+    assert linked.read_bytes() == source.read_bytes()
+    # No temporary copies are left behind
+    assert [p.name for p in cached.parent.iterdir()] == [cached.name]
+    assert [p.name for p in linked.parent.iterdir() if not p.name.startswith(".")] == [linked.name]
+
+class TestKeys:
+    def test_defaults_match_the_converters(self):
+        key = ResultCache.make_key
+        assert key("d", "WEBP", {}) == key("d", "webp", {"quality": 90, "resize": False})
+        # PDF -> DOCX encodes pages at quality 85 unless told otherwise
+        assert key("d", "DOCX", {}) == key("d", "DOCX", {"quality": 85, "dpi": 200, "text_layer": True})
+        assert key("d", "DOCX", {}) != key("d", "DOCX", {"quality": 90})
+
+    def test_options_without_effect_are_ignored(self):
+        key = ResultCache.make_key
+        assert key("d", "PNG", {"width": 100}) == key("d", "PNG", {})
+        assert key("d", "PNG", {"resize": True, "width": 100}) != key("d", "PNG", {})
+        assert key("d", "DOCX", {"page_window": 16}) == key("d", "DOCX", {})
+
+    def test_source_and_format_are_part_of_the_key(self):
+        key = ResultCache.make_key
+        assert len({key("a", "PNG"), key("b", "PNG"), key("a", "JPEG")}) == 3
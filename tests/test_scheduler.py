@@ -0,0 +1,90 @@
+"""
+Tests for memory-aware admission control
+"""
+import asyncio
+
+from services.scheduler import BASE_JOB_BYTES, AdmissionScheduler
+from services.tiled_image import STRIP_BYTES
+
+MB = 1024 * 1024
+
+class TestEstimate:
+    def test_image_scales_with_outputs_and_frames(self):
+        scheduler = AdmissionScheduler(1024 * MB, 4)
+        metadata = {"width": 1000, "height": 1000, "decode_bytes": 3 * MB, "frames": 1}
+        assert scheduler.estimate(metadata, "image") == BASE_JOB_BYTES + 6 * MB
+        assert scheduler.estimate(metadata, "image", outputs=3) == BASE_JOB_BYTES + 12 * MB
+        assert scheduler.estimate({**metadata, "frames": 10}, "image") == BASE_JOB_BYTES + 33 * MB
+
+    def test_large_image_is_bounded_by_strips(self):
+        scheduler = AdmissionScheduler(1024 * MB, 4, large_image_pixels=10_000_000, image_memory_limit=256 * MB)
+        metadata = {"width": 40_000, "height": 40_000, "decode_bytes": 4_800_000_000}
+        assert scheduler.estimate(metadata, "image") == BASE_JOB_BYTES + 2 * STRIP_BYTES + 256 * MB
+
+    def test_pdf_counts_two_windows_at_the_requested_dpi(self):
+        scheduler = AdmissionScheduler(1024 * MB, 4)
+        metadata = {"pages": 100, "decode_bytes": 10 * MB}
+        assert scheduler.estimate(metadata, "document") == BASE_JOB_BYTES + 10 * MB * 4 * 2
+        assert scheduler.estimate(metadata, "document", {"dpi": 100, "page_window": 1}) == BASE_JOB_BYTES + 5 * MB
+
+    def test_unknown_metadata(self):
+        assert AdmissionScheduler(MB, 1).estimate(None, "image") == BASE_JOB_BYTES
+
+async def admitted(scheduler, tickets):
+    await asyncio.sleep(0)
+    return [scheduler.is_admitted(ticket) for ticket in tickets]
+
+def test_jobs_wait_for_memory():
+    async def run():
+        scheduler = AdmissionScheduler(memory_budget=100, max_running=10)
+        first, second, third = (scheduler.enqueue(60) for _ in range(3))
+        assert await admitted(scheduler, [first, second, third]) == [True, False, False]
+        scheduler.release(first)
+        assert await admitted(scheduler, [second, third]) == [True, False]
+        assert scheduler.stats()["reserved_bytes"] == 60
+    asyncio.run(run())
+
+def test_oversized_job_runs_alone():
+    async def run():
+        scheduler = AdmissionScheduler(memory_budget=100, max_running=10)
+        big = scheduler.enqueue(500)
+        small = scheduler.enqueue(10)
+        # Strict order: the small job does not overtake or join the big one
+        assert await admitted(scheduler, [big, small]) == [True, False]
+        scheduler.release(big)
+        assert await admitted(scheduler, [small]) == [True]
+    asyncio.run(run())
+
+def test_interactive_jobs_go_first():
+    async def run():
+        scheduler = AdmissionScheduler(memory_budget=100, max_running=1)
+        running = scheduler.enqueue(10)
+        bulk = scheduler.enqueue(10, priority=1)
+        interactive = scheduler.enqueue(10, priority=0)
+        scheduler.release(running)
+        assert await admitted(scheduler, [interactive, bulk]) == [True, False]
+    asyncio.run(run())
+
+def test_waiting_ticket_can_give_up():
+    async def run():
+        scheduler = AdmissionScheduler(memory_budget=100, max_running=1)
+        running = scheduler.enqueue(10)
+        waiting = scheduler.enqueue(10)
+        scheduler.enqueue(10)
+        # A waiting ticket that gives up leaves the queue
+        scheduler.release(waiting)
+        assert scheduler.stats()["waiting"] == 1
+        assert waiting.future.cancelled() and not scheduler.is_admitted(waiting)
+        scheduler.release(running)
+        assert scheduler.stats()["waiting"] == 0
+        assert scheduler.retry_after(backlog=3) >= 1
+    asyncio.run(run())
+
+def test_slot_holds_the_reservation():
+    async def run():
+        scheduler = AdmissionScheduler(memory_budget=100, max_running=2)
+        ticket = scheduler.enqueue(40)
+        async with scheduler.slot(ticket):
+            assert scheduler.stats()["reserved_bytes"] == 40
+        assert scheduler.stats()["reserved_bytes"] == 0 and scheduler.stats()["running"] == 0
+    asyncio.run(run())
@@ -0,0 +1,193 @@
+"""
+Tests for the storage backends, with S3 mocked by moto
+"""
+import time
+
+import pytest
+
+from services.conversion_service import ConversionService
+from services.file_handler import FileHandler
+from services.sharding import sharded_path
+from services.storage import LocalStorage, StorageBackend, create_storage
+from tests.helpers import image_bytes
+from tests.test_file_handler import save
+
+BUCKET = "ryloze-test"
+
+@pytest.fixture
+def s3(monkeypatch):
+    moto = pytest.importorskip("moto")
+    import boto3
+
+    for name, value in (("AWS_ACCESS_KEY_ID", "test"), ("AWS_SECRET_ACCESS_KEY", "test"),
+                        ("AWS_DEFAULT_REGION", "us-east-1")):
+        monkeypatch.setenv(name, value)
+    with moto.mock_aws():
+        client = boto3.client("s3", region_name="us-east-1")
+        client.create_bucket(Bucket=BUCKET)
+        yield client
+
+def keys(s3, prefix: str = "") -> list[str]:
+    return sorted(item["Key"] for item in s3.list_objects_v2(Bucket=BUCKET, Prefix=prefix).get("Contents", []))
+
+def storage(root, prefix: str):
+    return create_storage("s3", root, prefix, BUCKET, region="us-east-1")
+
+def test_interface_is_abstract(tmp_path):
+    with pytest.raises(TypeError):
+        StorageBackend(tmp_path)
+    assert isinstance(create_storage("local", tmp_path), LocalStorage)
+    with pytest.raises(ValueError):
+        create_storage("s3", tmp_path)
+
+def test_mirror_round_trip(s3, tmp_path):
+    ours, theirs = storage(tmp_path / "a", "outputs/"), storage(tmp_path / "b", "outputs/")
+    path = sharded_path(tmp_path / "a", "file.png", create=True)
+    path.write_bytes(b"content")
+    ours.upload(path)
+    key = ours.key(path)
+    assert keys(s3) == [key] and key.startswith("outputs/")
+
+    copy = sharded_path(tmp_path / "b", "file.png")
+    assert theirs.find("file") == copy
+    assert theirs.download(copy)
+    assert copy.read_bytes() == b"content"
+    # The copy is as old as the stored object, not the fetch
+    stored = s3.head_object(Bucket=BUCKET, Key=key)["LastModified"].timestamp()
+    assert copy.stat().st_mtime == pytest.approx(stored)
+    assert key in theirs.presigned_url(copy, 60)
+
+    ours.delete(path)
+    assert keys(s3) == []
+    assert not theirs.download(sharded_path(tmp_path / "b", "gone.png"))
+    assert theirs.find("gone") is None
+
+def shared_file(tmp_path):
+    blob = tmp_path / "blobs" / "ab" / "abcdef"
+    blob.parent.mkdir(parents=True)
+    blob.write_bytes(b"shared")
+    return blob
+
+def test_orphaned_shared_file_goes_after_its_grace_period(s3, tmp_path):
+    backend = storage(tmp_path, "")
+    blob = shared_file(tmp_path)
+
+    backend.add_reference(blob, "one")
+    backend.add_reference(blob, "two")
+    assert keys(s3) == ["blobs/ab/abcdef", "blobs/ab/abcdef.refs/one", "blobs/ab/abcdef.refs/two"]
+
+    backend.remove_reference(blob, "one")
+    backend.remove_reference(blob, "two")
+    assert keys(s3) == ["blobs/ab/abcdef"]
+    assert backend.delete_orphans(tmp_path / "blobs", grace=3600) == 0
+    assert backend.delete_orphans(tmp_path / "blobs", grace=0) == 1
+    assert keys(s3) == []
+
+def test_reference_added_as_the_last_one_goes(s3, tmp_path, monkeypatch):
+    remover, adder = storage(tmp_path / "a", ""), storage(tmp_path / "b", "")
+    blob = shared_file(tmp_path / "a")
+    remover.add_reference(blob, "one")
+
+    # Once the remover has dropped its reference, another process (without a local copy,
+    # so it cannot upload one) adds a reference and finds the file
+    delete_object = remover._client.delete_object
+
+    def delete_then_add(**kwargs):
+        response = delete_object(**kwargs)
+        adder.add_reference(tmp_path / "b" / "blobs" / "ab" / "abcdef", "two")
+        return response
+    monkeypatch.setattr(remover._client, "delete_object", delete_then_add)
+    remover.remove_reference(blob, "one")
+
+    assert keys(s3) == ["blobs/ab/abcdef", "blobs/ab/abcdef.refs/two"]
+    assert remover.delete_orphans(tmp_path / "a" / "blobs", grace=0) == 0
+    fetched = tmp_path / "b" / "blobs" / "ab" / "abcdef"
+    assert adder.download(fetched) and fetched.read_bytes() == b"shared"
+
+def test_reference_added_while_an_orphan_is_deleted(s3, tmp_path, monkeypatch):
+    janitor, adder = storage(tmp_path / "a", ""), storage(tmp_path / "b", "")
+    blob = shared_file(tmp_path / "a")
+    janitor.add_reference(blob, "one")
+    janitor.remove_reference(blob, "one")
+
+    # Another process adds a reference after the janitor's first check and finds the file still
+    # there; it has no local copy, so it could not have uploaded one itself
+    copy_object = janitor._client.copy_object
+
+    def add_then_copy(**kwargs):
+        if kwargs["Key"].endswith(".deleting"):
+            adder.add_reference(tmp_path / "b" / "blobs" / "ab" / "abcdef", "two")
+        return copy_object(**kwargs)
+    monkeypatch.setattr(janitor._client, "copy_object", add_then_copy)
+
+    assert janitor.delete_orphans(tmp_path / "a" / "blobs", grace=0) == 0
+    assert keys(s3) == ["blobs/ab/abcdef", "blobs/ab/abcdef.refs/two"]
+    fetched = tmp_path / "b" / "blobs" / "ab" / "abcdef"
+    assert adder.download(fetched) and fetched.read_bytes() == b"shared"
+
+class TestUploadsAcrossMachines:
+    @pytest.fixture
+    def machines(self, s3, tmp_path):
+        def machine(name):
+            root = tmp_path / name
+            return FileHandler(str(root), max_file_size=1024 * 1024, storage=storage(root, "uploads/"))
+        return machine("a"), machine("b")
+
+    def test_duplicates_are_stored_once(self, s3, machines):
+        ours, theirs = machines
+        content = image_bytes("PNG", (30, 20))
+        file_ids = [save(ours, content)[2], save(ours, content, "b.png")[2]]
+        for file_id in file_ids:
+            assert ours.publish(file_id)[0]
+
+        blobs = [key for key in keys(s3, "uploads/blobs/") if ".refs/" not in key]
+        assert len(blobs) == 1
+        assert len(keys(s3, "uploads/meta/")) == 2
+        # Nothing is stored per file_id besides its record and reference marker
+        assert not keys(s3, "uploads/image/")
+
+        # Another machine rebuilds both references from the one blob
+        paths = [theirs.get_file_path(file_id, "image") for file_id in file_ids]
+        assert [p.read_bytes() for p in paths] == [content, content]
+        assert paths[0].stat().st_ino == paths[1].stat().st_ino
+        assert theirs.get_record(file_ids[0])["sha256"] == blobs[0].rsplit("/", 1)[1]
+
+    def test_orphaned_blob_is_swept(self, s3, machines):
+        ours, theirs = machines
+        content = image_bytes("PNG", (30, 20))
+        first, second = save(ours, content)[2], save(ours, content)[2]
+        ours.publish(first)
+        ours.publish(second)
+
+        assert theirs.delete_file(first, "image")
+        assert theirs.get_file_path(second, "image").read_bytes() == content
+        assert ours.delete_file(second, "image")
+        assert keys(s3) == [key for key in keys(s3, "uploads/blobs/") if ".refs/" not in key]
+        assert theirs.delete_orphaned_blobs(grace=0) == 1
+        assert keys(s3) == []
+
+    def test_fetched_upload_keeps_its_age(self, s3, machines):
+        ours, theirs = machines
+        file_id = save(ours, image_bytes("PNG", (30, 20)))[2]
+        ours.publish(file_id)
+        time.sleep(0.05)
+        stored = s3.head_object(Bucket=BUCKET, Key=ours.storage.key(ours._record_path(file_id)))["LastModified"]
+        theirs.get_file_path(file_id, "image")
+        assert theirs.index.get(file_id).created == pytest.approx(stored.timestamp())
+
+def test_outputs_across_machines(s3, tmp_path):
+    ours = ConversionService(str(tmp_path / "a"), storage=storage(tmp_path / "a", "outputs/"))
+    theirs = ConversionService(str(tmp_path / "b"), storage=storage(tmp_path / "b", "outputs/"))
+    source = tmp_path / "source.png"
+    source.write_bytes(image_bytes("PNG", (30, 20)))
+
+    success, message, output_path = ours.convert("image", source, "WEBP")
+    assert success, message
+    assert ours.register_output(output_path)[0]
+    file_id = output_path.name.split(".")[0]
+
+    copy = theirs.get_output_file(file_id)
+    assert copy.read_bytes() == output_path.read_bytes()
+    assert theirs.presigned_url(file_id, 60)
+    assert theirs.delete_output(file_id)
+    assert keys(s3) == []
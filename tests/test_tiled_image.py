@@ -0,0 +1,95 @@
+"""
+Tests for strip-based reading/writing and the large-image conversion path
+"""
+import os
+
+import pytest
+from PIL import Image, ImageChops
+
+import services.conversion_service as conversion_module
+from services.conversion_service import ConversionService
+from services.tiled_image import PngStripWriter, StripReader, TiffStripWriter
+
+def noise(size: tuple, mode: str = "RGB") -> Image.Image:
+    return Image.frombytes(mode, size, os.urandom(size[0] * size[1] * len(mode)))
+
+def max_difference(a: Image.Image, b: Image.Image) -> int:
+    return max(high for _, high in ImageChops.difference(a.convert("RGB"), b.convert("RGB")).getextrema())
+
+@pytest.mark.parametrize("fmt, mode", [("BMP", "RGB"), ("TIFF", "RGB"), ("TIFF", "RGBA"), ("TIFF", "L")])
+def test_reader_bands_match_the_image(tmp_path, fmt, mode):
+    img = noise((123, 77), mode)
+    path = tmp_path / f"source.{fmt.lower()}"
+    img.save(path, format=fmt)
+    with Image.open(path) as opened:
+        reader = StripReader.open(opened)
+        assert reader is not None
+        try:
+            for top, bottom in ((0, 10), (10, 50), (70, 77), (0, 77)):
+                assert reader.read(top, bottom).tobytes() == img.crop((0, top, 123, bottom)).tobytes()
+        finally:
+            reader.close()
+
+def test_compressed_sources_have_no_reader(tmp_path):
+    path = tmp_path / "source.png"
+    noise((20, 20)).save(path)
+    with Image.open(path) as opened:
+        assert StripReader.open(opened) is None
+
+@pytest.mark.parametrize("writer_cls, mode", [
+    (PngStripWriter, "RGB"), (PngStripWriter, "RGBA"), (TiffStripWriter, "RGB"), (TiffStripWriter, "L"),
+])
+def test_writers_round_trip(tmp_path, writer_cls, mode):
+    img = noise((64, 50), mode)
+    path = tmp_path / "out"
+    writer = writer_cls(path, img.size, mode)
+    for top in range(0, 50, 16):
+        writer.write(img.crop((0, top, 64, min(top + 16, 50))))
+    writer.close()
+    with Image.open(path) as written:
+        assert written.mode == mode and written.tobytes() == img.tobytes()
+
+class TestLargeImageConversion:
+    @pytest.fixture
+    def service(self, tmp_path, monkeypatch):
+        # Small bands and thresholds so a test-sized image takes the strip path
+        monkeypatch.setattr(conversion_module, "STRIP_BYTES", 300 * 4 * 16)
+        return ConversionService(str(tmp_path / "converted"), large_image_pixels=10_000, memory_limit=100_000)
+
+    @pytest.fixture
+    def source(self, tmp_path):
+        img = noise((300, 200))
+        path = tmp_path / "big.bmp"
+        img.save(path)
+        return img, path
+
+    @pytest.mark.parametrize("target", ["PNG", "TIFF"])
+    def test_output_written_in_bands(self, service, source, target):
+        img, path = source
+        success, message, output_path = service.convert("image", path, target)
+        assert success and "parça" in message
+        with Image.open(output_path) as out:
+            assert out.convert("RGB").tobytes() == img.tobytes()
+
+    def test_resized_bands_match_a_whole_resize(self, service, source):
+        img, path = source
+        success, _, output_path = service.convert("image", path, "PNG", {"resize": True, "width": 150})
+        assert success
+        expected = img.resize((150, 100), Image.Resampling.LANCZOS)
+        with Image.open(output_path) as out:
+            assert out.size == (150, 100)
+            # Band seams may differ by rounding only
+            assert max_difference(out, expected) <= 2
+
+    def test_small_output_is_encoded_whole(self, service, source):
+        img, path = source
+        success, _, output_path = service.convert("image", path, "JPEG", {"resize": True, "width": 60})
+        assert success
+        with Image.open(output_path) as out:
+            assert out.format == "JPEG" and out.size == (60, 40)
+
+    def test_output_without_a_strip_writer_is_refused(self, service, source):
+        _, path = source
+        success, message, output_path = service.convert("image", path, "WEBP")
+        assert not success and output_path is None
+        assert "PNG/TIFF" in message
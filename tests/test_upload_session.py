@@ -0,0 +1,108 @@
+"""
+Tests for resumable chunked upload sessions
+"""
+import asyncio
+
+import pytest
+
+from services.file_handler import FileHandler
+from services.upload_session import MIN_CHUNK_SIZE, UploadSessionManager
+from tests.helpers import image_bytes
+
+CHUNK = MIN_CHUNK_SIZE
+
+async def pieces(data: bytes, size: int = 64 * 1024):
+    for start in range(0, len(data), size):
+        yield data[start:start + size]
+
+def write(manager: UploadSessionManager, session_id: str, index: int, data: bytes, piece: int = 64 * 1024):
+    return asyncio.run(manager.write_chunk(session_id, index, pieces(data, piece)))
+
+def complete(manager: UploadSessionManager, session_id: str):
+    return asyncio.run(manager.complete_session(session_id))
+
+@pytest.fixture
+def content() -> bytes:
+    # Uncompressed, so it spans a few chunks
+    return image_bytes("BMP", (640, 480))
+
+@pytest.fixture
+def manager(tmp_path):
+    handler = FileHandler(str(tmp_path / "uploads"), max_file_size=64 * 1024 * 1024)
+    return UploadSessionManager(str(tmp_path / "sessions"), handler, handler.max_file_size)
+
+def create(manager: UploadSessionManager, content: bytes) -> dict:
+    success, _, session = manager.create_session("scan.bmp", "image", len(content), CHUNK)
+    assert success
+    return session
+
+def chunk(content: bytes, index: int) -> bytes:
+    return content[index * CHUNK:(index + 1) * CHUNK]
+
+def test_chunks_in_any_order_and_resume(manager, content, tmp_path):
+    session = create(manager, content)
+    assert session["total_chunks"] == 4
+
+    for index in (3, 1):
+        assert write(manager, session["session_id"], index, chunk(content, index))[0]
+
+    # A client coming back (even to another process) learns what is missing
+    resumed = UploadSessionManager(str(tmp_path / "sessions"), manager.file_handler, manager.max_file_size)
+    state = resumed.get_session(session["session_id"])
+    assert state["received_chunks"] == [1, 3]
+    assert not state["complete"]
+
+    success, message, file_id, _ = complete(resumed, session["session_id"])
+    assert not success and file_id is None
+
+    for index in (0, 2):
+        assert write(resumed, session["session_id"], index, chunk(content, index))[0]
+    success, _, file_id, _ = complete(resumed, session["session_id"])
+    assert success
+    assert manager.file_handler.get_file_path(file_id, "image").read_bytes() == content
+    # The session is gone once it became an upload
+    assert resumed.get_session(session["session_id"]) is None
+
+def test_rewriting_a_chunk_is_idempotent(manager, content):
+    session = create(manager, content)
+    for index in range(session["total_chunks"]):
+        assert write(manager, session["session_id"], index, chunk(content, index))[0]
+    assert write(manager, session["session_id"], 2, chunk(content, 2))[0]
+    success, _, file_id, _ = complete(manager, session["session_id"])
+    assert success
+    assert manager.file_handler.get_file_path(file_id, "image").read_bytes() == content
+
+def test_wrong_chunk_size_is_not_marked(manager, content):
+    session = create(manager, content)
+    assert not write(manager, session["session_id"], 1, chunk(content, 1)[:-1])[0]
+    assert not write(manager, session["session_id"], 1, chunk(content, 1) + b"x")[0]
+    assert not write(manager, session["session_id"], 9, b"x")[0]
+    assert manager.get_session(session["session_id"])["received_chunks"] == []
+
+def test_session_limits(manager):
+    assert not manager.create_session("a.exe", "image", 10, CHUNK)[0]
+    assert not manager.create_session("a.bmp", "image", 0, CHUNK)[0]
+    assert not manager.create_session("a.bmp", "image", manager.max_file_size + 1, CHUNK)[0]
+    assert not manager.create_session("a.bmp", "image", 10, 1024)[0]
+
+def test_abort(manager, content):
+    session = create(manager, content)
+    assert manager.abort_session(session["session_id"])
+    assert manager.get_session(session["session_id"]) is None
+    assert not manager.abort_session(session["session_id"])
+
+def test_first_chunk_is_sniffed_across_small_reads(manager):
+    # Network reads can be shorter than the bytes needed to recognise a format
+    content = image_bytes("WEBP")
+    success, _, session = manager.create_session("photo.webp", "image", len(content), CHUNK)
+    assert success
+    assert write(manager, session["session_id"], 0, content, piece=8)[0]
+    success, _, file_id, _ = complete(manager, session["session_id"])
+    assert success
+    assert manager.file_handler.get_file_path(file_id, "image").read_bytes() == content
+
+def test_mislabeled_first_chunk_is_refused_across_small_reads(manager, content):
+    success, _, session = manager.create_session("scan.png", "image", len(content), CHUNK)
+    assert success
+    assert not write(manager, session["session_id"], 0, chunk(content, 0), piece=4)[0]
+    assert manager.get_session(session["session_id"])["received_chunks"] == []
@@ -0,0 +1,122 @@
+"""
+Tests for the conversion process pool
+"""
+import asyncio
+import io
+import os
+import time
+from pathlib import Path
+
+import pytest
+from PIL import Image
+
+from services.worker_pool import (
+    ConversionTimeoutError,
+    ConversionWorkerPool,
+    PoolQueueFullError,
+    WorkerCrashedError,
+    run_conversion,
+)
+from tests.helpers import image_bytes
+
+def sleep_job(seconds: float, job_id: str) -> str:
+    # Never reports progress, so it cannot notice a cancellation
+    time.sleep(seconds)
+    return job_id
+
+def animated_gif(path: Path, frames: int = 4) -> Path:
+    images = [Image.new("RGB", (32, 32), (i * 50, 0, 0)) for i in range(frames)]
+    buffer = io.BytesIO()
+    images[0].save(buffer, format="GIF", save_all=True, append_images=images[1:], duration=40)
+    path.write_bytes(buffer.getvalue())
+    return path
+
+@pytest.fixture
+def pool(tmp_path):
+    pool = ConversionWorkerPool(str(tmp_path / "converted"), max_workers=1, job_timeout=30)
+    yield pool
+    pool.shutdown()
+
+def test_converts_in_a_worker_process(pool, tmp_path):
+    source = tmp_path / "a.png"
+    source.write_bytes(image_bytes("PNG", (40, 30)))
+
+    async def run():
+        await pool.start()
+        return await pool.submit(run_conversion, "image", str(source), "WEBP", {})
+
+    success, _, output_path = asyncio.run(run())
+    assert success
+    with Image.open(output_path) as img:
+        assert img.format == "WEBP" and img.size == (40, 30)
+    assert pool.pending == 0
+
+def test_progress_reaches_the_event_loop(pool, tmp_path):
+    source = animated_gif(tmp_path / "anim.gif")
+    events = []
+
+    async def run():
+        await pool.start()
+        result = await pool.submit(
+            run_conversion, "image", str(source), "WEBP", {},
+            job_id="job-2", on_progress=lambda percent, message: events.append(percent)
+        )
+        # Progress is pumped by a thread; give the last callbacks a moment to land
+        for _ in range(50):
+            if events and events[-1] == 100:
+                break
+            await asyncio.sleep(0.02)
+        return result
+
+    assert asyncio.run(run())[0]
+    assert events[-1] == 100 and events == sorted(events)
+
+def test_crashed_worker_is_replaced(pool):
+    async def run():
+        await pool.start()
+        with pytest.raises(WorkerCrashedError):
+            await pool.submit(os._exit, 1, retries=0)
+        # The next job gets a fresh pool
+        return await pool.submit(os.getpid)
+
+    assert asyncio.run(run()) != os.getpid()
+
+def test_timeout_frees_the_worker(tmp_path):
+    pool = ConversionWorkerPool(str(tmp_path / "converted"), max_workers=1, job_timeout=0.5)
+
+    async def run():
+        await pool.start()
+        started = time.monotonic()
+        with pytest.raises(ConversionTimeoutError):
+            await pool.submit(time.sleep, 30)
+        assert time.monotonic() - started < 10
+        return await pool.submit(os.getpid)
+
+    try:
+        assert asyncio.run(run())
+    finally:
+        pool.shutdown()
+
+def test_full_queue_is_refused(tmp_path):
+    pool = ConversionWorkerPool(str(tmp_path / "converted"), max_queue=0)
+    with pytest.raises(PoolQueueFullError):
+        asyncio.run(pool.submit(os.getpid))
+
+def test_cancelled_caller_waits_for_the_worker(pool):
+    async def run():
+        await pool.start()
+        job = asyncio.create_task(pool.submit(sleep_job, 1, job_id="job-3"))
+        await asyncio.sleep(0.2)
+        started = time.monotonic()
+        job.cancel()
+        # Cancelling again does not cut the wait short either
+        await asyncio.sleep(0.2)
+        job.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await job
+        # The caller's slot is held until the worker is free again
+        assert time.monotonic() - started > 0.5
+        assert pool.pending == 0
+        return await pool.submit(os.getpid)
+
+    assert asyncio.run(run())
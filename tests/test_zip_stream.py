@@ -0,0 +1,37 @@
+"""
+Tests for the streaming ZIP builder
+"""
+import io
+import os
+import zipfile
+
+from services.zip_stream import iter_zip, unique_names
+
+def test_archive_is_valid_and_streamed(tmp_path):
+    files = {
+        "photo.png": os.urandom(300 * 1024),
+        "scan.tiff": b"tiff rows " * 50_000,
+        "empty.bmp": b"",
+    }
+    entries = []
+    for name, content in files.items():
+        path = tmp_path / name
+        path.write_bytes(content)
+        entries.append((path, f"out/{name}"))
+
+    chunks = list(iter_zip(entries, chunk_size=64 * 1024))
+    # Produced piece by piece, not as one buffer at the end
+    assert len(chunks) > 5
+    assert max(len(chunk) for chunk in chunks) < 200 * 1024
+
+    with zipfile.ZipFile(io.BytesIO(b"".join(chunks))) as archive:
+        assert archive.testzip() is None
+        assert archive.namelist() == [f"out/{name}" for name in files]
+        for name, content in files.items():
+            assert archive.read(f"out/{name}") == content
+        # Already compressed formats are stored, the rest deflated
+        assert archive.getinfo("out/photo.png").compress_type == zipfile.ZIP_STORED
+        assert archive.getinfo("out/scan.tiff").compress_type == zipfile.ZIP_DEFLATED
+
+def test_names_are_made_unique():
+    assert unique_names(["a.png", "a.png", "b.png", "a.png"]) == ["a.png", "a (1).png", "b.png", "a (2).png"]